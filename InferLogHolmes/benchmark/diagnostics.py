@@ -0,0 +1,47 @@
+import torch
+from typing import Dict, List
+
+def _autocovariance(x: torch.Tensor) -> torch.Tensor:
+    # biased autocovariance of each row, computed with FFT
+    n = x.shape[-1]
+    x = x - x.mean(dim=-1, keepdim=True)
+    f = torch.fft.rfft(x, n=2*n)
+    return torch.fft.irfft(f * f.conj(), n=2*n)[..., :n] / n
+
+def effective_sample_size(draws: torch.Tensor) -> float:
+    # multi chain ESS with Geyer's initial monotone sequence estimator (as in Stan), draws has shape (n_chains, n_draws)
+    draws = draws.double()
+    m, n = draws.shape
+    if n < 4:
+        return float("nan")
+    acov = _autocovariance(draws)
+    W = (acov[:, 0] * n / (n - 1)).mean()
+    var_plus = W * (n - 1) / n
+    if m > 1:
+        var_plus += draws.mean(dim=1).var()
+    if not (var_plus > 0):
+        return float("nan")
+    rho = 1 - (W - acov.mean(dim=0)) / var_plus
+    rho[0] = 1.
+
+    tau = -1.
+    P_prev = float("inf")
+    for k in range(0, n - 1, 2):
+        P = (rho[k] + rho[k+1]).item()
+        if P <= 0:
+            break
+        P = min(P, P_prev)
+        tau += 2 * P
+        P_prev = P
+    return m * n / max(tau, 1. / torch.log10(torch.tensor(float(m * n))).item())
+
+def ess_per_address(chains: List[List[Dict[str, torch.Tensor]]]) -> Dict[str, float]:
+    # chains: list of traces (address -> value) per chain, addresses missing in any iteration are skipped
+    addresses = set(chains[0][0].keys())
+    for chain in chains:
+        for trace in chain:
+            addresses &= trace.keys()
+    return {
+        address: effective_sample_size(torch.stack([torch.stack([trace[address] for trace in chain]) for chain in chains]))
+        for address in sorted(addresses)
+    }
@@ -0,0 +1,79 @@
+import math
+import torch
+import torch.distributions as dist
+from ppl import sample
+
+# ppl versions of the study task models (test/Tasks) and synthetic stress models.
+# HMC in ppl indexes scalar sites, so vector valued random variables are written as one site per element.
+
+### taskA: linear regression
+
+LINREG_X = torch.tensor([-1., -0.5, 0.0, 0.5, 1.0])
+LINREG_Y = torch.tensor([-3.2, -1.8, -0.5, -0.2, 1.5])
+
+def linear_regression(x: torch.Tensor, y: torch.Tensor):
+    slope = sample("slope", dist.Normal(0., 3.))
+    intercept = sample("intercept", dist.Normal(0., 3.))
+    sigma = sample("sigma", dist.InverseGamma(1., 1.))
+    sample("y", dist.Normal(slope * x + intercept, sigma), observed=y)
+
+### taskB: Heit-Rotello signal detection model (first k=8 rows of heit_rotello_std_i.csv)
+
+ROTELLO_H = torch.tensor([3., 4., 4., 4., 4., 4., 4., 4.]) # hits
+ROTELLO_F = torch.tensor([1., 0., 4., 1., 3., 4., 1., 3.]) # false alarms
+ROTELLO_S = torch.tensor([4., 4., 4., 4., 4., 4., 4., 4.]) # signal trials (hits + misses)
+ROTELLO_N = torch.tensor([4., 4., 4., 4., 4., 4., 4., 4.]) # noise trials (false alarms + correct rejections)
+
+def Phi(x: torch.Tensor) -> torch.Tensor:
+    return 0.5 + 0.5 * torch.erf(x / math.sqrt(2))
+
+def heit_rotello(h: torch.Tensor, f: torch.Tensor, s: torch.Tensor, n: torch.Tensor):
+    k = len(h)
+    mud = sample("mud", dist.Normal(0., 3.))
+    muc = sample("muc", dist.Normal(0., 3.))
+    lambdad = sample("lambdad", dist.Gamma(1., 1.))
+    lambdac = sample("lambdac", dist.Gamma(1., 1.))
+
+    dval_raw = torch.stack([sample(f"dval_raw_{i}", dist.Normal(0., 1.)) for i in range(k)])
+    cval_raw = torch.stack([sample(f"cval_raw_{i}", dist.Normal(0., 1.)) for i in range(k)])
+    dval = mud + 1 / lambdad.sqrt() * dval_raw
+    cval = muc + 1 / lambdac.sqrt() * cval_raw
+
+    thetah = Phi(dval / 2 - cval)
+    thetaf = Phi(-dval / 2 - cval)
+
+    sample("h", dist.Binomial(s, thetah), observed=h)
+    sample("f", dist.Binomial(n, thetaf), observed=f)
+
+### taskC: eight schools
+
+SCHOOLS_Y = torch.tensor([28., 8., -3., 7., -1., 1., 18., 12.])
+SCHOOLS_SIGMA = torch.tensor([15., 10., 16., 11., 9., 11., 10., 18.])
+
+def eight_schools(y: torch.Tensor, sigma: torch.Tensor):
+    mu = sample("mu", dist.Normal(0., 5.))
+    tau = sample("tau", dist.HalfCauchy(5.))
+    theta = torch.stack([sample(f"theta_{i}", dist.Normal(mu, tau)) for i in range(len(y))])
+    sample("y", dist.Normal(theta, sigma), observed=y)
+
+### synthetic
+
+def funnel(D: int):
+    # Neal's funnel, scale of x_i varies over orders of magnitude with y
+    y = sample("y", dist.Normal(0., 3.))
+    for i in range(D):
+        sample(f"x_{i}", dist.Normal(0., (y / 2).exp()))
+
+def gaussian(scales: torch.Tensor):
+    # independent Gaussian with heterogeneous scales
+    for i in range(len(scales)):
+        sample(f"x_{i}", dist.Normal(0., scales[i]))
+
+# name -> (model, args, HMC settings)
+MODELS = {
+    "linear_regression": (linear_regression, (LINREG_X, LINREG_Y), {"L": 10, "eps": 0.05}),
+    "heit_rotello": (heit_rotello, (ROTELLO_H, ROTELLO_F, ROTELLO_S, ROTELLO_N), {"L": 10, "eps": 0.1}),
+    "eight_schools": (eight_schools, (SCHOOLS_Y, SCHOOLS_SIGMA), {"L": 10, "eps": 0.1}),
+    "funnel": (funnel, (9,), {"L": 10, "eps": 0.1}),
+    "gaussian_100d": (gaussian, (torch.linspace(0.5, 2., 100),), {"L": 20, "eps": 0.1}),
+}
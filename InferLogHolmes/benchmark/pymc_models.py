@@ -0,0 +1,83 @@
+import numpy as np
+import pymc as pm
+import pytensor as pt
+
+# PyMC models, step methods and sampling settings of the study tasks (test/Tasks/taskA.py - taskC.py).
+# Models are taken over as written in the task files, data files are inlined.
+
+### taskA: linear regression
+
+def task_a():
+    x = np.array([-1., -0.5, 0.0, 0.5, 1.0])
+    y = np.array([-3.2, -1.8, -0.5, -0.2, 1.5])
+
+    with pm.Model() as linear_regression:
+        slope = pm.Normal("slope", mu=0., sigma=3.)
+        intercept = pm.Normal("intercept", mu=0., sigma=3.)
+        sigma = pm.InverseGamma("sigma", alpha=1., beta=1.)
+
+        pm.Normal(f"y", slope * x + intercept, sigma, observed=y)
+
+        step = pm.HamiltonianMC(step_scale=0.5, adapt_step_size=False)
+
+    return linear_regression, step, {"draws": 3500, "tune": 100}
+
+### taskB: Heit-Rotello signal detection model (first k=8 rows of heit_rotello_std_i.csv)
+
+ROTELLO_H = np.array([3, 4, 4, 4, 4, 4, 4, 4]) # hits
+ROTELLO_F = np.array([1, 0, 4, 1, 3, 4, 1, 3]) # false alarms
+ROTELLO_S = np.array([4, 4, 4, 4, 4, 4, 4, 4]) # hits + misses
+ROTELLO_N = np.array([4, 4, 4, 4, 4, 4, 4, 4]) # false alarms + correct rejections
+
+def Phi(x):
+    return 0.5 + 0.5 * pt.tensor.erf(x / pt.tensor.sqrt(2))
+
+def task_b():
+    k = len(ROTELLO_H)
+
+    with pm.Model() as heit_rotello:
+        mud = pm.Normal("mud", mu=0., sigma=3.)
+        muc = pm.Normal("muc", mu=0., sigma=3.)
+
+        lambdad = pm.Gamma("lambdad", alpha=1., beta=1.)
+        lambdac = pm.Gamma("lambdac", alpha=1., beta=1.)
+
+        dval_raw = pm.Normal("dval_raw", mu=0, sigma=1, shape=(k,))
+        dval = pm.Deterministic("dval", muc + 1/lambdac**0.5 * dval_raw)
+
+        cval_raw = pm.Normal("cval_raw", mu=0, sigma=1, shape=(k,))
+        cval = pm.Deterministic("cval", muc + 1/lambdac**0.5 * cval_raw)
+
+        thetah = Phi(dval/2 - cval)
+        thetaf = Phi(-dval/2 - cval)
+
+        pm.Binomial("h", n=ROTELLO_S, p=thetah, observed=ROTELLO_H)
+        pm.Binomial("f", n=ROTELLO_N, p=thetaf, observed=ROTELLO_F)
+
+        step = pm.HamiltonianMC(step_scale=0.9, max_steps=10, adapt_step_size=False)
+
+    return heit_rotello, step, {"draws": 1500, "tune": 500}
+
+### taskC: eight schools
+
+def task_c():
+    y = np.array([28., 8., -3., 7., -1., 1., 18., 12.])
+    sigma = np.array([15., 10., 16., 11., 9., 11., 10., 18.])
+
+    with pm.Model() as eight_schools:
+        mu = pm.Normal("mu", mu=0, sigma=5)
+        tau = pm.HalfCauchy("tau", beta=5)
+        theta = pm.Normal("theta", mu=mu, sigma=tau**2, shape=(8,))
+
+        pm.Normal("y", mu=theta, sigma=sigma, observed=y)
+
+        step = pm.HamiltonianMC(step_scale=0.2, max_steps=5)
+
+    return eight_schools, step, {"draws": 3000, "tune": 0}
+
+# name -> function returning (model, step, sampling settings of the task)
+TASKS = {
+    "taskA": task_a,
+    "taskB": task_b,
+    "taskC": task_c,
+}
@@ -0,0 +1,173 @@
+import argparse
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import simplejson as json
+
+from .run import _peak_rss_mb
+from .stub_server import StubServer
+
+# Overhead benchmark of pmd.debug compared to pm.sample on the study task models.
+# Run from InferLogHolmes folder:
+#   python -m benchmark.pymc_run --out results.json
+# A stub server stands in for the debugger extension on localhost:8484, so the extension must not be running.
+# Every case runs in a fresh interpreter, compilation is part of the wall time of both samplers.
+
+SAMPLERS = ("pm.sample", "pmd.debug")
+
+def _backend_nbytes(traces) -> int:
+    # memory held by the draws and sampler stats of the chain backends
+    nbytes = 0
+    for trace in traces:
+        for values in getattr(trace, "samples", {}).values():
+            nbytes += getattr(values, "nbytes", 0)
+        for stats in getattr(trace, "_stats", None) or []:
+            for values in stats.values():
+                nbytes += getattr(values, "nbytes", 0)
+    return nbytes
+
+def run_case(case: dict) -> dict:
+    import numpy as np
+    import pymc as pm
+    import pymcdebug as pmd
+    from .pymc_models import TASKS
+
+    model, step, settings = TASKS[case["task"]]()
+    draws = case["draws"] if case["draws"] is not None else settings["draws"]
+    tune = case["tune"] if case["tune"] is not None else settings["tune"]
+
+    draw_times = {}
+    traces = {}
+    def callback(trace, draw):
+        draw_times.setdefault(draw.chain, []).append(time.perf_counter())
+        traces[draw.chain] = trace
+
+    kwargs = dict(
+        draws=draws, tune=tune, step=step, chains=case["chains"], cores=case["cores"],
+        random_seed=case["seed"], progressbar=False, callback=callback, model=model,
+    )
+    t0 = time.perf_counter()
+    if case["sampler"] == "pm.sample":
+        pm.sample(**kwargs)
+    elif case["sampler"] == "pmd.debug":
+        pmd.debug(**kwargs, cache=False, stream=case["stream"])
+    else:
+        raise ValueError(f"Unknown sampler {case['sampler']}.")
+    wall_time = time.perf_counter() - t0
+
+    n_draws = sum(len(times) for times in draw_times.values())
+    first_draw = min(times[0] for times in draw_times.values())
+    last_draw = max(times[-1] for times in draw_times.values())
+    # time between consecutive draws of a chain as seen by the parent process
+    latencies = np.concatenate([np.diff(times) for times in draw_times.values()]) * 1000
+    percentiles = np.percentile(latencies, [50, 90, 99]) if len(latencies) > 0 else [float("nan")] * 3
+
+    return {
+        **case,
+        "draws": draws,
+        "tune": tune,
+        "n_draws": n_draws,
+        "wall_time_s": wall_time,
+        "sampling_time_s": last_draw - first_draw,
+        "draws_per_s": n_draws / wall_time,
+        "sampling_draws_per_s": n_draws / (last_draw - first_draw) if last_draw > first_draw else float("nan"),
+        "latency_ms_p50": float(percentiles[0]),
+        "latency_ms_p90": float(percentiles[1]),
+        "latency_ms_p99": float(percentiles[2]),
+        "backend_mb": _backend_nbytes(traces.values()) / 1024**2,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def run_isolated(case: dict) -> dict:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out = os.path.join(tmpdir, "case.json")
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmark.pymc_run", "--case", json.dumps(case), "--out", out],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.DEVNULL
+        )
+        if proc.returncode != 0:
+            return {**case, "error": f"exit code {proc.returncode}"}
+        with open(out) as f:
+            return json.load(f)
+
+def get_cases(tasks, samplers, chain_counts, core_counts, draw_counts, tune, stream, seed: int):
+    cases = []
+    for task in tasks:
+        for sampler in samplers:
+            for chains in chain_counts:
+                for cores in core_counts:
+                    for draws in draw_counts:
+                        cases.append({
+                            "task": task, "sampler": sampler, "chains": chains, "cores": cores,
+                            "draws": draws, "tune": tune, "stream": stream if sampler == "pmd.debug" else None,
+                            "seed": seed
+                        })
+    return cases
+
+def _parse_stream(stream: str):
+    return int(stream) if stream.isdigit() else stream
+
+def get_meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    import pymc
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pymc": pymc.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def main():
+    from .pymc_models import TASKS
+    parser = argparse.ArgumentParser(description="Benchmark pmd.debug against pm.sample.")
+    parser.add_argument("--tasks", nargs="+", default=list(TASKS.keys()), choices=list(TASKS.keys()))
+    parser.add_argument("--samplers", nargs="+", default=list(SAMPLERS), choices=list(SAMPLERS))
+    parser.add_argument("--chains", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--cores", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--draws", nargs="+", type=int, default=[None], help="draws per chain (default: as in the task)")
+    parser.add_argument("--tune", type=int, default=None, help="tuning draws per chain (default: as in the task)")
+    parser.add_argument("--stream", type=_parse_stream, default="all", help="stream setting of pmd.debug")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--no-isolate", action="store_true", help="run all cases in this process (peak RSS is cumulative)")
+    parser.add_argument("--out", default=None, help="output json file (default: stdout)")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS) # used by run_isolated
+    args = parser.parse_args()
+
+    if args.case is not None:
+        output = run_case(json.loads(args.case))
+    else:
+        cases = get_cases(args.tasks, args.samplers, args.chains, args.cores, args.draws, args.tune, args.stream, args.seed)
+        run = run_case if args.no_isolate else run_isolated
+        results = []
+        with StubServer() as sink:
+            for case in cases:
+                print(f"{case['task']} {case['sampler']} chains={case['chains']} cores={case['cores']} draws={case['draws']}", file=sys.stderr)
+                before = sink.stats()
+                result = run(case)
+                after = sink.stats()
+                # telemetry of this case
+                result["requests"] = {
+                    path: count - before["requests"].get(path, 0) for path, count in after["requests"].items()
+                }
+                result["bytes_sent"] = after["bytes_received"] - before["bytes_received"]
+                results.append(result)
+        output = {"meta": get_meta(), "results": results}
+
+    if args.out is None:
+        print(json.dumps(output, indent=2, ignore_nan=True))
+    else:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2, ignore_nan=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import simplejson as json
+
+# Throughput benchmark for the ppl samplers.
+# Run from InferLogHolmes folder:
+#   python -m benchmark.run --out results.json
+# Quick check that every model/sampler pair runs (non-zero exit code on failure):
+#   python -m benchmark.run --smoke
+# Every case runs in a fresh interpreter such that peak RSS is not shared between cases.
+# With telemetry on, a stub server is started on localhost:8484, so the debugger extension must not be running.
+
+ALGORITHMS = ("metropolis_hastings", "hamiltonian_monte_carlo", "generate_from_prior")
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS, children are chain worker processes
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(self_rss, children_rss) / scale
+
+def run_case(case: dict) -> dict:
+    import torch
+    from ppl import metropolis_hastings, hamiltonian_monte_carlo
+    from ppl.generate import generate_from_prior
+    from .models import MODELS
+    from .diagnostics import ess_per_address
+
+    model, args, hmc_settings = MODELS[case["model"]]
+    algorithm = case["algorithm"]
+    n_iter = case["n_iter"]
+    n_chains = case["n_chains"]
+    torch.manual_seed(case["seed"])
+
+    t0 = time.perf_counter()
+    if algorithm == "metropolis_hastings":
+        results, _, _ = metropolis_hastings(n_iter, n_chains, {}, model, *args, telemetry=case["telemetry"])
+        chains = [[{addr: entry.value for addr, entry in trace.items()} for trace in result] for result in results]
+        grad_evals = 0
+    elif algorithm == "hamiltonian_monte_carlo":
+        L, eps = hmc_settings["L"], hmc_settings["eps"]
+        results, _, _ = hamiltonian_monte_carlo(n_iter, n_chains, L, eps, True, model, *args, telemetry=case["telemetry"])
+        chains = [[{addr: entry.value for addr, entry in trace.items()} for trace in result] for result in results]
+        # leapfrog evaluates gradient L+1 times per iteration
+        grad_evals = n_iter * n_chains * (L + 1)
+    elif algorithm == "generate_from_prior":
+        result = generate_from_prior(n_iter * n_chains, model, *args)
+        chains = [[stat["trace"] for stat in result]]
+        grad_evals = 0
+    else:
+        raise ValueError(f"Unknown algorithm {algorithm}.")
+    wall_time = time.perf_counter() - t0
+
+    ess = ess_per_address(chains)
+    ess_values = sorted(v for v in ess.values() if v == v) # drop nan
+    ess_min = ess_values[0] if len(ess_values) > 0 else float("nan")
+    ess_median = ess_values[len(ess_values) // 2] if len(ess_values) > 0 else float("nan")
+
+    return {
+        **case,
+        "wall_time_s": wall_time,
+        "iterations_per_s": n_iter * n_chains / wall_time,
+        "grad_evals_per_s": grad_evals / wall_time,
+        "ess_min": ess_min,
+        "ess_median": ess_median,
+        "ess_min_per_s": ess_min / wall_time,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def run_isolated(case: dict) -> dict:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out = os.path.join(tmpdir, "case.json")
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmark.run", "--case", json.dumps(case), "--out", out],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stdout=subprocess.DEVNULL
+        )
+        if proc.returncode != 0:
+            return {**case, "error": f"exit code {proc.returncode}"}
+        with open(out) as f:
+            return json.load(f)
+
+def get_cases(models, algorithms, chain_counts, n_iter: int, telemetry_modes, seed: int):
+    cases = []
+    for model in models:
+        for algorithm in algorithms:
+            for n_chains in chain_counts:
+                # generate_from_prior does not stream telemetry
+                modes = [False] if algorithm == "generate_from_prior" else telemetry_modes
+                for telemetry in modes:
+                    cases.append({
+                        "model": model, "algorithm": algorithm, "n_chains": n_chains,
+                        "n_iter": n_iter, "telemetry": telemetry, "seed": seed
+                    })
+    return cases
+
+def get_meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    import torch
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def main():
+    from .models import MODELS
+    from .stub_server import StubServer
+    parser = argparse.ArgumentParser(description="Benchmark ppl samplers.")
+    parser.add_argument("--models", nargs="+", default=list(MODELS.keys()), choices=list(MODELS.keys()))
+    parser.add_argument("--algorithms", nargs="+", default=list(ALGORITHMS), choices=list(ALGORITHMS))
+    parser.add_argument("--chains", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--n-iter", type=int, default=500)
+    parser.add_argument("--telemetry", nargs="+", default=["off", "on"], choices=["off", "on"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-isolate", action="store_true", help="run all cases in this process (peak RSS is cumulative)")
+    parser.add_argument("--smoke", action="store_true", help="run every model/sampler pair for a few iterations, one chain, without telemetry")
+    parser.add_argument("--out", default=None, help="output json file (default: stdout)")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS) # used by run_isolated
+    args = parser.parse_args()
+
+    if args.smoke:
+        args.chains, args.n_iter, args.telemetry = [1], 20, ["off"]
+
+    if args.case is not None:
+        output = run_case(json.loads(args.case))
+    else:
+        telemetry_modes = [mode == "on" for mode in args.telemetry]
+        cases = get_cases(args.models, args.algorithms, args.chains, args.n_iter, telemetry_modes, args.seed)
+        run = run_case if args.no_isolate else run_isolated
+        # sampler output of --no-isolate runs goes to stdout, use --out in this case
+        sink = StubServer() if any(telemetry_modes) else nullcontext()
+        results = []
+        with sink:
+            for case in cases:
+                print(f"{case['model']} {case['algorithm']} chains={case['n_chains']} telemetry={case['telemetry']}", file=sys.stderr)
+                results.append(run(case))
+        telemetry_stats = sink.stats() if any(telemetry_modes) else None
+        output = {"meta": get_meta(), "telemetry": telemetry_stats, "results": results}
+
+    if args.out is None:
+        print(json.dumps(output, indent=2, ignore_nan=True))
+    else:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2, ignore_nan=True)
+
+    if args.smoke:
+        failed = [r for r in output["results"] if "error" in r]
+        for r in failed:
+            print(f"FAILED {r['model']} {r['algorithm']}: {r['error']}", file=sys.stderr)
+        sys.exit(1 if len(failed) > 0 else 0)
+
+if __name__ == "__main__":
+    main()
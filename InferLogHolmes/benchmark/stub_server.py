@@ -0,0 +1,41 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+
+# Minimal stand-in for the debugger extension: accepts the telemetry requests on /start, /trace, /trace-batch and /end
+# and only counts requests and received bytes, such that benchmarks measure the cost of producing telemetry.
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        with self.server.lock:
+            self.server.requests[self.path] += 1
+            self.server.bytes_received += length
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class StubServer:
+    def __init__(self, host: str = "localhost", port: int = 8484) -> None:
+        self.httpd = ThreadingHTTPServer((host, port), _StubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = Counter()
+        self.httpd.bytes_received = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def stats(self):
+        with self.httpd.lock:
+            return {"requests": dict(self.httpd.requests), "bytes_received": self.httpd.bytes_received}
@@ -1,9 +1,10 @@
 import * as vscode from 'vscode';
 import { JSONRPCClient } from "json-rpc-2.0";
-import type { CallGraphNode, Model, RandomVariable, TraceItem } from './lasappTypes';
+import type { CompactResponse, Model, ModelAnalysis, TraceItem } from './lasappTypes';
 import * as http from 'http';
 import { WorkerInterface } from './workerInterface';
 import { DebuggingState } from './warnings';
+import { resolveNodeTable } from './helper';
 
 
 type MainState = {
@@ -94,7 +95,7 @@ http.createServer(function (req, res) {
 
 					state.app.debuggingSession.trace[dt.chain].push(dt);
 					currentTraceBatch[dt.chain].push(dt);
-					if(state.app.debuggingSession.trace.reduce((acc, c) => acc + c.length, 0) == state.app.debuggingSession.totalIteration * state.app.debuggingSession.chains) {
+					if(isRunComplete(state.app.debuggingSession)) {
 						cleanUp();
 					}
 					res.writeHead(201);
@@ -131,7 +132,7 @@ http.createServer(function (req, res) {
 						currentTraceBatch[x.chain].push(x);
 					});
 
-					if(state.app.debuggingSession.trace.reduce((acc, c) => acc + c.length, 0) == state.app.debuggingSession.totalIteration * state.app.debuggingSession.chains) {
+					if(isRunComplete(state.app.debuggingSession)) {
 						cleanUp();
 					}
 					res.writeHead(201);
@@ -146,6 +147,18 @@ http.createServer(function (req, res) {
 				}
 			});
 			
+			break;
+		case "/end":
+			// sent when sampling finished, thinned or rate limited runs never reach totalIteration * chains items
+			req.on('data', () => {});
+			req.on('end', () => {
+				if(state.app.debuggingSession) {
+					cleanUp();
+				}
+				res.writeHead(201);
+				res.end();
+			});
+
 			break;
 		default:
 			res.writeHead(200, {'Content-Type': 'text/html'});
@@ -160,20 +173,30 @@ http.createServer(function (req, res) {
   	
 }).listen(8484);
 
+// Runs announced with endMessage are finished by /end only, their streams may be thinned or rate limited.
+function isRunComplete(session: DebuggingState): boolean {
+	if(session.endMessage) {
+		return false;
+	}
+	return session.trace.reduce((acc, c) => acc + c.length, 0) == session.totalIteration * session.chains;
+}
+
 async function cleanUp() {
 	if(currentInterval != null) {
 		clearInterval(currentInterval);
 		currentInterval = null;
 	}
 	if(warningWorker != null) {
+		// the run may end by item count and by /end, only report once
+		let worker = warningWorker;
+		warningWorker = null;
 		let batch = [...currentTraceBatch]
-		let res = warningWorker.getFinalReport(batch);
+		let res = worker.getFinalReport(batch);
 		currentTraceBatch = currentTraceBatch.map(x => []);
 
 		let stats = await res;
 		await PPLDebuggerPanel.currentPanel?.addTraceBatch({batch, stats});
-		warningWorker.worker.terminate();
-		warningWorker = null;
+		worker.worker.terminate();
 	}
 }
 
@@ -416,30 +439,17 @@ class PPLDebuggerPanel {
 		const is_descendant = (parent: any, child: any) => {
 			return parent.first_byte <= child.first_byte && child.last_byte <= parent.last_byte
 		}
+		// one round-trip for build_ast, get_model, get_random_variables, get_graph, get_call_graph and get_funnel_relationships
 		state.local.rpcClient
-		  	?.request("build_ast", { file_name: this._modelPath, ppl: null, n_unroll_loops: 0 })
-		  	.then((result: any) => {
-				state.local.treeId = result;
-				return state.local.rpcClient?.request("get_model", {tree_id: state.local.treeId});
-			})
-			.then((result: any) => {
-				state.app.model = result;
-				return state.local.rpcClient?.request("get_graph", {tree_id: state.local.treeId, model: state.app.model });
-			})
-			.then((result: any) => {
-				state.app.modelGraph = result;
-				return state.local.rpcClient?.request("get_call_graph", {tree_id: state.local.treeId, node: state.app.model?.node });
-			})
-			.then((callGraph: CallGraphNode[]) => {
-				return state.local.rpcClient?.request("get_random_variables", {tree_id: state.local.treeId})
-					.then((rvs: RandomVariable[]) => {
-						let callGraphNodes = [...new Set(callGraph.map(n => n.caller))];
-						return rvs.filter(rv => callGraphNodes.find((c) => is_descendant(c, rv.node)))
-					});
-			})
-			.then((result: any) => {
-				state.app.randomVariables = result;
-				return state.local.rpcClient?.request("get_funnel_relationships", {tree_id: state.local.treeId, model: state.app.model });
+		  	?.request("analyze_model", { file_name: this._modelPath, ppl: null, n_unroll_loops: 0, compact: true })
+			.then((response: CompactResponse) => {
+				const analysis = resolveNodeTable<ModelAnalysis>(response);
+				state.local.treeId = analysis.tree_id;
+				state.app.model = analysis.model;
+				state.app.modelGraph = analysis.graph;
+				let callGraphNodes = [...new Set(analysis.call_graph.map(n => n.caller))];
+				state.app.randomVariables = analysis.random_variables.filter(rv => callGraphNodes.find((c) => is_descendant(c, rv.node)));
+				return analysis.funnel_relationships;
 			})
 			.then((result: any) => {
 				state.app.funnel = result;
@@ -1,5 +1,5 @@
 import { acfFFT } from "./fourier";
-import type { TraceItem } from "./lasappTypes";
+import type { CompactResponse, TraceItem } from "./lasappTypes";
 
 export const CONSEC_NUMBER_GENERATOR = (function* (start: number = 0): Generator<number> {
 	let i = start;
@@ -8,6 +8,23 @@ export const CONSEC_NUMBER_GENERATOR = (function* (start: number = 0): Generator
 	}
 })(0);
 
+export function resolveNodeTable<T>(response: CompactResponse): T {
+	const resolve = (o: any): any => {
+		if (Array.isArray(o)) {
+			return o.map(resolve);
+		}
+		if (o !== null && typeof o === 'object') {
+			const keys = Object.keys(o);
+			if (keys.length === 1 && keys[0] === 'node_id') {
+				return response.nodes[o.node_id];
+			}
+			return Object.fromEntries(keys.map(k => [k, resolve(o[k])]));
+		}
+		return o;
+	}
+	return resolve(response.result);
+}
+
 function escapeRegExp(str: string) {
 	return str.replace(/[.*+?^${}()|[\]\\]/g, '\\$&'); // $& means the whole matched string
 }
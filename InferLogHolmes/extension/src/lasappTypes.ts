@@ -58,6 +58,36 @@ export type SymbolicExpression = {
     expr: string,
 }
 
+// result of get_graph_json, lists are sorted
+export type ModelGraphJSON = {
+    nodes: [{id: string, name: string, distribution: string, label: string, is_observed: boolean}],
+    edges: [[string, string]],
+    plate: GraphPlate,
+}
+
+// global plate has id null, loop plates have the node_id of the for loop and the iterated expression as label
+export type GraphPlate = {
+    id: string | null,
+    label: string | null,
+    members: [string],
+    plates: [GraphPlate],
+}
+
+// response of a request with compact: true, syntax nodes in result are replaced by {node_id: ...} references into nodes
+export type CompactResponse = {
+    nodes: {[node_id: string]: SyntaxNode},
+    result: any,
+}
+
+export type ModelAnalysis = {
+    tree_id: string,
+    model: Model,
+    random_variables: [RandomVariable],
+    call_graph: [CallGraphNode],
+    graph: string,
+    funnel_relationships: [[RandomVariable, RandomVariable]],
+}
+
 export type TraceItem = {
 	iter: number,
     chain: number,
@@ -67,5 +97,37 @@ export type TraceItem = {
 	log_prob_proposed: number,
 	accepted: boolean | boolean[],
 	diverged: boolean,
-	resample_addresses: any[]
+	resample_addresses: any[],
+	timings?: {[phase: string]: number},
+	diagnostics?: ChainDiagnostics
+}
+
+// incrementally computed by pymcdebug, values have the shape of the variable, null if not yet available
+export type ChainDiagnostics = {
+	draws: number,
+	tune: boolean | null,
+	acceptance_rate: number | number[],
+	mean: {[variable: string]: any},
+	sd: {[variable: string]: any},
+	ess: {[variable: string]: any},
+	rhat: {[variable: string]: any},
+	n_chains: number,
+}
+
+// model graph of a PyMC model extracted at runtime by pymcdebug, sent with /start
+export type RuntimeModelNode = {
+	name: string,
+	type: "free" | "observed" | "deterministic" | "data" | "potential",
+	distribution: string | null,
+	params: {parents: string[], value: any}[],
+	shape: number[],
+	dims: string[] | null,
+	observed: boolean,
+	transform: string | null,
+}
+
+export type RuntimeModelGraph = {
+	nodes: RuntimeModelNode[],
+	edges: [string, string][],
+	plates: {dims: (string | null)[], lengths: number[], variables: string[]}[],
 }
\ No newline at end of file
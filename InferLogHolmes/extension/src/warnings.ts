@@ -1,6 +1,6 @@
 import { config } from "process";
 import { acf, effectiveSampleSize, getMedian, getTraceValues, multiChainACF, multiChainESS, rankNormaization, rankNormalizedRHat, slidingRHat, takeWhile } from "./helper";
-import { type TraceItem } from "./lasappTypes"
+import { type RuntimeModelGraph, type TraceItem } from "./lasappTypes"
 
 export enum WorkerTopic {
 	GetWarnings,
@@ -45,6 +45,8 @@ export type DebuggingState = {
 	burnin: number,
 	chains: number,
 	trace: TraceItem[][],
+	modelGraph?: RuntimeModelGraph | null,
+	endMessage?: boolean,
 }
 
 export type WarningConfig = {
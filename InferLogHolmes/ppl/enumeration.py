@@ -0,0 +1,93 @@
+import torch
+import torch.distributions as dist
+from functools import reduce
+from typing import List
+
+# Exact marginalisation of discrete sites with small finite support (Bernoulli, Categorical, Binomial, ...).
+# Instead of sampling a value, an enumerated site returns its whole support along a new batch dimension.
+# The j-th enumerated site gets value shape (S_j,) + (1,) * (j + data_dims), such that all log probability
+# terms broadcast to (S_{E-1}, ..., S_0, *data_shape). The rightmost data_dims dimensions are reserved for
+# vectorised observations and are summed out, the enumeration dimensions are summed out with log-sum-exp.
+# Control flow must not branch on enumerated values.
+# Enumerated sites must be scalar (no batch dimensions besides those of earlier enumerated sites).
+
+MAX_SUPPORT_SIZE = 32
+MAX_ENUMERATED_SITES = 16
+
+# Not a ValueError, such that samplers do not mistake an unsupported model for a step out of the support.
+class EnumerationError(Exception):
+    pass
+
+class Enumerator:
+    def __init__(self, data_dims: int = 1, max_support_size: int = MAX_SUPPORT_SIZE, max_enumerated_sites: int = MAX_ENUMERATED_SITES) -> None:
+        self.data_dims = data_dims
+        self.max_support_size = max_support_size
+        self.max_enumerated_sites = max_enumerated_sites
+        self.addresses: List[str] = []
+        self.support_sizes: List[int] = []
+        self.terms: List[torch.Tensor] = []
+
+    @staticmethod
+    def is_enumerable(distribution: dist.Distribution) -> bool:
+        return distribution.has_enumerate_support
+
+    # Returns the indices of the enumerated sites that the batch shape of distribution depends on.
+    def get_enumerated_dependencies(self, address: str, distribution: dist.Distribution) -> List[int]:
+        E = len(self.support_sizes)
+        D = self.data_dims
+        batch_shape = tuple(distribution.batch_shape)
+        if len(batch_shape) > E + D:
+            raise EnumerationError(f"Cannot enumerate model at {address}: batch shape {batch_shape} has more than {D} data dimensions.")
+        batch_shape = (1,) * (E + D - len(batch_shape)) + batch_shape
+        dependencies = []
+        for j, S in enumerate(self.support_sizes):
+            if batch_shape[E - 1 - j] == S and S > 1:
+                dependencies.append(j)
+            elif batch_shape[E - 1 - j] != 1:
+                raise EnumerationError(f"Cannot enumerate model at {address}: batch shape {tuple(distribution.batch_shape)} does not broadcast with enumerated site {self.addresses[j]}.")
+        return dependencies
+
+    def enumerate_support(self, address: str, distribution: dist.Distribution) -> torch.Tensor:
+        batch_shape = tuple(distribution.batch_shape)
+        if any(s != 1 for s in batch_shape[max(len(batch_shape) - self.data_dims, 0):]):
+            raise EnumerationError(f"Cannot enumerate {address}: batched discrete sites (batch shape {batch_shape}) are not supported, sample one scalar site per element.")
+        self.get_enumerated_dependencies(address, distribution)
+        support = distribution.enumerate_support(expand=False).reshape(-1)
+        if len(support) > self.max_support_size:
+            raise EnumerationError(f"Cannot enumerate {address}: support size {len(support)} exceeds {self.max_support_size}.")
+        if len(self.support_sizes) >= self.max_enumerated_sites:
+            raise EnumerationError(f"Cannot enumerate {address}: more than {self.max_enumerated_sites} enumerated sites.")
+        values = support.reshape((-1,) + (1,) * (len(self.support_sizes) + self.data_dims))
+        self.addresses.append(address)
+        self.support_sizes.append(len(support))
+        return values
+
+    def add_log_prob(self, log_prob: torch.Tensor):
+        self.terms.append(log_prob)
+
+    def log_prob(self) -> torch.Tensor:
+        E = len(self.support_sizes)
+        D = self.data_dims
+
+        factors = []
+        for term in self.terms:
+            if term.dim() > E + D:
+                raise EnumerationError(f"Log probability term of shape {tuple(term.shape)} has more than {D} data dimensions.")
+            term = term.reshape((1,) * (E + D - term.dim()) + tuple(term.shape))
+            for j, S in enumerate(self.support_sizes):
+                if term.shape[E - 1 - j] not in (1, S):
+                    raise EnumerationError(f"Log probability term of shape {tuple(term.shape)} does not broadcast with enumerated site {self.addresses[j]}.")
+            if D > 0:
+                term = term.sum(dim=tuple(range(E, E + D)))
+            factors.append(term)
+
+        # variable elimination, latest sites first as they typically depend on earlier ones
+        for j in reversed(range(E)):
+            d = E - 1 - j
+            involved = [f for f in factors if f.shape[d] > 1]
+            if len(involved) == 0:
+                continue
+            factors = [f for f in factors if f.shape[d] == 1]
+            factors.append(torch.logsumexp(reduce(torch.add, involved), dim=d, keepdim=True))
+
+        return reduce(torch.add, [f.reshape(()) for f in factors], torch.tensor(0.))
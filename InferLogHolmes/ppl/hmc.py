@@ -1,4 +1,7 @@
 from .core import SampleContext
+from .initialization import INIT_STRATEGIES, find_map, laplace_approximation, overdispersed_positions
+from .enumeration import Enumerator
+from .profiling import PhaseTimer, streamed_timings, timing_report, print_timing_report
 from collections import namedtuple
 from abc import ABC, abstractmethod
 import torch
@@ -9,19 +12,23 @@ import requests
 import simplejson as json
 
 class AddressToIndexCtx(SampleContext):
-    def __init__(self):
+    def __init__(self, enumerate_discrete: bool = False):
         self.address_to_index = {}
         self.address_to_mean = {}
+        self.enumerate_discrete = enumerate_discrete
     def sample(self, address: str, distribution: dist.Distribution, observed: Optional[torch.Tensor] = None):
         if observed is not None:
             return observed
+        if self.enumerate_discrete and Enumerator.is_enumerable(distribution):
+            # enumerated sites are summed out and get no index, continue with any value in support
+            return distribution.enumerate_support(expand=False)[0]
         assert address not in self.address_to_index, f"Address with multiple samples: {address}"
         self.address_to_index[address] = len(self.address_to_index)
         self.address_to_mean[address] = distribution.mean
         return distribution.mean
     
-def get_address_to_index_map(model, *args, **kwargs):
-    ctx = AddressToIndexCtx()
+def get_address_to_index_map(model, *args, enumerate_discrete: bool = False, **kwargs):
+    ctx = AddressToIndexCtx(enumerate_discrete)
     with ctx:
         model(*args, **kwargs)
     return ctx.address_to_index, ctx.address_to_mean
@@ -30,22 +37,38 @@ def get_address_to_index_map(model, *args, **kwargs):
 TraceEntry = namedtuple("TraceEntry", ["value", "log_prob"])
 
 class LogJointCtx(SampleContext):
-    def __init__(self, address_to_index: dict[str,int], X: torch.Tensor):
+    def __init__(self, address_to_index: dict[str,int], X: torch.Tensor, enumerator: Optional[Enumerator] = None):
         self.log_prob = torch.tensor(0.)
         self.address_to_index = address_to_index
         self.X = X
         self.X_trace = {}
+        self.enumerator = enumerator
+
+    def add_log_prob(self, log_prob: torch.Tensor):
+        if self.enumerator is not None:
+            self.enumerator.add_log_prob(log_prob)
+        else:
+            self.log_prob += log_prob
         
     def sample(self, address: str, distribution: dist.Distribution, observed: Optional[torch.Tensor] = None):
         if observed is not None:
-            self.log_prob += distribution.log_prob(observed)
+            if self.enumerator is not None:
+                # data dimensions are summed by enumerator after broadcasting with enumerated values
+                self.enumerator.add_log_prob(distribution.log_prob(observed))
+            else:
+                self.log_prob += distribution.log_prob(observed).sum()
             return observed
 
+        if self.enumerator is not None and self.enumerator.is_enumerable(distribution):
+            value = self.enumerator.enumerate_support(address, distribution)
+            self.add_log_prob(distribution.log_prob(value))
+            return value
+
         i = self.address_to_index[address]
         value = self.X[i]
         log_prob = distribution.log_prob(value)
         
-        self.log_prob += log_prob
+        self.add_log_prob(log_prob)
         self.X_trace[address] = TraceEntry(value, log_prob)
         
         return value
@@ -53,33 +76,54 @@ class LogJointCtx(SampleContext):
 class AbstractLogJoint:
     pass
 
+# If enumerate_discrete is set, discrete sites with finite support are summed out (see Enumerator)
+# and only the remaining continuous sites are indexed in X.
 class LogJoint(AbstractLogJoint):
-    def __init__(self, model, *args, **kwargs):
+    def __init__(self, model, *args, enumerate_discrete: bool = False, **kwargs):
         self.model = model
         self.args = args
         self.kwargs = kwargs
-        self.address_to_index, self.address_to_mean = get_address_to_index_map(model, *args, **kwargs)
+        self.enumerate_discrete = enumerate_discrete
+        self.address_to_index, self.address_to_mean = get_address_to_index_map(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
         self.N = len(self.address_to_index)
         
     def __call__(self, X: torch.Tensor) -> torch.Tensor:
-        ctx = LogJointCtx(self.address_to_index, X)
+        ctx = LogJointCtx(self.address_to_index, X, Enumerator() if self.enumerate_discrete else None)
         with ctx:
             retval = self.model(*self.args, **self.kwargs)
+        if ctx.enumerator is not None:
+            ctx.log_prob = ctx.enumerator.log_prob()
         return ctx.log_prob, retval, ctx.X_trace
     
 
 class UnconstrainedLogJointCtx(SampleContext):
-    def __init__(self, address_to_index: dict[str,int], X: torch.Tensor):
+    def __init__(self, address_to_index: dict[str,int], X: torch.Tensor, enumerator: Optional[Enumerator] = None):
         self.log_prob = torch.tensor(0.)
         self.address_to_index = address_to_index
         self.X = X
         self.X_constrained = {}
+        self.enumerator = enumerator
+
+    def add_log_prob(self, log_prob: torch.Tensor):
+        if self.enumerator is not None:
+            self.enumerator.add_log_prob(log_prob)
+        else:
+            self.log_prob += log_prob
         
     def sample(self, address: str, distribution: dist.Distribution, observed: Optional[torch.Tensor] = None):
         if observed is not None:
-            self.log_prob += distribution.log_prob(observed)
+            if self.enumerator is not None:
+                # data dimensions are summed by enumerator after broadcasting with enumerated values
+                self.enumerator.add_log_prob(distribution.log_prob(observed))
+            else:
+                self.log_prob += distribution.log_prob(observed).sum()
             return observed
 
+        if self.enumerator is not None and self.enumerator.is_enumerable(distribution):
+            value = self.enumerator.enumerate_support(address, distribution)
+            self.add_log_prob(distribution.log_prob(value))
+            return value
+
         i = self.address_to_index[address]
         unconstrained_value = self.X[i]
 
@@ -88,7 +132,7 @@ class UnconstrainedLogJointCtx(SampleContext):
         
         unconstrained_distribution = dist.TransformedDistribution(distribution, transform.inv) # supported on (-inf,inf)
         log_prob = unconstrained_distribution.log_prob(unconstrained_value)
-        self.log_prob += log_prob
+        self.add_log_prob(log_prob)
         
         # or equivalently
         # self.log_prob += distribution.log_prob(constrained_value) + transform.log_abs_det_jacobian(unconstrained_value, constrained_value)
@@ -100,60 +144,108 @@ class UnconstrainedLogJointCtx(SampleContext):
         return constrained_value
         
 class UnconstrainedLogJoint(AbstractLogJoint):
-    def __init__(self, model, *args, **kwargs):
+    def __init__(self, model, *args, enumerate_discrete: bool = False, **kwargs):
         self.model = model
         self.args = args
         self.kwargs = kwargs
-        self.address_to_index, _ = get_address_to_index_map(model, *args, **kwargs)
+        self.enumerate_discrete = enumerate_discrete
+        self.address_to_index, _ = get_address_to_index_map(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
         self.N = len(self.address_to_index)
         
     def __call__(self, X: torch.Tensor) -> torch.Tensor:
-        ctx = UnconstrainedLogJointCtx(self.address_to_index, X)
+        ctx = UnconstrainedLogJointCtx(self.address_to_index, X, Enumerator() if self.enumerate_discrete else None)
         with ctx:
             retval = self.model(*self.args, **self.kwargs)
+        if ctx.enumerator is not None:
+            ctx.log_prob = ctx.enumerator.log_prob()
         return ctx.log_prob, retval, ctx.X_constrained
     
-def get_grad_U(logjoint: AbstractLogJoint):
+# Computes initial positions for n_chains in the space of the HMC target (unconstrained or constrained).
+# The mode is always searched in unconstrained space, such that the optimizer cannot leave the support.
+def get_initial_positions(n_chains: int, unconstrained: bool, init_strategy: str, model, *args, enumerate_discrete: bool = False, **kwargs):
+    assert init_strategy in INIT_STRATEGIES, f"Unknown init strategy {init_strategy}, expected one of {INIT_STRATEGIES}."
+    if init_strategy == "prior":
+        return None, None
+
+    unconstrained_logjoint = UnconstrainedLogJoint(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
+    X_map = find_map(unconstrained_logjoint, torch.zeros(unconstrained_logjoint.N))
+
+    if unconstrained:
+        logjoint = unconstrained_logjoint
+    else:
+        logjoint = LogJoint(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
+        _, _, X_constrained = unconstrained_logjoint(X_map)
+        X_map = torch.zeros(logjoint.N)
+        for addr, entry in X_constrained.items():
+            X_map[logjoint.address_to_index[addr]] = entry.value
+
+    if init_strategy == "map":
+        return [X_map.clone() for _ in range(n_chains)], None
+
+    cov = laplace_approximation(logjoint, X_map)
+    positions = overdispersed_positions(logjoint, X_map, cov, n_chains)
+    inv_mass = cov.diagonal().clone()
+    return positions, inv_mass
+
+def get_grad_U(logjoint: AbstractLogJoint, timer: Optional[PhaseTimer] = None):
+    if timer is None:
+        timer = PhaseTimer(enabled=False)
     def grad_U(X: torch.Tensor):
         X = X.detach().requires_grad_(True)
-        log_prob, _, _ = logjoint(X)
+        with timer.phase("model"):
+            log_prob, _, _ = logjoint(X)
+            timer.count_model_eval()
         U = -log_prob
-        U.backward()
+        with timer.phase("backward"):
+            U.backward()
         return X.grad
     return grad_U
 
 
 # The leapfrog integrated runs for L steps with stride eps.
 # It has the property that leapfrog(*leapfrog(R, X, L, eps), L, eps) == (R, X)
+# inv_mass is the diagonal of the inverse mass matrix (identity if None)
 def leapfrog(
         grad_U,
         X: torch.Tensor, P: torch.Tensor,
-        L: int, eps: float
+        L: int, eps: float,
+        inv_mass: Optional[torch.Tensor] = None
     ):
+    if inv_mass is None:
+        inv_mass = torch.ones_like(X)
     P = P - eps/2 * grad_U(X)
     for _ in range(L-1):
-        X = X + eps * P
+        X = X + eps * inv_mass * P
         P = P - eps * grad_U(X)
-    X = X + eps * P
+    X = X + eps * inv_mass * P
     P = P - eps/2 * grad_U(X)
     
     return X, -P
 
 
-def hamiltonian_monte_carlo_worker(n_iter: int, chain: int, L: int, eps: float, unconstrained: bool, model, *args, **kwargs):
+def hamiltonian_monte_carlo_worker(n_iter: int, chain: int, L: int, eps: float, unconstrained: bool, model, *args,
+                                   X_init: Optional[torch.Tensor] = None, inv_mass: Optional[torch.Tensor] = None,
+                                   enumerate_discrete: bool = False, profile: bool = False, telemetry: bool = True, **kwargs):
     if unconstrained:
-        logjoint = UnconstrainedLogJoint(model, *args, **kwargs)
+        logjoint = UnconstrainedLogJoint(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
         K = logjoint.N
         X_current = torch.zeros(K)
     else:
-        logjoint = LogJoint(model, *args, **kwargs)
+        logjoint = LogJoint(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
         K = logjoint.N
         X_current = torch.zeros(K)
         # initialise to mean
         for addr, value in logjoint.address_to_mean.items():
             X_current[logjoint.address_to_index[addr]] = value
 
-    grad_U = get_grad_U(logjoint)
+    if X_init is not None:
+        # warm start computed by parent process
+        X_current = X_init.clone()
+    if inv_mass is None:
+        inv_mass = torch.ones(K)
+
+    timer = PhaseTimer(enabled=profile)
+    grad_U = get_grad_U(logjoint, timer)
     
     log_prob_current, retval_current, X_unconstrained_current = logjoint(X_current)
     U_current = -log_prob_current
@@ -162,31 +254,37 @@ def hamiltonian_monte_carlo_worker(n_iter: int, chain: int, L: int, eps: float,
     retvals = []
     stats = []
     n_accept = 0
+    timings_prev = None
     for i in tqdm(range(n_iter), desc=f"HMC-Chain-{chain}", position=chain):        
+        timer.reset()
         # Sample K-dimensional momentum randomly
-        P_current = dist.Normal(0., 1.).sample((K,))
-        K_current = P_current.dot(P_current) / 2
+        # P ~ N(0, M) with M = diag(1 / inv_mass)
+        P_current = dist.Normal(0., 1.).sample((K,)) / inv_mass.sqrt()
+        K_current = (inv_mass * P_current).dot(P_current) / 2
         # Simulate trajectory with leapfrog integrator
         try:
-            X_proposed, P_proposed = leapfrog(grad_U, X_current, P_current, L, eps)
+            X_proposed, P_proposed = leapfrog(grad_U, X_current, P_current, L, eps, inv_mass)
 
             # Compute new kinetic and potential energy     
-            K_proposed = P_proposed.dot(P_proposed) / 2
-            log_prob_proposed, retval_proposed, X_unconstrained_proposed = logjoint(X_proposed)
+            K_proposed = (inv_mass * P_proposed).dot(P_proposed) / 2
+            with timer.phase("model"):
+                log_prob_proposed, retval_proposed, X_unconstrained_proposed = logjoint(X_proposed)
+                timer.count_model_eval()
             U_proposed = -log_prob_proposed
 
-            # With perfect precision the leapfrog integrator should preserve the energy and accept with probability 1.
-            # But it is an approximation and we adjust with a metropolis hasting step
-            accepted = False
-            if torch.rand(()).log() < (U_current - U_proposed + K_current - K_proposed):
-                n_accept += 1
-                accepted = True
-                retval_current = retval_proposed
-                U_current = U_proposed
-                X_current = X_proposed
-                X_unconstrained_current = X_unconstrained_proposed
+            with timer.phase("accept"):
+                # With perfect precision the leapfrog integrator should preserve the energy and accept with probability 1.
+                # But it is an approximation and we adjust with a metropolis hasting step
+                accepted = False
+                if torch.rand(()).log() < (U_current - U_proposed + K_current - K_proposed):
+                    n_accept += 1
+                    accepted = True
+                    retval_current = retval_proposed
+                    U_current = U_proposed
+                    X_current = X_proposed
+                    X_unconstrained_current = X_unconstrained_proposed
 
-            diverged = U_proposed.isnan().item() or U_proposed.isinf().item()
+                diverged = U_proposed.isnan().item() or U_proposed.isinf().item()
 
         except ValueError:
             # stepped out of bounds of support (invalid args)
@@ -207,18 +305,29 @@ def hamiltonian_monte_carlo_worker(n_iter: int, chain: int, L: int, eps: float,
         }
         stats.append(stat)
         
-        jsonStat = {
-            "iter": i,
-            "chain": chain,
-            "trace_current": {k: v.item() for k, v in stat["trace_current"].items()},
-            "log_prob_current": stat["log_prob_current"].item(),
-            "trace_proposed": {k: v.item() for k, v in stat["trace_proposed"].items()},
-            "log_prob_proposed": stat["log_prob_proposed"].item(),
-            "accepted": accepted,
-            "diverged": diverged,
-        }
-        # TODO: make API call here
-        requests.post('http://localhost:8484/trace', data=json.dumps(jsonStat, ignore_nan=True))
+        if telemetry:
+            with timer.phase("serialize"):
+                jsonStat = {
+                    "iter": i,
+                    "chain": chain,
+                    "trace_current": {k: v.item() for k, v in stat["trace_current"].items()},
+                    "log_prob_current": stat["log_prob_current"].item(),
+                    "trace_proposed": {k: v.item() for k, v in stat["trace_proposed"].items()},
+                    "log_prob_proposed": stat["log_prob_proposed"].item(),
+                    "accepted": accepted,
+                    "diverged": diverged,
+                }
+                if profile:
+                    # serialize and sink of this iteration are only known after posting, we stream those of previous iteration
+                    jsonStat["timings"] = streamed_timings(timer, timings_prev)
+                data = json.dumps(jsonStat, ignore_nan=True)
+            # TODO: make API call here
+            with timer.phase("sink"):
+                requests.post('http://localhost:8484/trace', data=data)
+
+        if profile:
+            stat["timings"] = timer.snapshot()
+            timings_prev = stat["timings"]
 
         # Store regardless of acceptance
         result.append(X_unconstrained_current)
@@ -235,7 +344,9 @@ import multiprocess
 # from multiprocessing import Pool
 
 class HMCPayload(object):
-    def __init__(self, seed: int,  n_iter: int, chain: int, L: int, eps: float, unconstrained: bool, model, args, kwargs) -> None:
+    def __init__(self, seed: int,  n_iter: int, chain: int, L: int, eps: float, unconstrained: bool, model, args, kwargs,
+                 X_init: Optional[torch.Tensor] = None, inv_mass: Optional[torch.Tensor] = None, enumerate_discrete: bool = False,
+                 profile: bool = False, telemetry: bool = True) -> None:
         self.n_iter = n_iter
         self.seed = seed
         self.chain = chain
@@ -245,33 +356,51 @@ class HMCPayload(object):
         self.model = model
         self.args = args
         self.kwargs = kwargs
+        self.X_init = X_init
+        self.inv_mass = inv_mass
+        self.enumerate_discrete = enumerate_discrete
+        self.profile = profile
+        self.telemetry = telemetry
 
 def exec_hmc_payload(payload: HMCPayload):
     torch.manual_seed(payload.seed)
-    return hamiltonian_monte_carlo_worker(payload.n_iter, payload.chain, payload.L, payload.eps, payload.unconstrained, payload.model, *payload.args, **payload.kwargs)
+    return hamiltonian_monte_carlo_worker(payload.n_iter, payload.chain, payload.L, payload.eps, payload.unconstrained, payload.model, *payload.args,
+                                          X_init=payload.X_init, inv_mass=payload.inv_mass, enumerate_discrete=payload.enumerate_discrete, profile=payload.profile, telemetry=payload.telemetry, **payload.kwargs)
 
 
-def hamiltonian_monte_carlo(n_iter: int, n_chains: int, L: int, eps: float, unconstrained: bool, model, *args, **kwargs):
+# enumerate_discrete: sum out discrete sites with small finite support such that models with discrete latents can be run with HMC
+# profile: record per phase timings in stats and trace stream, and print timing report per chain
+# telemetry: stream stats to debugger, disable to run without debugger (e.g. for benchmarks)
+def hamiltonian_monte_carlo(n_iter: int, n_chains: int, L: int, eps: float, unconstrained: bool, model, *args,
+                            init_strategy: str = "prior", enumerate_discrete: bool = False, profile: bool = False, telemetry: bool = True, **kwargs):
     assert n_chains > 0
 
-    requests.post('http://localhost:8484/start', json={
-        "method": "hmc",
-        "params": {
-            "totalIteration": n_iter,
-            "chains": n_chains,
-            "L": L,
-            "epsilon": eps
-        }
-    })
+    # initialisation runs once in parent process and is shared with all chains
+    X_inits, inv_mass = get_initial_positions(n_chains, unconstrained, init_strategy, model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
+    if X_inits is None:
+        X_inits = [None] * n_chains
+
+    if telemetry:
+        requests.post('http://localhost:8484/start', json={
+            "method": "hmc",
+            "params": {
+                "totalIteration": n_iter,
+                "chains": n_chains,
+                "L": L,
+                "epsilon": eps
+            }
+        })
 
     if n_chains == 1:
-        result, stats, retvals = hamiltonian_monte_carlo_worker(n_iter, 0, L, eps, unconstrained, model, *args, **kwargs)
-        print(f"HMC acceptance ratio:", sum(stat["accepted"] for stat in stats[0]) / n_iter)
+        result, stats, retvals = hamiltonian_monte_carlo_worker(n_iter, 0, L, eps, unconstrained, model, *args, X_init=X_inits[0], inv_mass=inv_mass, enumerate_discrete=enumerate_discrete, profile=profile, telemetry=telemetry, **kwargs)
+        print(f"HMC acceptance ratio:", sum(stat["accepted"] for stat in stats) / n_iter)
+        if profile:
+            print_timing_report("HMC", timing_report(stats))
         return [result], [stats], [retvals]
     else:
         p = multiprocess.Pool(n_chains)
         seeds = torch.randint(0, 2**16-1, (n_chains,)).tolist()
-        payloads = [HMCPayload(seeds[chain], n_iter, chain, L, eps, unconstrained, model, args, kwargs) for chain in range(n_chains)]
+        payloads = [HMCPayload(seeds[chain], n_iter, chain, L, eps, unconstrained, model, args, kwargs, X_inits[chain], inv_mass, enumerate_discrete, profile, telemetry) for chain in range(n_chains)]
         with p:
             pmap_result = p.map(exec_hmc_payload, payloads)
             results = [r[0] for r in pmap_result]
@@ -279,4 +408,6 @@ def hamiltonian_monte_carlo(n_iter: int, n_chains: int, L: int, eps: float, unco
             retvals = [r[2] for r in pmap_result]
             for chain in range(n_chains):
                 print(f"HMC-Chain-{chain} acceptance ratio:", sum(stat["accepted"] for stat in stats[chain]) / n_iter)
+                if profile:
+                    print_timing_report(f"HMC-Chain-{chain}", timing_report(stats[chain]))
             return results, stats, retvals
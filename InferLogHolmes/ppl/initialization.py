@@ -0,0 +1,81 @@
+import torch
+from typing import List
+
+# "prior":   constrained chains start at prior means, unconstrained chains at zero (LMH: prior draw)
+# "map":     all chains start at the mode of the (unconstrained) log joint
+# "laplace": chains start at overdispersed draws of a Laplace approximation around the mode,
+#            and the diagonal of the Laplace covariance is used as inverse mass matrix for HMC
+INIT_STRATEGIES = ("prior", "map", "laplace")
+
+def _potential(logjoint):
+    def U(X: torch.Tensor) -> torch.Tensor:
+        log_prob, _, _ = logjoint(X)
+        return -log_prob
+    return U
+
+def _is_valid_position(logjoint, X: torch.Tensor) -> bool:
+    try:
+        log_prob, _, _ = logjoint(X)
+    except ValueError:
+        # out of support (invalid args)
+        return False
+    return bool(torch.isfinite(log_prob).all())
+
+def find_map(logjoint, X: torch.Tensor, n_steps: int = 100, optimizer: str = "lbfgs", lr: float = None) -> torch.Tensor:
+    U = _potential(logjoint)
+    X_init = X.detach().clone()
+    X = X_init.clone().requires_grad_(True)
+
+    if optimizer == "lbfgs":
+        opt = torch.optim.LBFGS([X], lr=1. if lr is None else lr, max_iter=n_steps, line_search_fn="strong_wolfe")
+    elif optimizer == "adam":
+        opt = torch.optim.Adam([X], lr=0.05 if lr is None else lr)
+    else:
+        raise ValueError(f"Unknown optimizer {optimizer}.")
+
+    def closure():
+        opt.zero_grad()
+        loss = U(X)
+        loss.backward()
+        return loss
+
+    try:
+        if optimizer == "lbfgs":
+            opt.step(closure)
+        else:
+            for _ in range(n_steps):
+                opt.step(closure)
+    except ValueError:
+        # optimizer stepped out of bounds of support
+        pass
+
+    X_map = X.detach()
+    if not (torch.isfinite(X_map).all() and _is_valid_position(logjoint, X_map)):
+        # optimization diverged, fall back to initial point
+        return X_init
+    return X_map
+
+def laplace_approximation(logjoint, X_map: torch.Tensor, min_curvature: float = 1e-6) -> torch.Tensor:
+    # Gaussian approximation N(X_map, H^{-1}) where H is the Hessian of the potential at the mode
+    H = torch.autograd.functional.hessian(_potential(logjoint), X_map.detach())
+    H = (H + H.T) / 2
+    L, info = torch.linalg.cholesky_ex(H)
+    if info == 0:
+        return torch.cholesky_inverse(L)
+    # Hessian is not positive definite (e.g. optimization did not converge), use diagonal approximation
+    return torch.diag(1 / H.diagonal().abs().clamp_min(min_curvature))
+
+def overdispersed_positions(logjoint, X_map: torch.Tensor, cov: torch.Tensor, n_chains: int, overdispersion: float = 2., max_retries: int = 10) -> List[torch.Tensor]:
+    scale_tril = torch.linalg.cholesky(cov)
+    positions = []
+    for _ in range(n_chains):
+        X = X_map + overdispersion * scale_tril @ torch.randn(X_map.shape)
+        for _ in range(max_retries):
+            if _is_valid_position(logjoint, X):
+                break
+            # shrink towards mode until we are inside of support
+            X = X_map + (X - X_map) / 2
+        else:
+            X = X_map.clone()
+        positions.append(X)
+    return positions
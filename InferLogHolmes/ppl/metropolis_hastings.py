@@ -1,4 +1,7 @@
 from .core import SampleContext
+from .hmc import get_initial_positions, UnconstrainedLogJoint
+from .enumeration import Enumerator, EnumerationError
+from .profiling import PhaseTimer, streamed_timings, timing_report, print_timing_report
 from collections import namedtuple
 from abc import ABC, abstractmethod
 import torch
@@ -43,9 +46,10 @@ TraceEntry = namedtuple("TraceEntry", ["value", "log_prob"])
 ProposalDict = NewType('ProposalDict', Dict[str, Union[ProposalDistribution, Callable[[torch.Tensor], dist.Distribution]]])
 
 class LMH(SampleContext):
-    def __init__(self, proposals: ProposalDict = {}) -> None:
+    def __init__(self, proposals: ProposalDict = {}, enumerator: Optional[Enumerator] = None) -> None:
         super().__init__()
         self.proposals = proposals
+        self.enumerator = enumerator
         self.trace_current = {}
         self.resample_addresses = {}
         
@@ -55,9 +59,26 @@ class LMH(SampleContext):
 
     def sample(self, address: str, distribution: dist.Distribution, observed: Optional[torch.Tensor] = None):
         if observed is not None:
-            self.log_prob += distribution.log_prob(observed).sum()
+            if self.enumerator is not None:
+                # data dimensions are summed by enumerator after broadcasting with enumerated values
+                self.enumerator.add_log_prob(distribution.log_prob(observed))
+            else:
+                self.log_prob += distribution.log_prob(observed).sum()
             return observed
 
+        if self.enumerator is not None and self.enumerator.is_enumerable(distribution):
+            # summed out exactly, is not part of trace and never proposed
+            value = self.enumerator.enumerate_support(address, distribution)
+            self.enumerator.add_log_prob(distribution.log_prob(value))
+            return value
+
+        if self.enumerator is not None:
+            # a proposed value would be one value per enumerated value instead of one shared value
+            dependencies = self.enumerator.get_enumerated_dependencies(address, distribution)
+            if len(dependencies) > 0:
+                enumerated = ", ".join(self.enumerator.addresses[j] for j in dependencies)
+                raise EnumerationError(f"Cannot sample {address} with LMH and enumerate_discrete: its distribution depends on the enumerated sites {enumerated}.")
+
         if address in self.resample_addresses:
             current_value = self.trace_current[address].value
             proposal = self.proposals.get(address, UnconditionalProposal(distribution))
@@ -84,7 +105,10 @@ class LMH(SampleContext):
             value = self.trace_current[address].value
         
         log_prob = distribution.log_prob(value)
-        self.log_prob += log_prob
+        if self.enumerator is not None:
+            self.enumerator.add_log_prob(log_prob)
+        else:
+            self.log_prob += log_prob
         
         # store sampled value and log probability
         self.trace_proposed[address] = TraceEntry(value, log_prob)
@@ -92,29 +116,51 @@ class LMH(SampleContext):
         return value
 
 
-def metropolis_hastings_worker(n_iter: int, chain: int, proposals: Union[ProposalDict, List[ProposalDict]], model, *args, **kwargs):
+# Returns an initial trace (address -> constrained value) per chain, or None for the default prior initialisation.
+def get_initial_traces(n_chains: int, init_strategy: str, model, *args, enumerate_discrete: bool = False, **kwargs):
+    if init_strategy == "prior":
+        return None
+    X_inits, _ = get_initial_positions(n_chains, True, init_strategy, model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
+    logjoint = UnconstrainedLogJoint(model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
+    traces = []
+    for X in X_inits:
+        _, _, X_constrained = logjoint(X)
+        traces.append({addr: entry.value for addr, entry in X_constrained.items()})
+    return traces
+
+def metropolis_hastings_worker(n_iter: int, chain: int, proposals: Union[ProposalDict, List[ProposalDict]], model, *args,
+                               trace_init: Optional[Dict[str, torch.Tensor]] = None, enumerate_discrete: bool = False, profile: bool = False, telemetry: bool = True, **kwargs):
     result = []
     stats = []
     retvals = []
-    ctx = LMH()
+    ctx = LMH(enumerator=Enumerator() if enumerate_discrete else None)
 
     do_block_updates = isinstance(proposals, List)
 
+    if trace_init is not None:
+        # warm start computed by parent process, values are reused by LMH.sample instead of drawing from prior
+        ctx.trace_current = {addr: TraceEntry(value, None) for addr, value in trace_init.items()}
+
     # Initialise
     with ctx:
         retval_current    = model(*args, **kwargs)
         trace_current     = ctx.trace_proposed
-        log_prob_current  = ctx.log_prob
+        log_prob_current  = ctx.log_prob if ctx.enumerator is None else ctx.enumerator.log_prob()
         addresses_current = list(trace_current.keys())
 
     n_accept = 0
+    timer = PhaseTimer(enabled=profile)
+    timings_prev = None
 
     for i in tqdm(range(n_iter), desc=f"LMH-Chain-{chain}", position=chain):
+        timer.reset()
         # Reset
         ctx.log_prob = torch.tensor(0.)
         ctx.Q_resample_address = torch.tensor(0.0)
         ctx.trace_current = trace_current
         ctx.trace_proposed = {}
+        if enumerate_discrete:
+            ctx.enumerator = Enumerator()
         
         if do_block_updates:
             # Pick random block
@@ -131,34 +177,36 @@ def metropolis_hastings_worker(n_iter: int, chain: int, proposals: Union[Proposa
         # - resample at resample_address
         # - sample at new addresses
         try:
-            with ctx:
+            with timer.phase("model"), ctx:
+                timer.count_model_eval()
                 retval_proposed    = model(*args, **kwargs)
-                log_prob_proposed  = ctx.log_prob
+                log_prob_proposed  = ctx.log_prob if ctx.enumerator is None else ctx.enumerator.log_prob()
                 trace_proposed     = ctx.trace_proposed
                 addresses_proposed = list(trace_proposed.keys())
 
-            # Compute acceptance probability
-            log_alpha = torch.log(torch.tensor(len(trace_current) / len(trace_proposed)))
-            log_alpha += log_prob_proposed - log_prob_current
-            log_alpha += ctx.Q_resample_address
-
-            for address, entry in trace_current.items():
-                if address not in trace_proposed:
-                    log_alpha += entry.log_prob
-            for address, entry in trace_proposed.items():
-                if address not in trace_current:
-                    log_alpha -= entry.log_prob
-
-            # Accept with probability alpha
-            accepted = False
-            if dist.Uniform(0.,1.).sample().log() < log_alpha:
-                n_accept += 1
-                accepted = True
-                retval_current    = retval_proposed
-                trace_current     = trace_proposed
-                addresses_current = addresses_proposed
-                log_prob_current  = log_prob_proposed
-            diverged = log_prob_proposed.isnan().item() or log_prob_proposed.isinf().item()
+            with timer.phase("accept"):
+                # Compute acceptance probability
+                log_alpha = torch.log(torch.tensor(len(trace_current) / len(trace_proposed)))
+                log_alpha += log_prob_proposed - log_prob_current
+                log_alpha += ctx.Q_resample_address
+
+                for address, entry in trace_current.items():
+                    if address not in trace_proposed:
+                        log_alpha += entry.log_prob
+                for address, entry in trace_proposed.items():
+                    if address not in trace_current:
+                        log_alpha -= entry.log_prob
+
+                # Accept with probability alpha
+                accepted = False
+                if dist.Uniform(0.,1.).sample().log() < log_alpha:
+                    n_accept += 1
+                    accepted = True
+                    retval_current    = retval_proposed
+                    trace_current     = trace_proposed
+                    addresses_current = addresses_proposed
+                    log_prob_current  = log_prob_proposed
+                diverged = log_prob_proposed.isnan().item() or log_prob_proposed.isinf().item()
 
         except ValueError:
             # stepped out of bounds of support (invalid args)
@@ -186,19 +234,30 @@ def metropolis_hastings_worker(n_iter: int, chain: int, proposals: Union[Proposa
         # print()
         # print()
         
-        jsonStat = {
-            "iter": i,
-            "chain": chain,
-            "trace_current": {k: v.item() for k, v in stat["trace_current"].items()},
-            "log_prob_current": stat["log_prob_current"].item(),
-            "trace_proposed": {k: v.item() for k, v in stat["trace_proposed"].items()},
-            "log_prob_proposed": stat["log_prob_proposed"].item(),
-            "accepted": accepted,
-            "diverged": diverged,
-            "resample_addresses": list(ctx.resample_addresses)
-        }
-        # TODO: make API call here
-        requests.post('http://localhost:8484/trace', data=json.dumps(jsonStat, ignore_nan=True))
+        if telemetry:
+            with timer.phase("serialize"):
+                jsonStat = {
+                    "iter": i,
+                    "chain": chain,
+                    "trace_current": {k: v.item() for k, v in stat["trace_current"].items()},
+                    "log_prob_current": stat["log_prob_current"].item(),
+                    "trace_proposed": {k: v.item() for k, v in stat["trace_proposed"].items()},
+                    "log_prob_proposed": stat["log_prob_proposed"].item(),
+                    "accepted": accepted,
+                    "diverged": diverged,
+                    "resample_addresses": list(ctx.resample_addresses)
+                }
+                if profile:
+                    # serialize and sink of this iteration are only known after posting, we stream those of previous iteration
+                    jsonStat["timings"] = streamed_timings(timer, timings_prev)
+                data = json.dumps(jsonStat, ignore_nan=True)
+            # TODO: make API call here
+            with timer.phase("sink"):
+                requests.post('http://localhost:8484/trace', data=data)
+
+        if profile:
+            stat["timings"] = timer.snapshot()
+            timings_prev = stat["timings"]
 
         # Store regardless of acceptance
         result.append(trace_current)
@@ -215,7 +274,9 @@ import multiprocess
 # from multiprocessing import Pool
 
 class MetropolisHastingsPayload(object):
-    def __init__(self, seed: int,  n_iter: int, chain: int, proposals: Union[ProposalDict, List[ProposalDict]], model, args, kwargs) -> None:
+    def __init__(self, seed: int,  n_iter: int, chain: int, proposals: Union[ProposalDict, List[ProposalDict]], model, args, kwargs,
+                 trace_init: Optional[Dict[str, torch.Tensor]] = None, enumerate_discrete: bool = False,
+                 profile: bool = False, telemetry: bool = True) -> None:
         self.n_iter = n_iter
         self.seed = seed
         self.chain = chain
@@ -223,33 +284,51 @@ class MetropolisHastingsPayload(object):
         self.model = model
         self.args = args
         self.kwargs = kwargs
+        self.trace_init = trace_init
+        self.enumerate_discrete = enumerate_discrete
+        self.profile = profile
+        self.telemetry = telemetry
 
 def exec_metropolis_hastings_payload(payload: MetropolisHastingsPayload):
     torch.manual_seed(payload.seed)
-    return metropolis_hastings_worker(payload.n_iter, payload.chain, payload.proposals, payload.model, *payload.args, **payload.kwargs)
-
-def metropolis_hastings(n_iter: int, n_chains: int, proposals: Union[ProposalDict, List[ProposalDict]], model, *args, **kwargs):
+    return metropolis_hastings_worker(payload.n_iter, payload.chain, payload.proposals, payload.model, *payload.args,
+                                      trace_init=payload.trace_init, enumerate_discrete=payload.enumerate_discrete, profile=payload.profile, telemetry=payload.telemetry, **payload.kwargs)
+
+# init_strategy "map" and "laplace" require a model with a fixed set of continuous addresses (see get_initial_positions)
+# enumerate_discrete: sum out discrete sites with small finite support instead of proposing them (see Enumerator)
+# profile: record per phase timings in stats and trace stream, and print timing report per chain
+# telemetry: stream stats to debugger, disable to run without debugger (e.g. for benchmarks)
+def metropolis_hastings(n_iter: int, n_chains: int, proposals: Union[ProposalDict, List[ProposalDict]], model, *args,
+                        init_strategy: str = "prior", enumerate_discrete: bool = False, profile: bool = False, telemetry: bool = True, **kwargs):
     assert n_chains > 0
 
+    # initialisation runs once in parent process and is shared with all chains
+    trace_inits = get_initial_traces(n_chains, init_strategy, model, *args, enumerate_discrete=enumerate_discrete, **kwargs)
+    if trace_inits is None:
+        trace_inits = [None] * n_chains
+
     do_block_updates = isinstance(proposals, List)
 
-    requests.post('http://localhost:8484/start', json={
-        "method": "metropolis_hastings",
-        "params": {
-            "totalIteration": n_iter,
-            "chains": n_chains,
-            "blockUpdates": do_block_updates
-        }
-    })
+    if telemetry:
+        requests.post('http://localhost:8484/start', json={
+            "method": "metropolis_hastings",
+            "params": {
+                "totalIteration": n_iter,
+                "chains": n_chains,
+                "blockUpdates": do_block_updates
+            }
+        })
 
     if n_chains == 1:
-        result, stats, retvals = metropolis_hastings_worker(n_iter, 0, proposals, model, *args, **kwargs)
-        print(f"LMH acceptance ratio:", sum(stat["accepted"] for stat in stats[0]) / n_iter)
+        result, stats, retvals = metropolis_hastings_worker(n_iter, 0, proposals, model, *args, trace_init=trace_inits[0], enumerate_discrete=enumerate_discrete, profile=profile, telemetry=telemetry, **kwargs)
+        print(f"LMH acceptance ratio:", sum(stat["accepted"] for stat in stats) / n_iter)
+        if profile:
+            print_timing_report("LMH", timing_report(stats))
         return [result], [stats], [retvals]
     else:
         p = multiprocess.Pool(n_chains)
         seeds = torch.randint(0, 2**16-1, (n_chains,)).tolist()
-        payloads = [MetropolisHastingsPayload(seeds[chain], n_iter, chain, proposals, model, args, kwargs) for chain in range(n_chains)]
+        payloads = [MetropolisHastingsPayload(seeds[chain], n_iter, chain, proposals, model, args, kwargs, trace_inits[chain], enumerate_discrete, profile, telemetry) for chain in range(n_chains)]
         with p:
             pmap_result = p.map(exec_metropolis_hastings_payload, payloads)
             results = [r[0] for r in pmap_result]
@@ -257,4 +336,6 @@ def metropolis_hastings(n_iter: int, n_chains: int, proposals: Union[ProposalDic
             retvals = [r[2] for r in pmap_result]
             for chain in range(n_chains):
                 print(f"LMH-Chain-{chain} acceptance ratio:", sum(stat["accepted"] for stat in stats[chain]) / n_iter)
+                if profile:
+                    print_timing_report(f"LMH-Chain-{chain}", timing_report(stats[chain]))
             return results, stats, retvals
@@ -0,0 +1,73 @@
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+
+# Phases of a sampler iteration, timed with a monotonic clock (seconds):
+# "model":     executions of the model / log joint (for LMH this includes proposal construction)
+# "backward":  gradient computation (HMC only)
+# "accept":    computation of acceptance probability and accept/reject step
+# "serialize": conversion of stat to json
+# "sink":      telemetry request to debugger
+PHASES = ("model", "backward", "accept", "serialize", "sink")
+
+class PhaseTimer:
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.timings = {phase: 0. for phase in PHASES}
+        self.model_evals = 0
+        self.t_start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - t0
+
+    def count_model_eval(self, n: int = 1):
+        self.model_evals += n
+
+    def snapshot(self) -> Dict[str, float]:
+        # timings of iteration since last reset, "other" is time not covered by any phase
+        total = time.perf_counter() - self.t_start
+        return {
+            **self.timings,
+            "other": max(total - sum(self.timings.values()), 0.),
+            "total": total,
+            "model_evals": self.model_evals
+        }
+
+def streamed_timings(timer: PhaseTimer, timings_prev: Optional[Dict[str, float]]) -> Dict[str, float]:
+    # called during serialization, so serialize and sink phases are taken from previous iteration
+    timings = timer.snapshot()
+    for phase in ("serialize", "sink"):
+        timings[phase] = timings_prev[phase] if timings_prev is not None else 0.
+    # "other" is time outside of the phases so far, the total is adjusted such that phases and other add up
+    timings["total"] = sum(timings[phase] for phase in PHASES) + timings["other"]
+    return timings
+
+def timing_report(stats: List[dict]) -> Dict[str, float]:
+    timings = [stat["timings"] for stat in stats if "timings" in stat]
+    if len(timings) == 0:
+        return {}
+    keys = PHASES + ("other", "total", "model_evals")
+    report = {key: sum(t[key] for t in timings) for key in keys}
+    report["n_iter"] = len(timings)
+    report["model_evals_per_iter"] = report["model_evals"] / len(timings)
+    return report
+
+def print_timing_report(name: str, report: Dict[str, float]):
+    if len(report) == 0:
+        return
+    total = report["total"]
+    print(f"{name} timing ({report['n_iter']} iterations, {total:.3f}s, {report['model_evals_per_iter']:.1f} model evals/iter):")
+    for phase in PHASES + ("other",):
+        fraction = report[phase] / total if total > 0 else 0.
+        print(f"  {phase:<10} {report[phase]:>9.3f}s {100*fraction:>6.1f}%")
@@ -1,2 +1,4 @@
-from .debugger_backend import DebuggerBackend
-from .debug import *
\ No newline at end of file
+from .debugger_backend import DebuggerBackend, load_trace
+from .debug import *
+from .cache import clear_cache
+from .replay import load
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""Cache of compiled step methods across repeated ``debug`` calls.
+
+Re-running a ``#%%`` cell creates a new model object, so PyMC recompiles the logp/dlogp
+functions of the step methods and the trace function on every call. Models are identified
+by a structural hash of their graph (including constant and shared data values) and step
+methods by a hash of their configuration. On a cache hit, ``debug`` samples the cached model
+with the cached, already compiled step methods, which are bound to the value variables of
+that model.
+"""
+
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+import pytensor
+
+from pytensor.compile.sharedvalue import SharedVariable
+from pytensor.graph.basic import Constant, ancestors
+from pymc.model import Model
+from pymc.step_methods.compound import CompoundStep
+from pymc.step_methods.hmc.base_hmc import BaseHMC
+from pymc.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+from pymc.step_methods.step_sizes import DualAverageAdaptation
+
+MAX_CACHE_ENTRIES = 8
+
+
+class AdaptationState:
+    """Running mean and variance of the unconstrained draws after tuning and the last step size.
+
+    Shared by all chains of a ``DebuggerBackend`` and used to warm start the mass matrix and step
+    size of a cached HMC/NUTS step.
+    """
+
+    def __init__(self):
+        self.var_names = None  # order of the variables in the mass matrix of the step
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self.step_size = None
+
+    def update(self, point: dict[str, np.ndarray], sampler_stats) -> None:
+        if self.var_names is None or sampler_stats is None or len(sampler_stats) != 1:
+            return
+        if sampler_stats[0].get("tune", True):
+            return
+        x = np.concatenate([np.ravel(point[name]) for name in self.var_names]).astype(float)
+        if self.mean is None:
+            self.mean = np.zeros_like(x)
+            self.m2 = np.zeros_like(x)
+        # Welford update
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if "step_size" in sampler_stats[0]:
+            self.step_size = float(sampler_stats[0]["step_size"])
+
+    def variance(self) -> np.ndarray | None:
+        if self.n < 2:
+            return None
+        return self.m2 / (self.n - 1)
+
+
+@dataclass
+class CacheEntry:
+    model: Model
+    step: Any
+    trace_fn: Any = None
+    var_shapes: dict | None = None
+    var_dtypes: dict | None = None
+    initial_points: list | None = None
+    adaptation: AdaptationState = field(default_factory=AdaptationState)
+
+
+_CACHE: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+
+def _hash_value(h, value) -> None:
+    value = np.asarray(value)
+    h.update(str((value.dtype, value.shape)).encode())
+    h.update(np.ascontiguousarray(value).tobytes())
+
+
+def model_hash(model: Model) -> str:
+    """Hash of the model graph, variable names, transforms and all constant and shared data values."""
+    h = hashlib.sha256()
+    outputs = [
+        *model.basic_RVs,
+        *model.deterministics,
+        *model.potentials,
+        *(model.rvs_to_values[rv] for rv in model.observed_RVs),
+    ]
+    h.update(str([var.name for var in outputs]).encode())
+    h.update(str([(rv.name, type(model.rvs_to_transforms.get(rv)).__name__) for rv in model.free_RVs]).encode())
+    h.update(pytensor.dprint(outputs, file="str", print_type=True, id_type="auto").encode())
+    for var in ancestors(outputs):
+        if isinstance(var, SharedVariable):
+            _hash_value(h, var.get_value(borrow=True))
+        elif isinstance(var, Constant):
+            _hash_value(h, var.data)
+    return h.hexdigest()
+
+
+def _step_config(step) -> list:
+    if isinstance(step, list | tuple):
+        return [_step_config(s) for s in step]
+    if isinstance(step, CompoundStep):
+        return [_step_config(s) for s in step.methods]
+    config = [type(step).__name__, [var.name for var in getattr(step, "vars", [])]]
+    for key, value in sorted(vars(step).items()):
+        if key.startswith("_") or key == "rng":
+            continue
+        if isinstance(value, bool | int | float | str | type(None)):
+            config.append((key, value))
+        elif isinstance(value, np.ndarray) and value.size <= 1024:
+            config.append((key, value.dtype.str, value.shape, value.tobytes().hex()))
+        else:
+            config.append((key, type(value).__name__))
+    return config
+
+
+def seed_key(random_seed) -> Any:
+    """Value of ``random_seed`` that is stable across re-runs, or ``None`` if there is none.
+
+    The repr of a ``Generator`` contains its address, its bit generator state is used instead.
+    """
+    if random_seed is None:
+        return "none"
+    if isinstance(random_seed, int | np.integer):
+        return int(random_seed)
+    if isinstance(random_seed, np.random.Generator):
+        return repr(random_seed.bit_generator.state)
+    if isinstance(random_seed, list | tuple) and all(isinstance(s, int | np.integer) for s in random_seed):
+        return tuple(int(s) for s in random_seed)
+    return None
+
+
+def cache_key(model: Model, step, **config) -> str:
+    """Key of a ``debug`` call, ``step`` must be freshly constructed (not yet used for sampling)."""
+    h = hashlib.sha256(model_hash(model).encode())
+    h.update(repr(_step_config(step) if step is not None else "auto").encode())
+    h.update(repr(sorted((k, repr(v)) for k, v in config.items())).encode())
+    return h.hexdigest()
+
+
+def get_entry(key: str) -> CacheEntry | None:
+    entry = _CACHE.get(key)
+    if entry is not None:
+        _CACHE.move_to_end(key)
+    return entry
+
+
+def put_entry(key: str, entry: CacheEntry) -> None:
+    _CACHE[key] = entry
+    _CACHE.move_to_end(key)
+    while len(_CACHE) > MAX_CACHE_ENTRIES:
+        _CACHE.popitem(last=False)
+
+
+def drop_entry(key: str) -> None:
+    _CACHE.pop(key, None)
+
+
+def clear_cache() -> None:
+    """Drop all cached models and step methods."""
+    _CACHE.clear()
+
+
+def apply_adaptation(step, adaptation: AdaptationState) -> bool:
+    """Warm start mass matrix and step size of a single HMC/NUTS step with the state of the last run.
+
+    ``pm.sample`` resets tuning at the start of sampling, so the adapted values are installed as
+    initial values of the adaptation. Returns whether the state was applied.
+    """
+    var = adaptation.variance()
+    if not isinstance(step, BaseHMC) or var is None:
+        return False
+    if not isinstance(step.potential, QuadPotentialDiagAdapt) or len(var) != step.potential._n:
+        return False
+    step.potential = QuadPotentialDiagAdapt(
+        len(var),
+        adaptation.mean.astype(step.potential.dtype),
+        initial_diag=var.astype(step.potential.dtype),
+        initial_weight=10,
+        dtype=step.potential.dtype,
+    )
+    if step.adapt_step_size and adaptation.step_size is not None:
+        adapt = step.step_adapt
+        step.step_size = adaptation.step_size
+        step.step_adapt = DualAverageAdaptation(
+            adaptation.step_size,
+            step.target_accept,
+            getattr(adapt, "_gamma", 0.05),
+            getattr(adapt, "_k", 0.75),
+            getattr(adapt, "_t0", 10),
+        )
+    return True
@@ -16,6 +16,7 @@
 
 import sys
 import os
+import warnings
 
 from collections.abc import Sequence
 from typing import (
@@ -32,13 +33,30 @@ import pymc as pm
 from pymc.backends import TraceOrBackend
 from pymc.backends.base import MultiTrace
 from pymc.initial_point import StartDict
-from pymc.model import Model
+from pymc.model import Model, modelcontext
+from pymc.step_methods.hmc.base_hmc import BaseHMC
 from pymc.util import (
     RandomState,
+    _get_seeds_per_chain,
     default_progress_theme,
 )
-
+from pymc.vartypes import continuous_types
+
+from pymcdebug.cache import (
+    AdaptationState,
+    CacheEntry,
+    apply_adaptation,
+    cache_key,
+    drop_entry,
+    get_entry,
+    put_entry,
+    seed_key,
+)
 from pymcdebug.debugger_backend import DebuggerBackend
+from pymcdebug.diagnostics import DiagnosticsEngine
+from pymcdebug.model_graph import extract_model_graph
+from pymcdebug.streaming import stream_external_sampler
+from pymcdebug.telemetry import TraceSink, post_end
 import requests
 
 
@@ -70,6 +88,18 @@ def debug(
     mp_ctx=None,
     blas_cores: int | None | Literal["auto"] = "auto",
     compile_kwargs: dict | None = None,
+    cache: bool = True,
+    cold_start: bool = False,
+    reuse_adaptation: bool = False,
+    storage_dir: str | None = None,
+    chunk_size: int = 1024,
+    stream_interval: float = 1.0,
+    stream_chunk_size: int = 100,
+    telemetry_batch_size: int = 256,
+    telemetry_interval: float = 0.5,
+    diagnostics_every: int | None = None,
+    stream: str | int = "all",
+    send_model_graph: bool = False,
     **kwargs,
 ) -> InferenceData: ...
 
@@ -103,6 +133,18 @@ def debug(
     model: Model | None = None,
     blas_cores: int | None | Literal["auto"] = "auto",
     compile_kwargs: dict | None = None,
+    cache: bool = True,
+    cold_start: bool = False,
+    reuse_adaptation: bool = False,
+    storage_dir: str | None = None,
+    chunk_size: int = 1024,
+    stream_interval: float = 1.0,
+    stream_chunk_size: int = 100,
+    telemetry_batch_size: int = 256,
+    telemetry_interval: float = 0.5,
+    diagnostics_every: int | None = None,
+    stream: str | int = "all",
+    send_model_graph: bool = False,
     **kwargs,
 ) -> MultiTrace: ...
 
@@ -135,6 +177,18 @@ def debug(
     blas_cores: int | None | Literal["auto"] = "auto",
     model: Model | None = None,
     compile_kwargs: dict | None = None,
+    cache: bool = True,
+    cold_start: bool = False,
+    reuse_adaptation: bool = False,
+    storage_dir: str | None = None,
+    chunk_size: int = 1024,
+    stream_interval: float = 1.0,
+    stream_chunk_size: int = 100,
+    telemetry_batch_size: int = 256,
+    telemetry_interval: float = 0.5,
+    diagnostics_every: int | None = None,
+    stream: str | int = "all",
+    send_model_graph: bool = False,
     **kwargs,
 ) -> InferenceData | MultiTrace: # | ZarrTrace:
     r"""Draw samples from the posterior using the given step methods.
@@ -249,6 +303,48 @@ def debug(
         Model to sample from. The model needs to have free random variables.
     compile_kwargs: dict, optional
         Dictionary with keyword argument to pass to the functions compiled by the step methods.
+    cache : bool, default=True
+        Whether to reuse the compiled step methods and trace function of a previous call with a
+        structurally identical model and the same step configuration (see :mod:`pymcdebug.cache`).
+        On a cache hit the cached model is sampled. Steps that are assigned automatically (NUTS)
+        are not compiled at all on a hit, explicitly passed steps are replaced by their cached
+        counterpart.
+    cold_start : bool, default=False
+        Drop the cache entry of this call and compile everything again.
+    reuse_adaptation : bool, default=False
+        On a cache hit, start tuning of a single HMC/NUTS step from the mass matrix and step
+        size adapted in the previous call.
+    storage_dir : str, optional
+        Directory for chunked, memory-mapped storage of the draws instead of keeping them in
+        memory (see :mod:`pymcdebug.storage`). Draws of interrupted or crashed runs can be loaded
+        with :func:`pymcdebug.load_trace`.
+    chunk_size : int, default=1024
+        Number of draws per chunk file if ``storage_dir`` is given.
+    stream_interval : float, default=1.0
+        Seconds between polls of the partial trace if ``nuts_sampler="nutpie"``.
+    stream_chunk_size : int, default=100
+        Number of draws per sampling chunk if ``nuts_sampler`` is ``"numpyro"`` or ``"blackjax"``.
+        Draws of external samplers are streamed to the debugger after each poll or chunk
+        (see :mod:`pymcdebug.streaming`).
+    telemetry_batch_size : int, default=256
+        Maximum number of draws per request to the debugger. Draws of all chains are merged by
+        iteration and sent in batches (see :mod:`pymcdebug.telemetry`).
+    telemetry_interval : float, default=0.5
+        Seconds after which buffered draws are sent even if the batch is not full.
+    diagnostics_every : int, optional
+        Every ``diagnostics_every`` draws of a chain, a summary of incrementally computed
+        acceptance rate, moments, ESS and split R-hat is sent with the draw (see
+        :mod:`pymcdebug.diagnostics`). Off by default, the warnings of the debugger are still
+        computed from the streamed draws and do not use the summaries yet.
+    stream : str or int, default="all"
+        Draws that are sent to the debugger: ``"all"``, every k-th draw of a chain for an integer
+        ``k``, at most ``M`` draws per second and chain for ``"<M>/s"`` or ``"none"``. All draws
+        are still recorded in the returned trace. Divergent draws and draws carrying a diagnostics
+        summary are always sent.
+    send_model_graph : bool, default=False
+        Extract the model graph from the pytensor graph and send it with the start of the run
+        (see :mod:`pymcdebug.model_graph`). The extraction compiles a function, the debugger does
+        not use the graph yet and shows the graph of the static analysis of the model file.
 
 
     Returns
@@ -320,6 +416,12 @@ def debug(
         p  0.609  0.047   0.528    0.699
     """
 
+    # resolved as in pm.sample, the values are part of the /start payload and the cache key
+    if cores is None:
+        cores = min(4, os.cpu_count() or 1)
+    if chains is None:
+        chains = max(2, cores)
+
     alg = {}
 
     if isinstance(step, list):
@@ -378,42 +480,117 @@ def debug(
        
     file_path = os.path.abspath(sys.modules['__main__'].__file__)
 
+    model_graph = None
+    if send_model_graph:
+        try:
+            model_graph = extract_model_graph(modelcontext(model))
+        except Exception as e:
+            # the debugger falls back to static analysis of the model file
+            warnings.warn(f"Could not extract the model graph: {e}")
+
     js = {
         "ppl": "pymc",
         "filePath": file_path,
         "alg": alg,
         "totalIteration": draws + tune,
 	    "burnin": tune,
-	    "chains": chains
+	    "chains": chains,
+        "modelGraph": model_graph,
+        "endMessage": True,
     }
 
     requests.post('http://localhost:8484/start', json=js)
-    
-    return pm.sample(
-        draws=draws,
-        tune=tune,
-        chains=chains,
-        cores=cores,
-        random_seed=random_seed,
-        progressbar=progressbar,
-        progressbar_theme=progressbar_theme,
-        step=step,
-        var_names=var_names,
-        nuts_sampler=nuts_sampler,
-        initvals=initvals,
-        init=init,
-        jitter_max_retries=jitter_max_retries,
-        n_init=n_init,
-        trace=DebuggerBackend(),
-        discard_tuned_samples=discard_tuned_samples,
-        compute_convergence_checks=compute_convergence_checks,
-        keep_warning_stat=keep_warning_stat,
-        return_inferencedata=return_inferencedata,
-        idata_kwargs=idata_kwargs,
-        nuts_sampler_kwargs=nuts_sampler_kwargs,
-        callback=callback,
-        mp_ctx=mp_ctx,
-        blas_cores=blas_cores,
-        compile_kwargs=compile_kwargs,
-        **kwargs,
-    )
\ No newline at end of file
+
+    model = modelcontext(model)
+    # NUTS is initialised here if pm.sample would auto-assign it, the initial points depend on the seed
+    init_nuts = step is None and nuts_sampler == "pymc" and all(var.dtype in continuous_types for var in model.value_vars)
+    seed = seed_key(random_seed) if init_nuts else None
+    entry = None
+    if cache:
+        key = cache_key(
+            model, step,
+            nuts_sampler=nuts_sampler, init=init, chains=chains, cores=cores, random_seed=seed, initvals=initvals,
+            compile_kwargs=compile_kwargs, step_kwargs=kwargs,
+        )
+        if cold_start:
+            drop_entry(key)
+        entry = get_entry(key)
+        if entry is not None and reuse_adaptation:
+            apply_adaptation(entry.step, entry.adaptation)
+
+    if entry is None:
+        initial_points = None
+        if init_nuts:
+            # same as auto-assignment in pm.sample, but we keep the compiled NUTS step
+            initial_points, step = pm.init_nuts(
+                init=init,
+                chains=chains,
+                n_init=n_init,
+                model=model,
+                random_seed=_get_seeds_per_chain(random_seed, chains),
+                progressbar=progressbar,
+                jitter_max_retries=jitter_max_retries,
+                tune=tune,
+                initvals=initvals,
+                compile_kwargs=compile_kwargs,
+                **kwargs,
+            )
+        entry = CacheEntry(model=model, step=step, initial_points=initial_points)
+        if cache:
+            put_entry(key, entry)
+    elif init_nuts and seed is None:
+        # seed without a stable key (e.g. RandomState), pm.sample initialises the cached step with it
+        entry.initial_points = None
+
+    # statistics of this run for reuse_adaptation in the next call
+    entry.adaptation = AdaptationState()
+    if isinstance(entry.step, BaseHMC):
+        entry.adaptation.var_names = [var.name for var in entry.step.vars]
+
+    backend = DebuggerBackend(
+        model=entry.model,
+        fn=entry.trace_fn,
+        var_shapes=entry.var_shapes,
+        var_dtypes=entry.var_dtypes,
+        adaptation=entry.adaptation,
+        storage_dir=storage_dir,
+        chunk_size=chunk_size,
+        sink=TraceSink(batch_size=telemetry_batch_size, interval=telemetry_interval),
+        diagnostics=None if diagnostics_every is None else DiagnosticsEngine(every=diagnostics_every),
+        stream=stream,
+    )
+    entry.trace_fn, entry.var_shapes, entry.var_dtypes = backend.fn, backend.var_shapes, backend.var_dtypes
+
+    with stream_external_sampler(nuts_sampler, entry.model, tune, interval=stream_interval, chunk_size=stream_chunk_size):
+        result = pm.sample(
+            draws=draws,
+            tune=tune,
+            chains=chains,
+            cores=cores,
+            random_seed=random_seed,
+            progressbar=progressbar,
+            progressbar_theme=progressbar_theme,
+            step=entry.step,
+            var_names=var_names,
+            nuts_sampler=nuts_sampler,
+            initvals=initvals if entry.initial_points is None else entry.initial_points,
+            init=init,
+            jitter_max_retries=jitter_max_retries,
+            n_init=n_init,
+            trace=backend,
+            discard_tuned_samples=discard_tuned_samples,
+            compute_convergence_checks=compute_convergence_checks,
+            keep_warning_stat=keep_warning_stat,
+            return_inferencedata=return_inferencedata,
+            idata_kwargs=idata_kwargs,
+            nuts_sampler_kwargs=nuts_sampler_kwargs,
+            callback=callback,
+            mp_ctx=mp_ctx,
+            blas_cores=blas_cores,
+            compile_kwargs=compile_kwargs,
+            model=entry.model,
+            **kwargs,
+        )
+    # only after a successful run, the debugger cannot count the items of thinned or rate limited streams
+    post_end()
+    return result
@@ -17,6 +17,8 @@
 Store sampling values in memory as a NumPy array.
 """
 
+import os
+
 from typing import Any
 
 import numpy as np
@@ -24,8 +26,9 @@ import numpy as np
 from pymc.backends import base
 from pymc.backends.base import MultiTrace
 from pymc.model import Model, modelcontext
-import simplejson as json
-import requests
+
+from pymcdebug.storage import ChainStorage, is_chunked
+from pymcdebug.telemetry import StreamFilter, TraceSink
 
 
 class DebuggerBackend(base.BaseTrace):
@@ -40,10 +43,38 @@ class DebuggerBackend(base.BaseTrace):
     vars: list of variables
         Sampling values will be stored for these variables. If None,
         `model.unobserved_RVs` is used.
+    adaptation: AdaptationState
+        If given, draws after tuning are accumulated for warm starting
+        the next run (see :mod:`pymcdebug.cache`).
+    storage_dir: str
+        If given, samples and sampler stats are stored in chunked memory-mapped
+        files in ``storage_dir/chain-<chain>`` instead of in memory
+        (see :mod:`pymcdebug.storage`). Completed draws survive a crash of the
+        sampling process and can be loaded with :func:`load_trace`.
+    chunk_size: int
+        Number of draws per chunk file of the on-disk storage.
+    sink: TraceSink
+        Sink for the trace items sent to the debugger, shared by the chains. If None,
+        a new :class:`~pymcdebug.telemetry.TraceSink` is created.
+    diagnostics: DiagnosticsEngine
+        If given, running diagnostics are updated with every draw and their summaries
+        are sent with the draws (see :mod:`pymcdebug.diagnostics`).
+    stream: str or int
+        Draws that are sent to the debugger, see :class:`~pymcdebug.telemetry.StreamFilter`.
+        All draws are recorded regardless. Divergent draws and draws with a diagnostics
+        summary are always sent.
     """
 
-    def __init__(self, name=None, model=None, vars=None, test_point=None, **kwargs):
+    def __init__(self, name=None, model=None, vars=None, test_point=None, adaptation=None, storage_dir=None, chunk_size=1024, sink=None, diagnostics=None, stream="all", **kwargs):
         super().__init__(name, model, vars, test_point, **kwargs)
+        self.adaptation = adaptation
+        # pm.sample shallow-copies the backend per chain, so all chains share the sink
+        self.sink = TraceSink() if sink is None else sink
+        self.diagnostics = diagnostics
+        self.stream = StreamFilter(stream)
+        self.storage_dir = storage_dir
+        self.chunk_size = chunk_size
+        self.storage = None
         self.draw_idx = 0
         self.draws = None
         self.samples = {}
@@ -66,7 +97,23 @@ class DebuggerBackend(base.BaseTrace):
         """
         super().setup(draws, chain, sampler_vars)
 
+        if self.draws is None:
+            # pm.sample sets up a shallow copy of the backend per chain, they must not share storage
+            self.samples = {}
+            self._stats = None
+
         self.chain = chain
+        self.sink.open_chain(chain)
+        if self.storage_dir is not None:
+            if self.storage is None:
+                self.storage = ChainStorage(os.path.join(self.storage_dir, f"chain-{chain}"), self.chunk_size)
+                self.samples, self._stats = self.storage.create(self.var_shapes, self.var_dtypes, sampler_vars)
+                self.draws = draws
+            else:  # chunks grow on demand, extending a chain does not copy
+                self.draw_idx = len(self)
+                self.draws = self.draw_idx + draws
+            return
+
         if self.samples:  # Concatenate new array if chain is already present.
             old_draws = len(self)
             self.draws = old_draws + draws
@@ -112,20 +159,31 @@ class DebuggerBackend(base.BaseTrace):
         for varname, value in zip(self.varnames, self.fn(*point.values())):
             samples[varname][draw_idx] = value
 
-        # TODO: proposed needs fixing
-        # TODO: resample_addresses
-        jsonStat = {
-            "iter": draw_idx,
-            "chain": self.chain,
-            "trace_current": {k: v.tolist() if v.ndim == 0 else v.tolist() for k, v in point.items()},
-            "log_prob_current": sampler_stats[0]["model_logp"].tolist() if "model_logp" in sampler_stats[0] else None,
-            "trace_proposed": {k: v.tolist() if v.ndim == 0 else v.tolist() for k, v in point.items()},
-            "log_prob_proposed": sampler_stats[0]["model_logp"].tolist() if "model_logp" in sampler_stats[0] else None,
-            "accepted": sampler_stats[0]["accepted"] if len(sampler_stats) == 1 and "accepted" in sampler_stats[0] else [s["accepted"] if "accepted" in s else False for s in sampler_stats],
-            "diverged": sampler_stats[0]["diverging"] if "diverging" in sampler_stats[0] else None,
-        }
-
-        requests.post('http://localhost:8484/trace', data=json.dumps(jsonStat, ignore_nan=True))
+        summary = None
+        if self.diagnostics is not None:
+            summary = self.diagnostics.update(self.chain, point, sampler_stats)
+        diverged = sampler_stats[0]["diverging"] if "diverging" in sampler_stats[0] else None
+
+        if summary is not None or diverged or self.stream(self.chain, draw_idx):
+            # TODO: proposed needs fixing
+            # TODO: resample_addresses
+            jsonStat = {
+                "iter": draw_idx,
+                "chain": self.chain,
+                "trace_current": {k: v.tolist() if v.ndim == 0 else v.tolist() for k, v in point.items()},
+                "log_prob_current": sampler_stats[0]["model_logp"].tolist() if "model_logp" in sampler_stats[0] else None,
+                "trace_proposed": {k: v.tolist() if v.ndim == 0 else v.tolist() for k, v in point.items()},
+                "log_prob_proposed": sampler_stats[0]["model_logp"].tolist() if "model_logp" in sampler_stats[0] else None,
+                "accepted": sampler_stats[0]["accepted"] if len(sampler_stats) == 1 and "accepted" in sampler_stats[0] else [s["accepted"] if "accepted" in s else False for s in sampler_stats],
+                "diverged": diverged,
+            }
+            if summary is not None:
+                jsonStat["diagnostics"] = summary
+
+            self.sink.add(jsonStat)
+
+        if self.adaptation is not None:
+            self.adaptation.update(point, sampler_stats)
 
         if sampler_stats is not None:
             for data, vars in zip(self._stats, sampler_stats):
@@ -136,6 +194,9 @@ class DebuggerBackend(base.BaseTrace):
             raise ValueError("Expected sampler_stats")
         
         self.draw_idx += 1
+        if self.storage is not None:
+            # written last, such that a crash never exposes a partially recorded draw
+            self.storage.commit(self.draw_idx)
 
     def _get_sampler_stats(
         self, varname: str, sampler_idx: int, burn: int, thin: int
@@ -143,6 +204,11 @@ class DebuggerBackend(base.BaseTrace):
         return self._stats[sampler_idx][varname][burn::thin]
 
     def close(self):
+        self.sink.close_chain(self.chain)
+        if self.storage is not None:
+            for values in [*self.samples.values(), *(v for stats in self._stats or [] for v in stats.values())]:
+                values.flush()
+            return
         if self.draw_idx == self.draws:
             return
         # Remove trailing zeros if interrupted before completed all
@@ -175,7 +241,11 @@ class DebuggerBackend(base.BaseTrace):
         -------
         A NumPy array
         """
-        return self.samples[varname][burn::thin]
+        values = self.samples[varname]
+        if is_chunked(values):
+            # only reads the requested draws
+            return values[burn : len(self) : thin]
+        return values[burn::thin]
 
     def _slice(self, idx: slice):
         # Slicing directly instead of using _slice_as_ndarray to
@@ -193,7 +263,7 @@ class DebuggerBackend(base.BaseTrace):
             var_dtypes=self.var_dtypes,
         )
         sliced.chain = self.chain
-        sliced.samples = {varname: values[idx] for varname, values in self.samples.items()}
+        sliced.samples = {varname: _slice_values(values, idx) for varname, values in self.samples.items()}
         sliced.sampler_vars = self.sampler_vars
         sliced.draw_idx = (idx.stop - idx.start) // idx.step
 
@@ -204,7 +274,7 @@ class DebuggerBackend(base.BaseTrace):
             var_sliced: dict[str, np.ndarray] = {}
             sliced._stats.append(var_sliced)
             for key, vals in vars.items():
-                var_sliced[key] = vals[idx]
+                var_sliced[key] = _slice_values(vals, idx)
 
         return sliced
 
@@ -220,6 +290,45 @@ class DebuggerBackend(base.BaseTrace):
         return {varname: values[idx] for varname, values in self.samples.items()}
 
 
+def _slice_values(values, idx: slice):
+    # chunked storage is sliced lazily, values are read on access
+    if is_chunked(values):
+        return values.view(idx)
+    return values[idx]
+
+
+def load_trace(storage_dir: str, model: Model | None = None) -> MultiTrace:
+    """Load the chains written by a ``DebuggerBackend`` with ``storage_dir``.
+
+    Works for complete and for interrupted runs, draws are read lazily from disk.
+    """
+    _model = modelcontext(model)
+    straces = []
+    for chain, directory in sorted(ChainStorage.chain_directories(storage_dir).items()):
+        storage = ChainStorage(directory)
+        samples, stats, length = storage.open(mode="r")
+        vars = [var for var in _model.unobserved_value_vars if var.name in samples]
+        strace = DebuggerBackend(
+            model=_model,
+            vars=vars,
+            fn=_no_fn,
+            var_shapes={name: values.shape for name, values in samples.items()},
+            var_dtypes={name: values.dtype for name, values in samples.items()},
+        )
+        strace.chain = chain
+        strace.storage = storage
+        strace.samples = samples
+        strace._stats = stats
+        strace.sampler_vars = None if stats is None else [{k: v.dtype for k, v in s.items()} for s in stats]
+        strace.draws = strace.draw_idx = length
+        straces.append(strace)
+    return MultiTrace(straces)
+
+
+def _no_fn(*args):
+    raise RuntimeError("A loaded trace cannot record draws.")
+
+
 def _slice_as_ndarray(strace, idx):
     sliced = DebuggerBackend(model=strace.model, vars=strace.vars)
     sliced.chain = strace.chain
@@ -249,12 +358,8 @@ def point_list_to_multitrace(
         chain = DebuggerBackend(model=_model, vars=[_model[vn] for vn in varnames])
         chain.setup(draws=len(point_list), chain=0)
 
-        # since we are simply loading a trace by hand, we need only a vacuous function for
-        # chain.record() to use. This crushes the default.
-        def point_fun(point):
-            return [point[vn] for vn in varnames]
-
-        chain.fn = point_fun
-        for point in point_list:
-            chain.record(point)
+        # filled column-wise instead of recording every point, which would also send it to the debugger
+        for vn in varnames:
+            chain.samples[vn][:] = np.stack([np.asarray(point[vn]) for point in point_list])
+        chain.draw_idx = len(point_list)
     return MultiTrace([chain])
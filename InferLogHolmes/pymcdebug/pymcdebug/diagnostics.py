@@ -0,0 +1,219 @@
+"""Incremental convergence diagnostics of the recorded draws.
+
+The debugger computes acceptance rate, ESS and R-hat from the full trace, which gets more
+expensive as the run goes on. :class:`DiagnosticsEngine` keeps running sufficient statistics
+per chain instead and updates them at a cost that does not depend on the number of draws:
+
+- mean and variance with Welford's algorithm,
+- ESS from batch means, the draws are grouped in between ``n_batches`` and ``2 * n_batches``
+  contiguous batches and neighbouring batches are merged when the limit is reached,
+- split R-hat from the moments of the first and the second half of the batches of each chain,
+- acceptance rate over the last ``window`` draws.
+
+Statistics are kept for the flattened unconstrained values of all variables of a point. When
+tuning ends, the moments and batches of the chain are reset, such that the diagnostics describe
+either the tuning or the posterior draws.
+"""
+
+import warnings
+
+from collections import deque
+
+import numpy as np
+
+
+def _merge(a, b):
+    # combines (count, mean, m2) of two groups of draws (Chan et al.)
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    return n, mean_a + delta * n_b / n, m2_a + m2_b + delta**2 * n_a * n_b / n
+
+
+def _merge_all(groups):
+    result = groups[0]
+    for group in groups[1:]:
+        result = _merge(result, group)
+    return result
+
+
+def _acceptance(sampler_stats) -> list[float]:
+    # acceptance of every step method of a draw
+    values = []
+    for stats in sampler_stats or []:
+        if "accepted" in stats:
+            values.append(float(stats["accepted"]))
+        elif "mean_tree_accept" in stats:
+            values.append(float(stats["mean_tree_accept"]))
+        else:
+            values.append(np.nan)
+    return values
+
+
+class ChainDiagnostics:
+    """Running statistics of the draws of one chain.
+
+    Parameters
+    ----------
+    n_batches: int
+        Minimum number of batches for the batch means once the chain is long enough.
+    window: int
+        Number of draws of the windowed acceptance rate.
+    """
+
+    def __init__(self, n_batches: int = 32, window: int = 100):
+        self.n_batches = n_batches
+        self.acceptance = deque(maxlen=window)
+        self.tune = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+        self.batch_size = 1
+        self.batches = []  # (count, mean, m2) of the completed batches
+        self.current = None  # (count, mean, m2) of the batch being filled
+
+    def update(self, x: np.ndarray, acceptance: list[float], tune: bool | None) -> None:
+        if tune != self.tune:
+            self.reset()
+            self.tune = tune
+        self.acceptance.append(acceptance)
+
+        # Welford update
+        if self.mean is None:
+            self.mean = np.zeros_like(x)
+            self.m2 = np.zeros_like(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+        if self.current is None:
+            self.current = (1, x.copy(), np.zeros_like(x))
+        else:
+            self.current = _merge(self.current, (1, x, np.zeros_like(x)))
+        if self.current[0] == self.batch_size:
+            self.batches.append(self.current)
+            self.current = None
+            if len(self.batches) == 2 * self.n_batches:
+                self.batches = [_merge(a, b) for a, b in zip(self.batches[::2], self.batches[1::2])]
+                self.batch_size *= 2
+
+    def variance(self) -> np.ndarray:
+        if self.n < 2:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / (self.n - 1)
+
+    def ess(self) -> np.ndarray:
+        """Batch means estimate of the effective sample size of the completed batches."""
+        if len(self.batches) < 2:
+            return np.full_like(self.mean, np.nan)
+        means = np.stack([mean for _, mean, _ in self.batches])
+        n = len(self.batches) * self.batch_size
+        var = _merge_all(self.batches)[2] / (n - 1)
+        var_batch_means = self.batch_size * means.var(axis=0, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return n * var / var_batch_means
+
+    def halves(self) -> list[tuple]:
+        """(count, mean, m2) of the first and second half of the chain, split at a batch boundary."""
+        if len(self.batches) < 2:
+            return []
+        k = len(self.batches) // 2
+        second = self.batches[k:] if self.current is None else [*self.batches[k:], self.current]
+        return [_merge_all(self.batches[:k]), _merge_all(second)]
+
+    def acceptance_rate(self) -> float | list[float]:
+        if len(self.acceptance) == 0:
+            return []
+        with warnings.catch_warnings():
+            # step methods without acceptance statistic
+            warnings.simplefilter("ignore", RuntimeWarning)
+            rates = np.nanmean(np.array(self.acceptance, dtype=float), axis=0)
+        return float(rates[0]) if len(rates) == 1 else [float(r) for r in rates]
+
+
+def split_rhat(halves: list[tuple]) -> np.ndarray | None:
+    """Split R-hat from the (count, mean, m2) of the chain halves."""
+    if len(halves) < 2 or any(n < 2 for n, _, _ in halves):
+        return None
+    n = np.mean([n for n, _, _ in halves])
+    means = np.stack([mean for _, mean, _ in halves])
+    within = np.mean([m2 / (count - 1) for count, _, m2 in halves], axis=0)
+    between = n * means.var(axis=0, ddof=1)
+    var_hat = (n - 1) / n * within + between / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(var_hat / within)
+
+
+class DiagnosticsEngine:
+    """Incremental diagnostics of all chains of a run, shared by the per-chain backends.
+
+    Parameters
+    ----------
+    every: int
+        A summary of a chain is returned every ``every`` draws of the chain.
+    n_batches: int
+        See :class:`ChainDiagnostics`.
+    window: int
+        See :class:`ChainDiagnostics`.
+    """
+
+    def __init__(self, every: int = 20, n_batches: int = 32, window: int = 100):
+        self.every = every
+        self.n_batches = n_batches
+        self.window = window
+        self.chains: dict[int, ChainDiagnostics] = {}
+        self.layout = None  # (name, shape, offset, size) of the variables in the flattened point
+        self.draws = {}
+
+    def _flatten(self, point: dict[str, np.ndarray]) -> np.ndarray:
+        if self.layout is None:
+            self.layout = []
+            offset = 0
+            for name, value in point.items():
+                shape = np.shape(value)
+                size = int(np.prod(shape))
+                self.layout.append((name, shape, offset, size))
+                offset += size
+        return np.concatenate([np.ravel(point[name]) for name, _, _, _ in self.layout]).astype(float)
+
+    def _unflatten(self, x: np.ndarray | None) -> dict:
+        if x is None:
+            return {name: None for name, _, _, _ in self.layout}
+        return {name: x[offset : offset + size].reshape(shape).tolist() for name, shape, offset, size in self.layout}
+
+    def update(self, chain: int, point: dict[str, np.ndarray], sampler_stats=None) -> dict | None:
+        """Update the statistics of ``chain`` with a draw, returns a summary every ``every`` draws."""
+        if chain not in self.chains:
+            self.chains[chain] = ChainDiagnostics(self.n_batches, self.window)
+            self.draws[chain] = 0
+        diagnostics = self.chains[chain]
+        tune = None
+        if sampler_stats:
+            tune = any(bool(stats.get("tune", False)) for stats in sampler_stats)
+        diagnostics.update(self._flatten(point), _acceptance(sampler_stats), tune)
+        self.draws[chain] += 1
+        if self.draws[chain] % self.every != 0:
+            return None
+        return self.summary(chain)
+
+    def summary(self, chain: int) -> dict:
+        """Diagnostics of ``chain``, ESS and R-hat combine all chains in the same phase (tuning or not)."""
+        diagnostics = self.chains[chain]
+        same_phase = [c for c in self.chains.values() if c.tune == diagnostics.tune and c.n > 0]
+        ess = np.sum([c.ess() for c in same_phase], axis=0)
+        rhat = split_rhat([half for c in same_phase for half in c.halves()])
+        return {
+            "draws": diagnostics.n,
+            "tune": diagnostics.tune,
+            "acceptance_rate": diagnostics.acceptance_rate(),
+            "mean": self._unflatten(diagnostics.mean),
+            "sd": self._unflatten(np.sqrt(diagnostics.variance())),
+            "ess": self._unflatten(ess),
+            "rhat": self._unflatten(rhat),
+            "n_chains": len(same_phase),
+        }
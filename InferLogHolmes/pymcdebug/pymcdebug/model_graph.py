@@ -0,0 +1,118 @@
+"""Model graph of a PyMC model for the debugger.
+
+The debugger can recover the model graph by static analysis of the model file. For PyMC
+models the structure is already available at runtime, so ``debug`` extracts it from the
+pytensor graph of the model and sends it with the ``/start`` payload if ``send_model_graph`` is set:
+
+- ``nodes``: name, node type, distribution, shape, dims and transform of every named variable,
+  the parameters of a distribution are given by the model variables they depend on,
+- ``edges``: ``[parent, child]`` pairs as in :func:`pymc.model_to_graphviz`,
+- ``plates``: variables grouped by their dims (or shape if they have no dims).
+
+All shapes are evaluated with a single compiled function.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+import pytensor
+
+from pytensor.graph.basic import Constant
+from pytensor.tensor.random.op import RandomVariable
+from pytensor.tensor.type import TensorType
+from pymc.model import Model
+from pymc.model_graph import ModelGraph, NodeType, get_node_type, random_variable_symbol
+from pymc.util import get_default_varnames
+
+# node types of pymc.model_graph in the payload
+NODE_TYPES = {
+    NodeType.FREE_RV: "free",
+    NodeType.OBSERVED_RV: "observed",
+    NodeType.DETERMINISTIC: "deterministic",
+    NodeType.DATA: "data",
+    NodeType.POTENTIAL: "potential",
+}
+
+# constant distribution parameters up to this size are sent with their values
+MAX_CONSTANT_SIZE = 16
+
+
+def _eval_shapes(model: Model, names: list[str]) -> tuple[dict[str, tuple], dict[str, int]]:
+    dim_names = list(model.dim_lengths)
+    outputs = [model[name].shape for name in names] + [model.dim_lengths[dim] for dim in dim_names]
+    f = pytensor.function(
+        inputs=[],
+        outputs=outputs,
+        givens=[(obs, model.rvs_to_values[obs]) for obs in model.observed_RVs],
+        mode=pytensor.compile.mode.FAST_COMPILE,
+        on_unused_input="ignore",
+    )
+    values = f()
+    shapes = {name: tuple(int(s) for s in shape) for name, shape in zip(names, values)}
+    dim_lengths = {dim: int(length) for dim, length in zip(dim_names, values[len(names) :])}
+    return shapes, dim_lengths
+
+
+def _param(graph: ModelGraph, param) -> dict:
+    # model variables a distribution parameter depends on, and its value if it is a small constant
+    if param.name in graph._all_var_names:
+        parents = [param.name]
+    else:
+        parents = sorted(graph.get_parent_names(param))
+    value = None
+    if isinstance(param, Constant) and np.size(param.data) <= MAX_CONSTANT_SIZE:
+        value = np.asarray(param.data).tolist()
+    return {"parents": parents, "value": value}
+
+
+def _distribution(graph: ModelGraph, var) -> tuple[str | None, list[dict]]:
+    if var.owner is None or var not in graph.model.basic_RVs:
+        return None, []
+    node = var.owner
+    params = node.op.dist_params(node) if isinstance(node.op, RandomVariable) else node.inputs
+    return random_variable_symbol(var), [_param(graph, p) for p in params if isinstance(p.type, TensorType)]
+
+
+def extract_model_graph(model: Model) -> dict:
+    """Nodes, edges and plates of ``model`` as JSON serializable dict."""
+    graph = ModelGraph(model)
+    names = get_default_varnames(model.named_vars, include_transformed=False)
+    shapes, dim_lengths = _eval_shapes(model, names)
+
+    nodes = []
+    plates = defaultdict(list)
+    for name in names:
+        var = model[name]
+        distribution, params = _distribution(graph, var)
+        dims = model.named_vars_to_dims.get(name)
+        transform = model.rvs_to_transforms.get(var) if var in model.free_RVs else None
+        nodes.append({
+            "name": name,
+            "type": NODE_TYPES[get_node_type(name, model)],
+            "distribution": distribution,
+            "params": params,
+            "shape": list(shapes[name]),
+            "dims": None if dims is None else list(dims),
+            "observed": var in model.observed_RVs,
+            "transform": None if transform is None else type(transform).__name__,
+        })
+        if dims is not None:
+            plate = tuple((dim, dim_lengths.get(dim, length)) for dim, length in zip(dims, shapes[name]))
+        else:
+            plate = tuple((None, length) for length in shapes[name])
+        if len(plate) > 0:
+            plates[plate].append(name)
+
+    edges = [
+        [parent, child]
+        for child, parents in graph.make_compute_graph().items()
+        for parent in sorted(parents)
+    ]
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "plates": [
+            {"dims": [dim for dim, _ in plate], "lengths": [length for _, length in plate], "variables": variables}
+            for plate, variables in plates.items()
+        ],
+    }
@@ -0,0 +1,123 @@
+"""Replay of saved sampling results in the debugger.
+
+``load`` opens an ``InferenceData`` NetCDF file lazily, announces the run to the debugger with
+a ``/start`` payload derived from its ``sample_stats``, sends the draws to ``/trace-batch`` and
+ends the run with ``/end``.
+Draws are read column-wise, ``chunk_size`` draws of all chains and variables at a time, so the
+file is never loaded into memory as a whole. If the model is given, draws are sent as the values
+of its value variables like the draws of a live run (see :mod:`pymcdebug.streaming`).
+"""
+
+import os
+import sys
+
+import arviz as az
+import requests
+
+from arviz import InferenceData
+
+from pymcdebug.streaming import TraceBatchStreamer, value_var_converter
+from pymcdebug.telemetry import post_end
+
+START_URL = "http://localhost:8484/start"
+
+
+def _algorithm(sample_stats) -> dict:
+    # step method of the run as far as it can be told from the recorded sampler stats
+    if sample_stats is None:
+        return {"method": "nuts", "params": {}}
+    if "tree_depth" in sample_stats or "max_energy_error" in sample_stats:
+        return {
+            "method": "nuts",
+            "params": {
+                "target_accept": sample_stats.attrs.get("target_accept"),
+                "max_treedepth": int(sample_stats["tree_depth"].max()) if "tree_depth" in sample_stats else None,
+                "step_size": float(sample_stats["step_size"][:, -1].mean()) if "step_size" in sample_stats else None,
+            },
+        }
+    if "n_steps" in sample_stats and "step_size" in sample_stats:
+        return {
+            "method": "hmc",
+            "params": {
+                "L": int(sample_stats["n_steps"].max()),
+                "epsilon": float(sample_stats["step_size"][:, -1].mean()),
+            },
+        }
+    return {"method": "metropolis_hastings", "params": {"blockUpdates": True}}
+
+
+def _chunks(posterior, sample_stats, chunk_size: int, convert):
+    # (values, log_prob, diverged, offset) of consecutive draw ranges, read column-wise
+    n_draws = posterior.sizes["draw"]
+    for start in range(0, n_draws, chunk_size):
+        draws = slice(start, min(start + chunk_size, n_draws))
+        values = convert({name: posterior[name].isel(draw=draws).values for name in posterior.data_vars})
+        log_prob = diverged = None
+        if sample_stats is not None:
+            if "lp" in sample_stats:
+                log_prob = sample_stats["lp"].isel(draw=draws).values
+            if "diverging" in sample_stats:
+                diverged = sample_stats["diverging"].isel(draw=draws).values
+        yield values, log_prob, diverged, start
+
+
+def load(
+    path: str,
+    file_path: str | None = None,
+    chunk_size: int = 500,
+    batch_size: int = 5000,
+    model=None,
+) -> InferenceData:
+    """Show the results of a finished run, saved with ``idata.to_netcdf(path)``, in the debugger.
+
+    Parameters
+    ----------
+    path : str
+        Path of the NetCDF file.
+    file_path : str, optional
+        Model file the debugger shows the results for. Defaults to the running script.
+    chunk_size : int, default=500
+        Number of draws per chain that are read from the file at a time.
+    batch_size : int, default=5000
+        Maximum number of draws per request to the debugger.
+    model : pymc.Model, optional
+        Model of the run. If given, the draws are sent under the names of its value variables
+        (e.g. ``sigma_log__``) as in a live run, otherwise the posterior variables are sent as saved.
+
+    Returns
+    -------
+    idata : arviz.InferenceData
+        The lazily loaded results.
+    """
+    idata = az.from_netcdf(path)
+    if "posterior" not in idata.groups():
+        raise ValueError(f"{path} has no posterior group.")
+    posterior = idata.posterior
+    sample_stats = idata.sample_stats if "sample_stats" in idata.groups() else None
+    warmup = idata.warmup_posterior if "warmup_posterior" in idata.groups() else None
+    warmup_stats = idata.warmup_sample_stats if "warmup_sample_stats" in idata.groups() else None
+
+    tune = warmup.sizes["draw"] if warmup is not None else 0
+    if file_path is None:
+        file_path = os.path.abspath(sys.modules["__main__"].__file__)
+
+    js = {
+        "ppl": "pymc",
+        "filePath": file_path,
+        "alg": _algorithm(sample_stats),
+        "totalIteration": tune + posterior.sizes["draw"],
+        "burnin": tune,
+        "chains": posterior.sizes["chain"],
+        "endMessage": True,
+    }
+    requests.post(START_URL, json=js)
+
+    convert = (lambda values: values) if model is None else value_var_converter(model)
+    streamer = TraceBatchStreamer(max_batch_size=batch_size)
+    if warmup is not None:
+        for values, log_prob, diverged, start in _chunks(warmup, warmup_stats, chunk_size, convert):
+            streamer.push(values, log_prob, diverged, start_iter=start)
+    for values, log_prob, diverged, start in _chunks(posterior, sample_stats, chunk_size, convert):
+        streamer.push(values, log_prob, diverged, start_iter=tune + start)
+    post_end()
+    return idata
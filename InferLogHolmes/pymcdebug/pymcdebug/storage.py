@@ -0,0 +1,197 @@
+"""Chunked on-disk storage for ``DebuggerBackend``.
+
+Every variable and sampler statistic of a chain is stored as a sequence of fixed size chunks.
+Each chunk is a memory-mapped ``.npy`` file, so a chain grows by adding chunks without copying
+earlier draws, and only the chunks that are read are paged in. The number of completed draws is
+kept in a memory-mapped counter that is written after all values of a draw, such that the
+draws of a crashed process can be recovered with :func:`pymcdebug.load_trace`.
+
+Layout of a chain directory::
+
+    chain-<chain>/
+        meta.json            names, shapes and dtypes of variables and sampler stats
+        count.npy            number of completed draws
+        vars/<i>/<k>.npy     chunk k of variable i
+        stats/<s>/<i>/<k>.npy
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+META_FILE = "meta.json"
+COUNT_FILE = "count.npy"
+
+
+class ChunkedArray:
+    """Array along the draw axis stored in chunks of ``chunk_size`` draws.
+
+    Object dtypes (e.g. sampler warnings) cannot be memory-mapped and are kept in memory.
+    """
+
+    def __init__(self, directory: str, shape, dtype, chunk_size: int = 1024, mode: str = "w+", length: int = 0):
+        self.directory = directory
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.mode = mode
+        self.length = length
+        self.chunks = []
+        self.in_memory = self.dtype.hasobject
+        if not self.in_memory:
+            os.makedirs(directory, exist_ok=True)
+            if mode != "w+":
+                n_chunks = -(-length // chunk_size)
+                self.chunks = [np.load(self._chunk_path(k), mmap_mode=mode) for k in range(n_chunks)]
+
+    def _chunk_path(self, k: int) -> str:
+        return os.path.join(self.directory, f"{k:06d}.npy")
+
+    def _add_chunk(self):
+        shape = (self.chunk_size, *self.shape)
+        if self.in_memory:
+            self.chunks.append(np.empty(shape, dtype=self.dtype))
+        else:
+            path = self._chunk_path(len(self.chunks))
+            self.chunks.append(np.lib.format.open_memmap(path, mode="w+", dtype=self.dtype, shape=shape))
+
+    def reserve(self, n: int) -> None:
+        while len(self.chunks) * self.chunk_size < n:
+            self._add_chunk()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __setitem__(self, idx: int, value) -> None:
+        self.reserve(idx + 1)
+        self.chunks[idx // self.chunk_size][idx % self.chunk_size] = value
+        self.length = max(self.length, idx + 1)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.take(range(len(self))[key])
+        idx = range(len(self))[key]
+        return np.array(self.chunks[idx // self.chunk_size][idx % self.chunk_size])
+
+    def take(self, indices: range) -> np.ndarray:
+        # gathers draws chunk by chunk, only touched chunks are read
+        out = np.empty((len(indices), *self.shape), dtype=self.dtype)
+        if len(indices) == 0:
+            return out
+        indices = np.asarray(indices)
+        chunk_ids = indices // self.chunk_size
+        for k in np.unique(chunk_ids):
+            mask = chunk_ids == k
+            out[mask] = self.chunks[k][indices[mask] - k * self.chunk_size]
+        return out
+
+    def view(self, idx: slice) -> "ChunkedView":
+        return ChunkedView(self, range(len(self))[idx])
+
+    def flush(self) -> None:
+        for chunk in self.chunks:
+            if isinstance(chunk, np.memmap):
+                chunk.flush()
+
+
+class ChunkedView:
+    """Lazy selection of draws of a ``ChunkedArray``, values are read on indexing."""
+
+    def __init__(self, base: ChunkedArray, indices: range):
+        self.base = base
+        self.indices = indices
+        self.shape = (len(indices), *base.shape)
+        self.dtype = base.dtype
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.base.take(self.indices[key])
+        return self.base[self.indices[key]]
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.base.take(self.indices)
+        return values if dtype is None else values.astype(dtype)
+
+    def view(self, idx: slice) -> "ChunkedView":
+        return ChunkedView(self.base, self.indices[idx])
+
+
+def is_chunked(values) -> bool:
+    return isinstance(values, ChunkedArray | ChunkedView)
+
+
+class ChainStorage:
+    """Chunked arrays of the variables and sampler stats of one chain."""
+
+    def __init__(self, directory: str, chunk_size: int = 1024):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.count = None
+
+    def create(self, var_shapes: dict, var_dtypes: dict, sampler_vars) -> tuple[dict, list | None]:
+        # starts a new chain, previous content of the directory is removed
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        meta = {
+            "chunk_size": self.chunk_size,
+            "vars": [
+                {"name": name, "shape": list(shape), "dtype": np.dtype(var_dtypes[name]).str}
+                for name, shape in var_shapes.items()
+            ],
+            "stats": None if sampler_vars is None else [
+                [{"name": name, "dtype": np.dtype(dtype).str} for name, dtype in sampler.items()]
+                for sampler in sampler_vars
+            ],
+        }
+        with open(os.path.join(self.directory, META_FILE), "w") as f:
+            json.dump(meta, f)
+        self.count = np.lib.format.open_memmap(os.path.join(self.directory, COUNT_FILE), mode="w+", dtype=np.int64, shape=(1,))
+        return self._open(meta, "w+", 0)
+
+    def open(self, mode: str = "r") -> tuple[dict, list | None, int]:
+        # opens a chain written by create, draws after the last completed one are ignored
+        with open(os.path.join(self.directory, META_FILE)) as f:
+            meta = json.load(f)
+        self.chunk_size = meta["chunk_size"]
+        self.count = np.load(os.path.join(self.directory, COUNT_FILE), mmap_mode=mode)
+        length = int(self.count[0])
+        samples, stats = self._open(meta, mode, length)
+        return samples, stats, length
+
+    def _open(self, meta: dict, mode: str, length: int) -> tuple[dict, list | None]:
+        samples = {
+            var["name"]: ChunkedArray(
+                os.path.join(self.directory, "vars", str(i)), var["shape"], var["dtype"], self.chunk_size, mode, length
+            )
+            for i, var in enumerate(meta["vars"])
+        }
+        if meta["stats"] is None:
+            return samples, None
+        stats = [
+            {
+                stat["name"]: ChunkedArray(
+                    os.path.join(self.directory, "stats", str(s), str(i)), (), stat["dtype"], self.chunk_size, mode, length
+                )
+                for i, stat in enumerate(sampler)
+                # in-memory object stats (warnings) cannot be recovered
+                if mode == "w+" or not np.dtype(stat["dtype"]).hasobject
+            }
+            for s, sampler in enumerate(meta["stats"])
+        ]
+        return samples, stats
+
+    def commit(self, n_draws: int) -> None:
+        self.count[0] = n_draws
+
+    @staticmethod
+    def chain_directories(directory: str) -> dict[int, str]:
+        return {
+            int(name.split("-", 1)[1]): os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.startswith("chain-") and os.path.exists(os.path.join(directory, name, META_FILE))
+        }
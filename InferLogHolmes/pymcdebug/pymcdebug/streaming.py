@@ -0,0 +1,406 @@
+"""Live streaming of draws from external NUTS samplers (nutpie, numpyro, blackjax).
+
+These samplers do not record into ``DebuggerBackend``. While ``pm.sample`` runs, the
+entry points that PyMC calls for each library are temporarily replaced:
+
+- nutpie is started non-blocking and its partial trace is polled every ``interval`` seconds,
+- numpyro and blackjax sample in chunks of ``chunk_size`` draws, continuing from the last
+  state of the previous chunk, and return the same raw samples and stats as PyMC's versions.
+
+New draws are sent in batches to the ``/trace-batch`` endpoint of the debugger. Tuning draws
+are numbered from 0 and posterior draws from ``tune`` as in the pymc sampler. blackjax does
+not expose its warmup draws, so only posterior draws are streamed for it.
+
+As in the pymc sampler, draws are sent as the values of the model's value variables, i.e.
+transformed variables under their transformed names (e.g. ``sigma_log__``). nutpie reports
+the constrained free variables, which are mapped with :func:`value_var_converter`.
+"""
+
+import inspect
+import time
+import warnings
+
+from contextlib import contextmanager
+from functools import partial
+
+import numpy as np
+import pytensor
+import pytensor.tensor as pt
+import requests
+import simplejson as json
+
+from pytensor.graph.replace import vectorize_graph
+
+from pymcdebug.telemetry import TRACE_BATCH_URL
+
+MAX_BATCH_SIZE = 1000
+
+# pymc versions whose _sample_numpyro_nuts and _sample_blackjax_nuts the chunked samplers follow,
+# other versions sample with the original functions without streaming
+JAX_SAMPLER_PYMC_VERSIONS = ("5.21.",)
+
+
+def value_var_converter(model):
+    """Returns a function that maps draws of the free variables of ``model``, by name and with
+    shape ``(chains, draws, ...)``, to the draws of their value variables."""
+    # same as the initial point of pm.sample: forward transform with the parameters of the variable
+    free_rvs = model.free_RVs
+    inputs = [rv.type(name=rv.name) for rv in free_rvs]
+    outputs = []
+    for rv in free_rvs:
+        transform = model.rvs_to_transforms.get(rv)
+        outputs.append(rv if transform is None else transform.forward(rv, *rv.owner.inputs))
+    outputs = pytensor.clone_replace(outputs, replace=dict(zip(free_rvs, inputs)))
+    # one call per polled chunk, all draws of all chains along a leading batch dimension
+    batched_inputs = [pt.tensor(dtype=x.type.dtype, shape=(None, *x.type.shape), name=x.name) for x in inputs]
+    batched_outputs = vectorize_graph(outputs, replace=dict(zip(inputs, batched_inputs)))
+    fn = pytensor.function(batched_inputs, batched_outputs, on_unused_input="ignore")
+    names = [rv.name for rv in free_rvs]
+    value_names = [model.rvs_to_values[rv].name for rv in free_rvs]
+
+    def convert(values: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        if len(names) == 0:
+            return {}
+        n_chains, n_draws = values[names[0]].shape[:2]
+        flat = [np.reshape(values[name], (n_chains * n_draws, *np.shape(values[name])[2:])) for name in names]
+        return {
+            value_name: np.reshape(value, (n_chains, n_draws, *np.shape(value)[1:]))
+            for value_name, value in zip(value_names, fn(*flat))
+        }
+
+    return convert
+
+
+class TraceBatchStreamer:
+    """Converts arrays of draws with shape ``(chains, draws, ...)`` to trace items and posts them in batches."""
+
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE):
+        self.max_batch_size = max_batch_size
+        self.last_points = {}
+
+    def push(self, values: dict[str, np.ndarray], log_prob=None, diverged=None, start_iter: int = 0) -> None:
+        if len(values) == 0:
+            return
+        n_chains, n_draws = next(iter(values.values())).shape[:2]
+        if n_draws == 0:
+            return
+        values = {name: np.asarray(v) for name, v in values.items()}
+        items = []
+        # ordered by iteration, then chain
+        for i in range(n_draws):
+            for chain in range(n_chains):
+                point = {name: v[chain, i].tolist() for name, v in values.items()}
+                # NUTS has no accept/reject decision, a draw counts as accepted if the chain moved
+                accepted = self.last_points.get(chain) != point
+                self.last_points[chain] = point
+                lp = None if log_prob is None else float(log_prob[chain, i])
+                items.append({
+                    "iter": start_iter + i,
+                    "chain": chain,
+                    "trace_current": point,
+                    "log_prob_current": lp,
+                    "trace_proposed": point,
+                    "log_prob_proposed": lp,
+                    "accepted": accepted,
+                    "diverged": None if diverged is None else bool(diverged[chain, i]),
+                })
+        for k in range(0, len(items), self.max_batch_size):
+            requests.post(TRACE_BATCH_URL, data=json.dumps(items[k : k + self.max_batch_size], ignore_nan=True))
+
+
+### nutpie
+
+
+class _NutpieProgress:
+    # number of draws already streamed per group of the partial nutpie trace
+    def __init__(self, streamer: TraceBatchStreamer, tune: int, convert):
+        self.streamer = streamer
+        self.tune = tune
+        self.convert = convert
+        self.sent = {"warmup_posterior": 0, "posterior": 0}
+
+    def push(self, idata) -> None:
+        for group, stats_group, offset in (
+            ("warmup_posterior", "warmup_sample_stats", 0),
+            ("posterior", "sample_stats", self.tune),
+        ):
+            if group not in idata.groups():
+                continue
+            posterior = idata[group]
+            n_draws = posterior.sizes["draw"]
+            start = self.sent[group]
+            if n_draws <= start:
+                continue
+            values = self.convert({name: posterior[name].values[:, start:n_draws] for name in posterior.data_vars})
+            stats = idata[stats_group] if stats_group in idata.groups() else {}
+            log_prob = stats["logp"].values[:, start:n_draws] if "logp" in stats else None
+            diverged = stats["diverging"].values[:, start:n_draws] if "diverging" in stats else None
+            self.streamer.push(values, log_prob, diverged, start_iter=offset + start)
+            self.sent[group] = n_draws
+
+
+def _streaming_nutpie_sample(original, streamer: TraceBatchStreamer, model, tune: int, interval: float):
+    convert = value_var_converter(model)
+
+    def sample(compiled_model, *args, **kwargs):
+        kwargs["blocking"] = False
+        sampler = original(compiled_model, *args, **kwargs)
+        progress = _NutpieProgress(streamer, kwargs.get("tune", tune), convert)
+        try:
+            while not sampler.is_finished:
+                time.sleep(interval)
+                progress.push(sampler.inspect())
+            idata = sampler.wait()
+        except BaseException:
+            sampler.abort()
+            raise
+        progress.push(idata)
+        return idata
+
+    return sample
+
+
+### numpyro
+
+
+def _chunked_numpyro_nuts(
+    streamer: TraceBatchStreamer,
+    chunk_size: int,
+    model,
+    target_accept,
+    tune,
+    draws,
+    chains,
+    chain_method,
+    progressbar,
+    random_seed,
+    initial_points,
+    nuts_kwargs,
+    logp_fn=None,
+):
+    # same as pymc.sampling.jax._sample_numpyro_nuts, but draws are collected in chunks
+    import jax
+    import numpyro
+
+    from numpyro.infer import MCMC, NUTS
+    from pymc.sampling.jax import _numpyro_stats_to_dict, get_jaxified_logp
+
+    if logp_fn is None:
+        logp_fn = get_jaxified_logp(model, negative_logp=False)
+
+    nuts_kwargs.setdefault("adapt_step_size", True)
+    nuts_kwargs.setdefault("adapt_mass_matrix", True)
+    nuts_kwargs.setdefault("dense_mass", False)
+
+    nuts_kernel = NUTS(
+        potential_fn=logp_fn,
+        target_accept_prob=target_accept,
+        **nuts_kwargs,
+    )
+
+    # constant number of samples per run, such that numpyro compiles the sampling loop once
+    chunk_size = max(1, min(chunk_size, draws))
+    mcmc = MCMC(
+        nuts_kernel,
+        num_warmup=tune,
+        num_samples=chunk_size,
+        num_chains=chains,
+        postprocess_fn=None,
+        chain_method=chain_method,
+        progress_bar=progressbar,
+    )
+
+    map_seed = jax.random.PRNGKey(random_seed)
+    if chains > 1:
+        map_seed = jax.random.split(map_seed, chains)
+
+    extra_fields = (
+        "num_steps",
+        "potential_energy",
+        "energy",
+        "adapt_state.step_size",
+        "accept_prob",
+        "diverging",
+    )
+    names = [var.name for var in model.value_vars]
+
+    def push(samples, stats, start_iter):
+        # potential energy is the negative log density
+        streamer.push(
+            dict(zip(names, samples)),
+            -stats["lp"] if "lp" in stats else None,
+            stats.get("diverging"),
+            start_iter=start_iter,
+        )
+
+    mcmc.warmup(map_seed, init_params=initial_points, extra_fields=extra_fields, collect_warmup=True)
+    if tune > 0:
+        push(mcmc.get_samples(group_by_chain=True), _numpyro_stats_to_dict(mcmc), 0)
+
+    sample_chunks = []
+    stats_chunks = []
+    n = 0
+    while n < draws:
+        mcmc.run(mcmc.post_warmup_state.rng_key, extra_fields=extra_fields)
+        mcmc.post_warmup_state = mcmc.last_state
+        take = min(chunk_size, draws - n)
+        samples = jax.tree_util.tree_map(lambda x: np.asarray(x)[:, :take], mcmc.get_samples(group_by_chain=True))
+        stats = {k: v[:, :take] for k, v in _numpyro_stats_to_dict(mcmc).items()}
+        push(samples, stats, tune + n)
+        sample_chunks.append(samples)
+        stats_chunks.append(stats)
+        n += take
+
+    raw_mcmc_samples = jax.tree_util.tree_map(lambda *xs: np.concatenate(xs, axis=1), *sample_chunks)
+    sample_stats = {k: np.concatenate([s[k] for s in stats_chunks], axis=1) for k in stats_chunks[0]}
+    return raw_mcmc_samples, sample_stats, numpyro
+
+
+### blackjax
+
+
+def _chunked_blackjax_nuts(
+    streamer: TraceBatchStreamer,
+    chunk_size: int,
+    model,
+    target_accept,
+    tune,
+    draws,
+    chains,
+    chain_method,
+    progressbar,
+    random_seed,
+    initial_points,
+    nuts_kwargs,
+    logp_fn=None,
+):
+    # same as pymc.sampling.jax._sample_blackjax_nuts, but the sampling scan runs in chunks
+    import blackjax
+    import jax
+
+    from blackjax.adaptation.base import get_filter_adapt_info_fn
+    from pymc.sampling.jax import get_jaxified_logp
+
+    if chain_method == "parallel":
+        map_fn = jax.pmap
+    elif chain_method == "vectorized":
+        map_fn = lambda f: jax.jit(jax.vmap(f))
+    else:
+        raise ValueError(
+            "Only supporting the following methods to draw chains: 'parallel' or 'vectorized'"
+        )
+
+    if chains == 1:
+        initial_points = [np.stack(init_state) for init_state in zip(initial_points)]
+
+    if logp_fn is None:
+        logp_fn = get_jaxified_logp(model)
+
+    adaptation_kwargs = dict(nuts_kwargs)
+    adaptation_kwargs.pop("progress_bar", None)
+    algorithm_name = adaptation_kwargs.pop("algorithm", "nuts")
+    if algorithm_name == "nuts":
+        algorithm = blackjax.nuts
+    elif algorithm_name == "hmc":
+        algorithm = blackjax.hmc
+    else:
+        raise ValueError("Only supporting 'nuts' or 'hmc' as algorithm to draw samples.")
+
+    def warmup(seed, init_position):
+        adapt = blackjax.window_adaptation(
+            algorithm=algorithm,
+            logdensity_fn=logp_fn,
+            target_acceptance_rate=target_accept,
+            adaptation_info_fn=get_filter_adapt_info_fn(),
+            **adaptation_kwargs,
+        )
+        (last_state, tuned_params), _ = adapt.run(seed, init_position, num_steps=tune)
+        return last_state, tuned_params, jax.random.split(seed, draws)
+
+    def run_chunk(state, tuned_params, keys):
+        kernel = algorithm(logp_fn, **tuned_params).step
+
+        def _one_step(state, rng_key):
+            state, info = kernel(rng_key, state)
+            stats = {
+                "diverging": info.is_divergent,
+                "energy": info.energy,
+                "tree_depth": info.num_trajectory_expansions,
+                "n_steps": info.num_integration_steps,
+                "acceptance_rate": info.acceptance_rate,
+                "lp": state.logdensity,
+            }
+            return state, (state.position, stats)
+
+        return jax.lax.scan(_one_step, state, keys)
+
+    seed = jax.random.PRNGKey(random_seed)
+    keys = jax.random.split(seed, chains)
+    states, tuned_params, draw_keys = map_fn(warmup)(keys, initial_points)
+    run_chunk = map_fn(run_chunk)
+
+    names = [var.name for var in model.value_vars]
+    chunk_size = max(1, min(chunk_size, draws))
+    sample_chunks = []
+    stats_chunks = []
+    for n in range(0, draws, chunk_size):
+        states, (samples, stats) = run_chunk(states, tuned_params, draw_keys[:, n : n + chunk_size])
+        samples = jax.tree_util.tree_map(np.asarray, samples)
+        stats = {k: np.asarray(v) for k, v in stats.items()}
+        streamer.push(dict(zip(names, samples)), stats["lp"], stats["diverging"], start_iter=tune + n)
+        sample_chunks.append(samples)
+        stats_chunks.append(stats)
+
+    raw_mcmc_samples = jax.tree_util.tree_map(lambda *xs: np.concatenate(xs, axis=1), *sample_chunks)
+    sample_stats = {k: np.concatenate([s[k] for s in stats_chunks], axis=1) for k in stats_chunks[0]}
+    return raw_mcmc_samples, sample_stats, blackjax
+
+
+def _jax_sampler_supported(original, sampler_fn) -> bool:
+    # the chunked samplers replace private functions of pymc, they must take the same arguments
+    import pymc
+
+    if not pymc.__version__.startswith(JAX_SAMPLER_PYMC_VERSIONS):
+        return False
+    expected = list(inspect.signature(sampler_fn).parameters)[2:]  # without streamer and chunk_size
+    return list(inspect.signature(original).parameters) == expected
+
+
+@contextmanager
+def stream_external_sampler(nuts_sampler: str, model, tune: int, interval: float = 1.0, chunk_size: int = 100):
+    """Streams draws of ``pm.sample(nuts_sampler=..., model=model)`` to the debugger while the context is active."""
+    if nuts_sampler == "pymc":
+        yield
+        return
+
+    streamer = TraceBatchStreamer()
+    if nuts_sampler == "nutpie":
+        import nutpie
+
+        module, attr = nutpie, "sample"
+        replacement = _streaming_nutpie_sample(nutpie.sample, streamer, model, tune, interval)
+    elif nuts_sampler in ("numpyro", "blackjax"):
+        import pymc.sampling.jax as pymc_jax
+
+        module = pymc_jax
+        if nuts_sampler == "numpyro":
+            attr, sampler_fn = "_sample_numpyro_nuts", _chunked_numpyro_nuts
+        else:
+            attr, sampler_fn = "_sample_blackjax_nuts", _chunked_blackjax_nuts
+        if not _jax_sampler_supported(getattr(module, attr), sampler_fn):
+            warnings.warn(
+                f"Streaming of nuts_sampler={nuts_sampler!r} is only supported for pymc {', '.join(JAX_SAMPLER_PYMC_VERSIONS)}x, "
+                "the draws are not shown while sampling."
+            )
+            yield
+            return
+        replacement = partial(sampler_fn, streamer, chunk_size)
+    else:
+        raise ValueError(f"Unknown nuts_sampler {nuts_sampler}.")
+
+    original = getattr(module, attr)
+    setattr(module, attr, replacement)
+    try:
+        yield
+    finally:
+        setattr(module, attr, original)
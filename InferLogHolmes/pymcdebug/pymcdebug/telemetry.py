@@ -0,0 +1,145 @@
+"""Batched, chain-ordered telemetry of recorded draws.
+
+With ``cores > 1`` PyMC runs the chains in worker processes and sends every draw back to the
+parent over a pipe, where the backend of the chain records it. Draws of different chains
+therefore arrive interleaved and out of step. Instead of one ``/trace`` request per draw, the
+backends of all chains share a :class:`TraceSink` that buffers the trace items, merges them
+by iteration and chain and posts them in batches to ``/trace-batch`` over one keep-alive
+connection.
+
+Items are released up to the *watermark*, the lowest iteration that every running chain has
+recorded, so a batch never contains iteration ``i`` of one chain before iteration ``i`` of a
+slower chain. Chains that have not recorded a draw yet (e.g. the later chains of sequential
+sampling) do not hold back the others. If one chain stalls, the buffer is flushed completely
+once it holds ``max_buffer`` items.
+
+Which draws are sent at all is decided by a :class:`StreamFilter`, the backend still records
+every draw. As thinned or rate limited runs send fewer than ``totalIteration * chains`` items,
+the end of a run is announced explicitly with a request to ``/end``.
+"""
+
+import heapq
+import time
+import warnings
+
+import requests
+import simplejson as json
+
+TRACE_BATCH_URL = "http://localhost:8484/trace-batch"
+END_URL = "http://localhost:8484/end"
+
+
+def post_end() -> None:
+    """Announces the end of a successful run, a failed request only warns."""
+    try:
+        requests.post(END_URL)
+    except requests.RequestException as e:
+        warnings.warn(f"Could not end the run in the debugger: {e}")
+
+
+class StreamFilter:
+    """Selects the draws of each chain that are sent to the debugger.
+
+    Parameters
+    ----------
+    stream: str or int
+        ``"all"`` sends every draw, an integer ``k`` every k-th draw of a chain and a string
+        ``"<M>/s"`` (e.g. ``"20/s"``) at most ``M`` draws per second and chain. ``"none"``
+        sends no draws.
+    """
+
+    def __init__(self, stream: str | int = "all"):
+        self.every = None
+        self.min_interval = None
+        self.last_sent = {}  # chain -> time of the last sent draw
+        if stream == "all":
+            self.every = 1
+        elif stream == "none":
+            self.every = 0
+        elif isinstance(stream, int) and not isinstance(stream, bool) and stream > 0:
+            self.every = stream
+        elif isinstance(stream, str) and stream.endswith("/s"):
+            try:
+                rate = float(stream[:-2])
+            except ValueError:
+                rate = 0
+            if rate <= 0:
+                raise ValueError(f"Invalid stream rate {stream!r}, expected e.g. '20/s'.")
+            self.min_interval = 1 / rate
+        else:
+            raise ValueError(f"Invalid stream {stream!r}, expected 'all', 'none', a positive int or '<M>/s'.")
+
+    def __call__(self, chain: int, draw_idx: int) -> bool:
+        if self.every is not None:
+            return self.every > 0 and draw_idx % self.every == 0
+        now = time.monotonic()
+        last = self.last_sent.get(chain)
+        if last is not None and now - last < self.min_interval:
+            return False
+        self.last_sent[chain] = now
+        return True
+
+
+class TraceSink:
+    """Buffer of trace items shared by the per-chain copies of a ``DebuggerBackend``.
+
+    Parameters
+    ----------
+    batch_size: int
+        Maximum number of items per request.
+    interval: float
+        Seconds after which released items are posted even if the batch is not full.
+    max_buffer: int
+        Number of buffered items at which all items are posted regardless of the watermark.
+        Defaults to ``16 * batch_size``.
+    """
+
+    def __init__(self, batch_size: int = 256, interval: float = 0.5, max_buffer: int | None = None):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = 16 * batch_size if max_buffer is None else max_buffer
+        self.session = None
+        self.buffer = []  # heap of (iter, chain, seq, item)
+        self.last_iter = {}  # last recorded iteration of the running chains
+        self.running = set()
+        self.seq = 0
+        self.last_flush = time.monotonic()
+
+    def open_chain(self, chain: int) -> None:
+        self.running.add(chain)
+
+    def close_chain(self, chain: int) -> None:
+        self.running.discard(chain)
+        self.last_iter.pop(chain, None)
+        if len(self.running) == 0:
+            self.flush(force=True)
+        else:
+            self.flush()
+
+    def add(self, item: dict) -> None:
+        chain, it = item["chain"], item["iter"]
+        self.running.add(chain)
+        self.last_iter[chain] = it
+        heapq.heappush(self.buffer, (it, chain, self.seq, item))
+        self.seq += 1
+        if len(self.buffer) >= self.max_buffer:
+            self.flush(force=True)
+        elif len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def watermark(self) -> float:
+        if len(self.last_iter) == 0:
+            return float("inf")
+        return min(self.last_iter.values())
+
+    def flush(self, force: bool = False) -> None:
+        """Post all items up to the watermark, or all buffered items if ``force``."""
+        limit = float("inf") if force else self.watermark()
+        items = []
+        while self.buffer and self.buffer[0][0] <= limit:
+            items.append(heapq.heappop(self.buffer)[3])
+        if items and self.session is None:
+            self.session = requests.Session()
+        for k in range(0, len(items), self.batch_size):
+            self.session.post(TRACE_BATCH_URL, data=json.dumps(items[k : k + self.batch_size], ignore_nan=True))
+        self.last_flush = time.monotonic()
@@ -2,6 +2,7 @@
 import sys
 sys.path.insert(0, 'static')
 import lasapp
+import lasapp.distributions as dists
 from utils import *
 import argparse
 from model_graph import *
@@ -24,7 +25,8 @@ if __name__ == "__main__":
     if args.viewgraph:
         plot_model_graph(model_graph)
 
-    mask = get_rv_to_support_mask(program, random_variables)
+    # supports and parameter ranges of all random variables in one request
+    value_ranges = {rv_ranges.node.node_id: rv_ranges for rv_ranges in program.estimate_value_ranges(model)}
 
     for rv in random_variables:
         print(rv)
@@ -34,10 +36,9 @@ if __name__ == "__main__":
         print("  distribution:", rv.distribution.node.source_text)
         properties = lasapp.infer_distribution_properties(rv)
         print("    properties:", "    ".join(str(properties).splitlines(True)))
-        for param in rv.distribution.params:
-            value_range = program.estimate_value_range(param.node, mask)
-            value_range = dists.Interval(float(value_range.low), float(value_range.high))
-            print("    param:", param.name, "->", param.node.source_text, f"(estimated range: {value_range})")
+        for param_range in value_ranges[rv.node.node_id].params:
+            value_range = dists.Interval(float(param_range.range.low), float(param_range.range.high))
+            print("    param:", param_range.name, "->", param_range.node.source_text, f"(estimated range: {value_range})")
         print(f"  position: {rv.node.line_no}:{rv.node.col_offset} - {rv.node.end_line_no}:{rv.node.end_col_offset}")
         print("  dependencies:", [x for (x,y) in model_graph.edges if y == rv])
 
@@ -33,12 +33,25 @@ class DataclassEncoder(json.JSONEncoder):
 def jsonrpc_serialize( data):
     return json.dumps(data, cls=DataclassEncoder)
 
-JSONRPC20Response.serialize = staticmethod(jsonrpc_serialize)
+# only requests are serialized by the client, the server (which imports lasapp in model_graph.py) encodes its responses itself
 JSONRPC20Request.serialize = staticmethod(jsonrpc_serialize)
 
 import uuid
 import socket
 
+# compact responses send each syntax node once in a node table and reference it by {"node_id": ...}
+def resolve_node_table(compact_result):
+    nodes = compact_result["nodes"]
+    def resolve(o):
+        if isinstance(o, dict):
+            if len(o) == 1 and "node_id" in o:
+                return nodes[o["node_id"]]
+            return {key: resolve(value) for key, value in o.items()}
+        if isinstance(o, list):
+            return [resolve(el) for el in o]
+        return o
+    return resolve(compact_result["result"])
+
 class _Method():
     def __init__(self, func, name):
         self.func = func
@@ -57,10 +70,11 @@ class _Method():
         
 
 class JSONRPC_Client:
-    def __init__(self, sock, reader, writer):
+    def __init__(self, sock, reader, writer, compact=False):
         self.sock = sock
         self.reader = reader
         self.writer = writer
+        self.compact = compact
 
     def close(self):
         self.reader.close()
@@ -70,6 +84,8 @@ class JSONRPC_Client:
         # await self.writer.wait_closed()
 
     def send_request(self, method, params):
+        if self.compact:
+            params = dict(params, compact=True)
         request = JSONRPC20Request(
             method=method,
             params=params,
@@ -83,6 +99,8 @@ class JSONRPC_Client:
         response = JSONRPC20Response.deserialize(response)
         if "error" in response:
             raise Exception(response["error"]["message"] + ": " + str(response["error"]["data"]))
+        if self.compact:
+            response["result"] = resolve_node_table(response["result"])
         return response
     
     def __getattr__(self, name):
@@ -90,12 +108,12 @@ class JSONRPC_Client:
 
 
 
-def get_jsonrpc_client(socket_name):
+def get_jsonrpc_client(socket_name, compact=False):
     sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     sock.connect(socket_name)
     reader = sock.makefile(mode='rb') # binary
     writer = sock.makefile(mode='wb') # binary
 
-    return JSONRPC_Client(sock, reader, writer)
+    return JSONRPC_Client(sock, reader, writer, compact)
 
             
\ No newline at end of file
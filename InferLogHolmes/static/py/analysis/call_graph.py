@@ -48,12 +48,19 @@ class CallGraphAnalyzer(ast.NodeVisitor):
 
         
     
-def compute_call_graph(syntax_tree: ast.AST, scope_info, node: ast.AST):
+def compute_full_call_graph(syntax_tree: ast.AST, scope_info):
     functions = get_user_defined_functions(syntax_tree)
     
     cga = CallGraphAnalyzer(functions, scope_info)
     cga.visit(syntax_tree) # for the entire syntax_tree (file)
 
+    return functions, cga.call_graph
+
+# full_call_graph is the result of compute_full_call_graph for syntax_tree, recomputed if not given
+def compute_call_graph(syntax_tree: ast.AST, scope_info, node: ast.AST, full_call_graph=None):
+    if full_call_graph is None:
+        full_call_graph = compute_full_call_graph(syntax_tree, scope_info)
+    functions, call_graph = full_call_graph
 
     if node is not None:
         # get subset called by node
@@ -67,15 +74,14 @@ def compute_call_graph(syntax_tree: ast.AST, scope_info, node: ast.AST):
         to_process = called_functions
         while len(to_process) > 0:
             called = to_process.pop()
-            call_subgraph[called] = cga.call_graph[called]
+            call_subgraph[called] = call_graph[called]
             processed.add(called)
 
-            for sub_call in cga.call_graph[called]:
+            for sub_call in call_graph[called]:
                 if sub_call not in processed and sub_call not in to_process:
                     to_process.append(sub_call)
 
         return call_subgraph
     else:
         # return complete call graph
-        return cga.call_graph
-        
\ No newline at end of file
+        return call_graph
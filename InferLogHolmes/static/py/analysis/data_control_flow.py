@@ -1,11 +1,10 @@
 import math
 import ast
-from ast_utils.node_finder import NodeFinder
 from ast_utils.utils import get_assignment_name, get_name, get_call_name
 from ast_utils.scoped_tree import ScopedTree, FunctionDefinition, NameFinder, is_referenced_identifier
 from ast_utils.cfg import *
-from copy import copy
-from typing import Tuple, Optional
+from typing import Any, Tuple, Optional
+from collections import deque
 
 def get_cfgnode_target(cfgnode: CFGNode):
     if isinstance(cfgnode, AssignNode):
@@ -43,65 +42,129 @@ def point_to_same_element(identifier1: ast.Name, identifier2: ast.Name):
         return False
     return get_static_index_of_ref_identifier(identifier1) == get_static_index_of_ref_identifier(identifier2)
 
-def _get_RDs(scoped_tree: ScopedTree, cfgnode: CFGNode, identifier: ast.Name, path: list[CFGNode], rds: set[CFGNode], memo: dict[BranchNode, set[CFGNode]]):
-    for parent in cfgnode.parents:
-        if isinstance(parent, AssignNode):
-            target = get_cfgnode_target(parent)
-            if scoped_tree.identifieres_are_the_same(identifier, target):
-                rds.add(parent)
-                if not is_referenced_identifier(target):
-                    continue
-                if point_to_same_element(identifier, target):
-                    continue
-        elif isinstance(parent, (FuncArgNode, LoopIterNode)):
-            target = get_cfgnode_target(parent)
-            if scoped_tree.identifieres_are_the_same(identifier, target):
-                rds.add(parent)
-                continue
-        
-        is_cycle = any(p == parent for p in path)
-        if not is_cycle:
-            new_path = copy(path) if len(cfgnode.parents) > 1 else path
-            new_path.append(parent)
-            # we memoise at branch nodes to avoid path explosion
-            if isinstance(parent, BranchNode):
-                if parent in memo:
-                    branch_rds = memo[parent]
-                else:
-                    branch_rds = _get_RDs(scoped_tree, parent, identifier, new_path, set(), memo)
-                    memo[parent] = branch_rds
-                rds.update(branch_rds)
+# static index of referenced identifier x[...] as hashable key
+# two referenced identifiers point to the same element if they have the same key (see point_to_same_element)
+# None if the identifier cannot point to the same element as any other identifier
+def get_index_key(identifier: ast.Name):
+    if not is_referenced_identifier(identifier):
+        return None
+    index = get_static_index_of_ref_identifier(identifier)
+    if not isinstance(index, list):
+        return None
+    # unknown indices are math.nan and only compare equal by identity
+    if any(i != i and i is not math.nan for i in index):
+        return None
+    return tuple(index)
+
+# index key of element assignment that points to no other element
+_NEVER = object()
+
+# Reaching definitions of all CFGs as bit vectors (python ints), bit i stands for definition self.definitions[i].
+# Definitions are AssignNode, FuncArgNode and LoopIterNode.
+# An assignment to an element x[...] = ... kills the other definitions of x only for reads of the same element,
+# so the fixpoint depends on the index key of the read identifier and is computed once per key.
+class ReachingDefinitions:
+    def __init__(self, scoped_tree: ScopedTree):
+        self.nodes = [cfgnode for cfg in scoped_tree.cfgs.values() for cfgnode in [cfg.startnode, *cfg.nodes, cfg.endnode]]
+        self.definitions = [cfgnode for cfgnode in self.nodes if isinstance(cfgnode, (AssignNode, FuncArgNode, LoopIterNode))]
+        self.symbol_definitions: dict[Any, int] = dict() # symbol -> definitions of symbol
+        self.kills: list[tuple[Any, Any]] = [] # (symbol, index key) of definition, index key is None if definition always kills
+        for i, definition in enumerate(self.definitions):
+            target = get_cfgnode_target(definition)
+            symbol = scoped_tree.get_symbol(target)
+            self.symbol_definitions[symbol] = self.symbol_definitions.get(symbol, 0) | (1 << i)
+            if isinstance(definition, AssignNode) and is_referenced_identifier(target):
+                index_key = get_index_key(target)
+                self.kills.append((symbol, index_key if index_key is not None else _NEVER))
             else:
-                _get_RDs(scoped_tree, parent, identifier, new_path, rds, memo)
-    return rds
+                self.kills.append((symbol, None))
+        self.reach_in: dict[Any, dict[CFGNode, int]] = dict() # index key -> cfgnode -> definitions reaching cfgnode
+
+    def _solve(self, index_key) -> dict[CFGNode, int]:
+        gen = {cfgnode: 0 for cfgnode in self.nodes}
+        kill = {cfgnode: 0 for cfgnode in self.nodes}
+        for i, (definition, (symbol, kill_key)) in enumerate(zip(self.definitions, self.kills)):
+            gen[definition] = 1 << i
+            if kill_key is None or (index_key is not None and kill_key == index_key):
+                kill[definition] = self.symbol_definitions[symbol]
+
+        reach_in = {cfgnode: 0 for cfgnode in self.nodes}
+        reach_out = dict(gen)
+        worklist = deque(self.nodes)
+        on_worklist = set(self.nodes)
+        while len(worklist) > 0:
+            cfgnode = worklist.popleft()
+            on_worklist.discard(cfgnode)
+            rds = 0
+            for parent in cfgnode.parents:
+                rds |= reach_out[parent]
+            reach_in[cfgnode] = rds
+            out = gen[cfgnode] | (rds & ~kill[cfgnode])
+            if out != reach_out[cfgnode]:
+                reach_out[cfgnode] = out
+                for child in cfgnode.children:
+                    if child not in on_worklist:
+                        worklist.append(child)
+                        on_worklist.add(child)
+        return reach_in
+
+    def get_RDs(self, scoped_tree: ScopedTree, cfgnode: CFGNode, identifier: ast.Name) -> set[CFGNode]:
+        index_key = get_index_key(identifier)
+        if index_key not in self.reach_in:
+            self.reach_in[index_key] = self._solve(index_key)
+        bits = self.reach_in[index_key][cfgnode] & self.symbol_definitions.get(scoped_tree.get_symbol(identifier), 0)
+        rds = set()
+        while bits:
+            lowest = bits & -bits
+            rds.add(self.definitions[lowest.bit_length() - 1])
+            bits ^= lowest
+        return rds
+
+# computed once per scoped tree
+def get_reaching_definitions(scoped_tree: ScopedTree) -> ReachingDefinitions:
+    if scoped_tree.reaching_definitions is None:
+        scoped_tree.reaching_definitions = ReachingDefinitions(scoped_tree)
+    return scoped_tree.reaching_definitions
 
 def get_RDs(scoped_tree: ScopedTree, cfgnode: CFGNode, identifier: ast.Name):
-    return _get_RDs(scoped_tree, cfgnode, identifier, [], set(), dict())
-
-def _get_BPs(scoped_tree: ScopedTree, cfgnode: CFGNode, path: list[CFGNode], bps: set[CFGNode]):
-    if isinstance(cfgnode, JoinNode):
-        # j2 = cfgnode, b2 = cfgnode.branch_node
-        # if there is a bp b1 on this path, then b1 -> ... b2 -> ... j2 -> ... node -> ... j1
-        # since branch-join pairs cannot be interleaved (b1 cannot be on path between b2 and j2 - this is asserted in verify_cfg)
-        # that is we can skip to b2 which greatly avoids path explosion
-        return _get_BPs(scoped_tree, cfgnode.branch_node, path, bps)
-    
-    for parent in cfgnode.parents:
-        if isinstance(parent, BranchNode):
-            is_closed = any(p.branch_node == parent for p in path if isinstance(p, JoinNode))
-            if not is_closed:
-                # B -> ... -> node -> ... -> J
-                bps.add(parent)
-        
-        is_cycle = any(p == parent for p in path)
-        if not is_cycle:
-            new_path = copy(path) if len(cfgnode.parents) > 1 else path
-            new_path.append(parent)
-            _get_BPs(scoped_tree, parent, new_path, bps)
-    return bps
+    return get_reaching_definitions(scoped_tree).get_RDs(scoped_tree, cfgnode, identifier)
+
+# Control dependence of a CFG from its post-dominator tree (Ferrante, Ottenstein, Warren).
+# For an edge branch_node -> child, the nodes on the post-dominator tree path from child up to
+# the immediate post-dominator of branch_node (exclusive) are control dependent on branch_node.
+class ControlDependence:
+    def __init__(self, cfg: CFG):
+        ipdom = get_immediate_post_dominators(cfg)
+        self.control_dependence: dict[CFGNode, set[BranchNode]] = dict() # cfgnode -> branch nodes cfgnode directly depends on
+        for branch_node in ipdom:
+            if not isinstance(branch_node, BranchNode):
+                continue
+            for child in branch_node.children:
+                runner = child
+                while runner in ipdom and runner != ipdom[branch_node]:
+                    self.control_dependence.setdefault(runner, set()).add(branch_node)
+                    runner = ipdom[runner]
+        self.control_parents: dict[CFGNode, set[BranchNode]] = dict() # memo of get_control_parents
+
+    # all branch nodes that cfgnode transitively depends on
+    def get_control_parents(self, cfgnode: CFGNode) -> set[BranchNode]:
+        if cfgnode not in self.control_parents:
+            control_parents = set()
+            queue = deque([cfgnode])
+            while len(queue) > 0:
+                node = queue.popleft()
+                for branch_node in self.control_dependence.get(node, set()):
+                    if branch_node not in control_parents:
+                        control_parents.add(branch_node)
+                        queue.append(branch_node)
+            self.control_parents[cfgnode] = control_parents
+        return self.control_parents[cfgnode]
 
-def get_BPs(scoped_tree: ScopedTree, cfgnode: CFGNode):
-    return _get_BPs(scoped_tree, cfgnode, [], set())
+# computed once per CFG
+def get_control_dependence(scoped_tree: ScopedTree, cfg: CFG) -> ControlDependence:
+    if cfg not in scoped_tree.control_dependence:
+        scoped_tree.control_dependence[cfg] = ControlDependence(cfg)
+    return scoped_tree.control_dependence[cfg]
 
 def get_identifiers_read_in_syntaxnode(scoped_tree: ScopedTree, node: ast.AST):
     identifiers = None
@@ -130,12 +193,7 @@ def get_identifiers_read_in_syntaxnode(scoped_tree: ScopedTree, node: ast.AST):
 
 def find_call_sites_for_function(scoped_tree: ScopedTree, func_syntaxnode: ast.AST):
     assert isinstance(func_syntaxnode, ast.FunctionDef)
-    call_finder = NodeFinder(
-        lambda node: isinstance(node, ast.Call) and scoped_tree.identifieres_are_the_same(node.func, func_syntaxnode),
-        lambda node: node
-    )
-    call_finder.visit(scoped_tree.root_node)
-    return call_finder.result
+    return scoped_tree.get_call_sites(func_syntaxnode)
 
 def get_function_for_parameter(param_node: ast.arg):
      assert isinstance(param_node, ast.arg)
@@ -215,10 +273,8 @@ def data_deps_for_node(scoped_tree: ScopedTree, syntaxnode: ast.AST):
         return _data_deps_for_node(scoped_tree, cfgnode, syntaxnode)
 
 def maybe_get_user_function(scoped_tree: ScopedTree, identifier) -> Tuple[bool, Optional[FunctionDefinition]]:
-    for function in scoped_tree.all_functions:
-        if scoped_tree.identifieres_are_the_same(identifier, function.node):
-            return True, function
-    return False, None
+    function = scoped_tree.get_user_function(identifier)
+    return function is not None, function
 
 def _data_deps_for_node(scoped_tree: ScopedTree, cfgnode: CFGNode, syntaxnode: ast.AST):
     identifiers = get_identifiers_read_in_syntaxnode(scoped_tree, syntaxnode)
@@ -237,9 +293,13 @@ def _data_deps_for_node(scoped_tree: ScopedTree, cfgnode: CFGNode, syntaxnode: a
 
 def control_parents_for_node(scoped_tree: ScopedTree, syntaxnode: ast.AST):
     if isinstance(syntaxnode, ast.FunctionDef):
+        # union over control parents of all return statements
         cfg = scoped_tree.get_cfg_for_function_syntaxnode(syntaxnode)
-        cfgnode = list(cfg.endnode.parents)[0] # function join node
-        return _control_parents_for_node(scoped_tree, cfg, cfgnode)
+        control_parents = set()
+        for cfgnode in cfg.nodes:
+            if isinstance(cfgnode, ReturnNode):
+                control_parents = control_parents | _control_parents_for_node(scoped_tree, cfg, cfgnode)
+        return control_parents
     
     elif isinstance(syntaxnode, ast.arg) or isinstance(syntaxnode, ast.arguments):
         control_parents = set()
@@ -256,19 +316,5 @@ def control_parents_for_node(scoped_tree: ScopedTree, syntaxnode: ast.AST):
 
 def _control_parents_for_node(scoped_tree: ScopedTree, cfg: CFG, cfgnode: CFGNode):
     assert cfgnode in cfg.nodes
-    bps = get_BPs(scoped_tree, cfgnode)
-
-    if isinstance(cfg.startnode, FuncStartNode):
-        for branch_node in cfg.nodes:
-            if not isinstance(branch_node, BranchNode):
-                continue
-            if is_on_path_between_nodes(cfgnode, branch_node, cfg.endnode):
-                cfgnode.block()
-                branch_node.join_node.block()
-                if is_reachable(branch_node, cfg.endnode):
-                    bps.add(branch_node)
-                branch_node.join_node.unblock()
-                cfgnode.unblock()
-
+    bps = get_control_dependence(scoped_tree, cfg).get_control_parents(cfgnode)
     return {bp.syntaxnode.parent for bp in bps}
-
@@ -78,6 +78,48 @@ def is_reachable(startnode:CFGNode, endnode: CFGNode):
 def is_on_path_between_nodes(node: CFGNode, startnode: CFGNode, endnode: CFGNode):
     return is_reachable(startnode, node) and is_reachable(node, endnode)
 
+# immediate post-dominators of all nodes from which the endnode is reachable, ipdom[endnode] = endnode
+# dominators of the reversed CFG (Cooper, Harvey, Kennedy: A Simple, Fast Dominance Algorithm)
+def get_immediate_post_dominators(cfg: "CFG") -> dict[CFGNode, CFGNode]:
+    # postorder of depth first search from endnode along parents
+    postorder = []
+    visited = {cfg.endnode}
+    stack = [(cfg.endnode, iter(cfg.endnode.parents))]
+    while len(stack) > 0:
+        node, parents = stack[-1]
+        for parent in parents:
+            if parent not in visited:
+                visited.add(parent)
+                stack.append((parent, iter(parent.parents)))
+                break
+        else:
+            stack.pop()
+            postorder.append(node)
+    order = {node: i for i, node in enumerate(postorder)}
+
+    ipdom = {cfg.endnode: cfg.endnode}
+    def intersect(node1: CFGNode, node2: CFGNode):
+        while node1 != node2:
+            while order[node1] < order[node2]:
+                node1 = ipdom[node1]
+            while order[node2] < order[node1]:
+                node2 = ipdom[node2]
+        return node1
+
+    changed = True
+    while changed:
+        changed = False
+        # reverse postorder without endnode
+        for node in reversed(postorder[:-1]):
+            new_ipdom = None
+            for child in node.children:
+                if child in ipdom:
+                    new_ipdom = child if new_ipdom is None else intersect(child, new_ipdom)
+            if ipdom.get(node) != new_ipdom:
+                ipdom[node] = new_ipdom
+                changed = True
+    return ipdom
+
 from typing import Set,Dict,Optional
 class CFG:
     def __init__(self, startnode: StartNode, nodes: Set[CFGNode], endnode: EndNode) -> None:
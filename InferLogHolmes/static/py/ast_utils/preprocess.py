@@ -73,7 +73,14 @@ class PositionParentAdder(ast.NodeVisitor):
         self.line_offsets = line_offsets
 
     def visit(self, node: ast.AST):
+        self.add_position(node)
 
+        for child in ast.iter_child_nodes(node):
+            child.parent = node
+        
+        self.generic_visit(node)
+
+    def add_position(self, node: ast.AST):
         if has_position_info(node):
             start, end = get_first_last_byte(node, self.line_offsets)
             node.position = start
@@ -104,11 +111,6 @@ class PositionParentAdder(ast.NodeVisitor):
             node.end_position = end
             node.span = node.end_position - node.position
             node.source = self.file_content
-            
-        for child in ast.iter_child_nodes(node):
-            child.parent = node
-        
-        self.generic_visit(node)
 
         # min_child_position = float("inf")
         # max_child_end_position = -float("inf")
@@ -142,6 +144,40 @@ class PositionParentAdder(ast.NodeVisitor):
 #     def visit_Del(self, node: ast.Del):
 #         return ast.Del()
 
+# Moves the positions of a preprocessed syntax tree to an edited version of its source file.
+# Only applicable if the edit did not change the syntax, i.e. ast.dump(old_tree) == ast.dump(new_tree)
+# for the unprocessed trees old_tree and new_tree of the old and new file content.
+# Positions of preprocessed nodes are copied from the unprocessed nodes, so we map each (line, column)
+# that starts or ends an unprocessed node in old_tree to the corresponding one in new_tree.
+# Returns False and leaves the syntax tree unchanged if some position cannot be mapped.
+def update_positions(syntax_tree: "SyntaxTree", old_tree: ast.AST, new_tree: ast.AST, file_content: str, line_offsets: list[int]) -> bool:
+    new_points = {}
+    for old_node, new_node in zip(ast.walk(old_tree), ast.walk(new_tree)):
+        if has_position_info(old_node):
+            for old_point, new_point in [
+                ((old_node.lineno, old_node.col_offset), (new_node.lineno, new_node.col_offset)),
+                ((old_node.end_lineno, old_node.end_col_offset), (new_node.end_lineno, new_node.end_col_offset))]:
+                if new_points.setdefault(old_point, new_point) != new_point:
+                    return False
+
+    nodes = list(syntax_tree.node_to_id.keys())
+    updates = []
+    for node in nodes:
+        if has_position_info(node):
+            start = new_points.get((node.lineno, node.col_offset))
+            end = new_points.get((node.end_lineno, node.end_col_offset))
+            if start is None or end is None:
+                return False
+            updates.append((node, start, end))
+
+    for node, (lineno, col_offset), (end_lineno, end_col_offset) in updates:
+        node.lineno, node.col_offset = lineno, col_offset
+        node.end_lineno, node.end_col_offset = end_lineno, end_col_offset
+    position_adder = PositionParentAdder(file_content, line_offsets)
+    for node in nodes:
+        position_adder.add_position(node)
+    return True
+
 class NodeIdAssigner(ast.NodeVisitor):
     def __init__(self) -> None:
         self.node_to_id = {}
@@ -1,10 +1,10 @@
 import ast
-from typing import Any, Union
+from typing import Any, Optional, Union
 import ast_scope
 from ast_utils.node_finder import NodeFinder
 from ast_utils.node_finders import get_user_defined_functions
 from ast_utils.preprocess import SyntaxTree
-from ast_utils.utils import get_name, is_descendant
+from ast_utils.utils import get_name
 from ast_utils.cfg import *
 
 class Assignment:
@@ -47,6 +47,10 @@ def _get_id_str(identifier: ast.AST):
         if isinstance(identifier, ast.FunctionDef):
             return identifier.name
         
+# identifiers are the same if they have the same symbol
+def _get_symbol(scope_info, identifier: ast.AST):
+    return (_get_id_str(identifier), scope_info[identifier])
+
 def _identifieres_are_the_same(scope_info, identifier1: ast.AST, identifier2: ast.AST):
     if isinstance(identifier1, ast.Attribute) or isinstance(identifier2, ast.Attribute):
         # module function calls have call.func attribute which has no scope (is not user-defined symbol)
@@ -63,17 +67,38 @@ def _identifieres_are_the_same(scope_info, identifier1: ast.AST, identifier2: as
 
     return id1 == id2 and scope1 == scope2
 
+# Index of user symbols (name, scope), see _get_symbol
+class SymbolTable:
+    def __init__(self, scope_info, root_node: ast.AST, all_functions: list[FunctionDefinition]):
+        self.functions: dict[Any, FunctionDefinition] = dict()
+        self.call_sites: dict[Any, list[ast.Call]] = dict() # calls of user functions and other names, e.g. print
+        self.containers: set = set() # symbols x that are used as x[...]
+
+        for function in all_functions:
+            # first definition wins if a function is redefined
+            self.functions.setdefault(_get_symbol(scope_info, function.node), function)
+
+        for node in ast.walk(root_node):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+                self.call_sites.setdefault(_get_symbol(scope_info, node.func), []).append(node)
+            elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and is_referenced_identifier(node):
+                self.containers.add(_get_symbol(scope_info, node))
+
 class ScopedTree:
-    def __init__(self, syntax_tree: SyntaxTree, scope_info, all_definitions, all_functions, all_user_symbols, cfgs, is_container_variable):
+    def __init__(self, syntax_tree: SyntaxTree, scope_info, symbol_table: SymbolTable, all_definitions, all_functions, all_user_symbols, cfgs, cfgnode_index, is_container_variable):
         self.syntax_tree = syntax_tree
         self.root_node = syntax_tree.root_node
         self.scope_info = scope_info
+        self.symbol_table = symbol_table
         self.all_definitions = all_definitions
         self.all_functions = all_functions
         # print("all_functions:", [f.name for f in self.all_functions])
         self.all_user_symbols = all_user_symbols
         self.cfgs = cfgs
+        self.cfgnode_index = cfgnode_index # syntax node -> (cfg, cfgnode) of innermost CFG node containing it
         self.is_container_variable = is_container_variable
+        self.reaching_definitions = None # computed on first query, see analysis.data_control_flow
+        self.control_dependence = dict() # CFG -> control dependence, computed on first query
 
     def get_node_for_id(self, id: str) -> ast.AST:
         return self.syntax_tree.id_to_node[id]
@@ -84,13 +109,25 @@ class ScopedTree:
         
     def identifieres_are_the_same(self, identifier1: ast.AST, identifier2: ast.AST):
         return _identifieres_are_the_same(self.scope_info, identifier1, identifier2)
+
+    def get_symbol(self, identifier: ast.AST):
+        return _get_symbol(self.scope_info, identifier)
+
+    # returns the user defined function that identifier refers to or None
+    def get_user_function(self, identifier: ast.AST) -> Optional[FunctionDefinition]:
+        if not isinstance(identifier, (ast.Name, ast.FunctionDef)):
+            # e.g. module function calls np.array
+            return None
+        return self.symbol_table.functions.get(self.get_symbol(identifier))
+
+    def get_call_sites(self, func: ast.FunctionDef) -> list[ast.Call]:
+        return self.symbol_table.call_sites.get(self.get_symbol(func), [])
         
     def get_cfgnode_for_syntaxnode(self, node: ast.AST):
-        for _, cfg in self.cfgs.items():
-            for cfgnode in cfg.nodes:
-                if isinstance(cfgnode, (AssignNode, BranchNode, ReturnNode, ExprNode, LoopIterNode)) and is_descendant(cfgnode.syntaxnode, node):
-                    return cfg, cfgnode
-        raise Exception(f"No CFGNode found for syntaxnode {ast.dump(node)}")
+        owner = _get_innermost_cfgnode(self.cfgnode_index, node)
+        if owner is None:
+            raise Exception(f"No CFGNode found for syntaxnode {ast.dump(node)}")
+        return owner
     
     def get_cfg_for_function_syntaxnode(self, node: ast.FunctionDef):
         if node not in self.cfgs:
@@ -106,6 +143,31 @@ def NameFinder():
 def is_referenced_identifier(identifier: ast.Name):
     return isinstance(identifier, ast.Name) and isinstance(identifier.parent, ast.Subscript)
 
+# returns (cfg, cfgnode) of the innermost CFG node whose syntax node is node or an ancestor of node
+# the result is stored in cfgnode_index for all nodes on the way up
+def _get_innermost_cfgnode(cfgnode_index, node: ast.AST):
+    path = []
+    while node is not None and node not in cfgnode_index:
+        path.append(node)
+        node = getattr(node, "parent", None)
+    owner = cfgnode_index[node] if node is not None else None
+    for n in path:
+        cfgnode_index[n] = owner
+    return owner
+
+def get_cfgnode_index(syntax_tree: SyntaxTree, cfgs):
+    cfgnode_index = dict()
+    for _, cfg in cfgs.items():
+        for cfgnode in cfg.nodes:
+            if isinstance(cfgnode, (AssignNode, BranchNode, ReturnNode, ExprNode, LoopIterNode)):
+                # expressions that were transformed to return nodes keep their ExprNode, we use the ReturnNode
+                if isinstance(cfgnode_index.get(cfgnode.syntaxnode, (None, None))[1], ReturnNode):
+                    continue
+                cfgnode_index[cfgnode.syntaxnode] = (cfg, cfgnode)
+    for node in syntax_tree.node_to_id:
+        _get_innermost_cfgnode(cfgnode_index, node)
+    return cfgnode_index
+
 def get_scoped_tree(syntax_tree: SyntaxTree):
     node = syntax_tree.root_node
     scope_info = ast_scope.annotate(node) # ast.Name + ast.FunctionDef -> Scope
@@ -121,17 +183,16 @@ def get_scoped_tree(syntax_tree: SyntaxTree):
 
     
     cfgs = get_cfg_representation(node, syntax_tree.node_to_id)
+    cfgnode_index = get_cfgnode_index(syntax_tree, cfgs)
+
+    symbol_table = SymbolTable(scope_info, node, all_functions)
 
     all_identifiers = NameFinder().visit(node)
-    referenced_identifiers = set(identifier for identifier in all_identifiers if is_referenced_identifier(identifier))
     is_container_variable = dict()
     for identifier in all_identifiers:
         # check if identifier x is somewhere used as x[...]
-        is_container_variable[identifier] = any(
-            _identifieres_are_the_same(scope_info, identifier, ref_identifier)
-            for ref_identifier in referenced_identifiers
-        )
+        is_container_variable[identifier] = _get_symbol(scope_info, identifier) in symbol_table.containers
     # print(sorted(list({(name.id, b) for name,b in is_container_variable.items()})))
 
 
-    return ScopedTree(syntax_tree, scope_info, all_definitions, all_functions, all_user_symbols, cfgs, is_container_variable)
+    return ScopedTree(syntax_tree, scope_info, symbol_table, all_definitions, all_functions, all_user_symbols, cfgs, cfgnode_index, is_container_variable)
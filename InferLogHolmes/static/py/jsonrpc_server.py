@@ -24,21 +24,68 @@ def write_transport_layer(writer, response):
     writer.write(response_utf8)
     writer.flush()
 
-from jsonrpc.jsonrpc2 import JSONRPC20Request, JSONRPC20Response
+from jsonrpc.jsonrpc2 import JSONRPC20Request, JSONRPC20Response, JSONRPC20BatchResponse
 import json
 import dataclasses
+import functools
+from server_interface import SyntaxNode
+
+_FIELD_NAMES: dict[type, tuple[str, ...]] = dict()
+
+def _get_field_names(o) -> tuple[str, ...]:
+    cls = type(o)
+    if cls not in _FIELD_NAMES:
+        _FIELD_NAMES[cls] = tuple(field.name for field in dataclasses.fields(cls))
+    return _FIELD_NAMES[cls]
+
+class CompactResponse:
+    # Result where every SyntaxNode is replaced by the reference {"node_id": ...}.
+    # Each node is sent once in the node table: {"nodes": {node_id: SyntaxNode}, "result": result}.
+    def __init__(self, result):
+        self.result = result
+
+    def to_dict(self):
+        nodes = dict()
+        result = _to_compact(self.result, nodes)
+        return {"nodes": nodes, "result": result}
+
+def _to_compact(o, nodes: dict):
+    if isinstance(o, SyntaxNode):
+        if o.node_id not in nodes:
+            nodes[o.node_id] = {name: getattr(o, name) for name in _get_field_names(o)}
+        return {"node_id": o.node_id}
+    if isinstance(o, (list, tuple)):
+        return [_to_compact(el, nodes) for el in o]
+    if isinstance(o, dict):
+        return {key: _to_compact(value, nodes) for key, value in o.items()}
+    if dataclasses.is_dataclass(o):
+        return {name: _to_compact(getattr(o, name), nodes) for name in _get_field_names(o)}
+    return o
 
 class DataclassEncoder(json.JSONEncoder):
     def default(self, o):
-        if dataclasses.is_dataclass(o):
+        if isinstance(o, CompactResponse):
             return o.to_dict()
+        if dataclasses.is_dataclass(o):
+            # nested dataclasses are encoded by further calls of default, dataclasses_json's to_dict is much slower
+            return {name: getattr(o, name) for name in _get_field_names(o)}
         return super().default(o)
         
 def jsonrpc_serialize( data):
     return json.dumps(data, cls=DataclassEncoder)
 
+def with_compact_mode(func):
+    # adds the optional parameter compact to an RPC method, see CompactResponse
+    @functools.wraps(func)
+    def method(*args, compact: bool = False, **kwargs):
+        result = func(*args, **kwargs)
+        return CompactResponse(result) if compact else result
+    return method
+
 JSONRPC20Response.serialize = staticmethod(jsonrpc_serialize)
 JSONRPC20Request.serialize = staticmethod(jsonrpc_serialize)
+# batch responses do not use serialize
+JSONRPC20BatchResponse.json = property(lambda self: jsonrpc_serialize(self.data))
 
 def handle_client(reader, writer, dispatcher): 
     while True:
@@ -50,9 +97,8 @@ def handle_client(reader, writer, dispatcher):
         # print('response:', response.json)
         write_transport_layer(writer, response.json)
 
-from typing import Dict, Tuple, Any
-from ast_utils.scoped_tree import ScopedTree
-_SESSION: Dict[str, Tuple[Any,ScopedTree]] = dict()
+from session import SessionStore
+_SESSION = SessionStore() # tree id -> Session, bounded, see server.py for the limits
 
 def run_server(socket_name, dispatcher):
     server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -10,7 +10,7 @@ class ProbabilisticProgram:
         
         ppl = "minimal"
 
-        self.client = get_jsonrpc_client(socket_name)
+        self.client = get_jsonrpc_client(socket_name, compact=True)
         self.file_name = file_name
         self.ppl = ppl
 
@@ -20,6 +20,7 @@ class ProbabilisticProgram:
         self.tree_id = tree_id
 
     def close(self):
+        self.client.close_session(tree_id=self.tree_id)
         self.client.close()
 
     def get_model(self) -> Model:
@@ -51,6 +52,14 @@ class ProbabilisticProgram:
             object_hook=Interval.from_dict
         )
     
+    def estimate_value_ranges(self, model: Model) -> list[RandomVariableRanges]:
+        # supports and parameter ranges of all random variables of model, in topological order
+        return self.client.estimate_value_ranges(
+            tree_id=self.tree_id,
+            model=model,
+            object_hook=RandomVariableRanges.from_dict
+        )
+
     def get_call_graph(self, node: SyntaxNode) -> list[CallGraphNode]:
         return self.client.get_call_graph(
             tree_id=self.tree_id,
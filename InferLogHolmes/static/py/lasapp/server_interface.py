@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 from dataclasses_json import dataclass_json
 
 @dataclass_json
@@ -79,6 +80,20 @@ class Interval:
     high: str
 
 
+@dataclass_json
+@dataclass
+class ParamRange:
+    name: str
+    node: SyntaxNode
+    range: Interval
+
+@dataclass_json
+@dataclass
+class RandomVariableRanges:
+    node: SyntaxNode # of random variable
+    support: Optional[Interval] # None if the support could not be masked as interval
+    params: list[ParamRange]
+
 @dataclass_json
 @dataclass
 class SymbolicExpression:
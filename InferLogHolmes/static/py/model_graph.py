@@ -124,6 +124,39 @@ def merge_nodes_by_name(model_graph, label_method="name"):
         model_graph.edges = [edge for i, edge in enumerate(model_graph.edges) if not any(edge == edge2 for edge2 in model_graph.edges[i+1:])]
 
 
+def get_node_label(rv, label_method="name"):
+    if label_method == "name":
+        return f"{rv.name}\n~ {rv.distribution.name}"
+    elif label_method == "source":
+        return f"{rv.address_node.source_text}\n~ {rv.distribution.name}"
+    else:
+        raise Exception(f"Unknown label method {label_method}")
+
+# Canonical structured form of the model graph, all lists are sorted, so equal graphs give equal json:
+#   nodes: random variables with id (node_id of the random variable), name, distribution, label, is_observed
+#   edges: [from id, to id]
+#   plate: nested plates, the global plate has id None, loop plates have the node_id of the for loop
+#          and the source text of the iterated expression as label
+def model_graph_to_json(model_graph, label_method="name"):
+    def plate_to_json(plate):
+        members = sorted(m for m in plate.members if not isinstance(m, Plate))
+        subplates = sorted((plate_to_json(m) for m in plate.members if isinstance(m, Plate)), key=lambda p: p["id"])
+        if plate.control_dep is None:
+            return {"id": None, "label": None, "members": members, "plates": subplates}
+        return {"id": plate.control_dep.node.node_id, "label": plate.control_dep.control_node.source_text, "members": members, "plates": subplates}
+
+    nodes = []
+    for node_id, rv in sorted(model_graph.random_variables.items()):
+        nodes.append({
+            "id": node_id,
+            "name": rv.name,
+            "distribution": rv.distribution.name,
+            "label": get_node_label(rv, label_method),
+            "is_observed": rv.is_observed
+        })
+    edges = sorted({(x.node.node_id, y.node.node_id) for x, y in model_graph.edges})
+    return {"nodes": nodes, "edges": [list(edge) for edge in edges], "plate": plate_to_json(model_graph.plates["global"])}
+
 # label_method in ("name", "source")
 # "name" uses the random variable name provided by the backend
 # "source" uses the source text of the address node
@@ -1,27 +1,33 @@
-from collections import deque
-from functools import cmp_to_key
-from jsonrpc_server import run_server, _SESSION
+from collections import deque, OrderedDict
+from jsonrpc_server import run_server, with_compact_mode, _SESSION
 
 import ast
+import hashlib
+import heapq
+import json
+import threading
+from typing import Optional
 from ast_utils.scoped_tree import ScopedTree, get_scoped_tree
 from ast_utils.preprocess import preprocess_syntaxtree, SyntaxTree
 from ast_utils.node_finders import VariableDefinitionCollector, find_model, find_guide
 from ast_utils.utils import *
 
-from analysis.call_graph import compute_call_graph
+from analysis.call_graph import compute_call_graph, compute_full_call_graph
 from analysis.data_control_flow import data_deps_for_node, control_parents_for_node
 import analysis.interval_arithmetic as interval_arithmetic
 
 from ppls import *
 import server_interface
-import uuid
+from session import Session, get_content_hash
 
 import graphviz
 
-from model_graph import ModelGraph, Plate, merge_nodes_by_name
+from model_graph import ModelGraph, Plate, merge_nodes_by_name, model_graph_to_json, is_descendant
+from lasapp.distributions import infer_distribution_properties, to_interval, ParamDependentBound
 
-def get_syntax_tree(file_content: str, line_offsets: list[int], n_unroll_loops: int, uniquify_calls: bool) -> SyntaxTree:
-    syntax_tree = ast.parse(file_content)
+def get_syntax_tree(file_content: str, line_offsets: list[int], n_unroll_loops: int, uniquify_calls: bool, syntax_tree: ast.Module = None) -> SyntaxTree:
+    if syntax_tree is None:
+        syntax_tree = ast.parse(file_content)
     syntax_tree = preprocess_syntaxtree(syntax_tree, file_content, line_offsets, n_unroll_loops, uniquify_calls)
     return syntax_tree
 
@@ -86,27 +92,66 @@ def build_ast(file_name: str, ppl: str, n_unroll_loops: int) -> str:
     print("PPL:", ppl)
     
     ppl_obj = _PPL_DICT[ppl]
+
+    # the extension calls build_ast on every save and refresh
+    # files with the same content share a session, after layout-only edits (comments, whitespace)
+    # the last session of the file is kept with updated positions, any other edit rebuilds the file
+    content_key = (get_content_hash(file_content), ppl, n_unroll_loops)
+    file_key = (file_name, ppl, n_unroll_loops)
+    tree_id = _SESSION.find_content(content_key, file_key)
+    if tree_id is not None:
+        print("File unchanged.")
+        return tree_id
+
+    tree = ast.parse(file_content)
+    detached = _SESSION.detach_file(file_key)
+    if detached is not None:
+        tree_id, session = detached
+        # running queries of the previous version of the file are superseded
+        session.cancel()
+        updated = session.update_source(file_content, line_offsets, tree)
+        _SESSION.update_content(tree_id, content_key, file_key, updated)
+        if updated:
+            print("Syntax unchanged, updated positions.")
+            return tree_id
+        print("Syntax changed, rebuilding.")
+
     uniquify_calls = ppl != "beanmachine"
-    syntax_tree = get_syntax_tree(file_content, line_offsets, n_unroll_loops, uniquify_calls)
+    syntax_tree = get_syntax_tree(file_content, line_offsets, n_unroll_loops, uniquify_calls, tree)
     syntax_tree = ppl_obj.preprocess_syntax_tree(syntax_tree)
 
     scoped_tree = get_scoped_tree(syntax_tree)
-    uuid4 = str(uuid.uuid4())
-    _SESSION[uuid4] = ppl_obj, scoped_tree
-    return uuid4
+    return _SESSION.add(Session(ppl_obj, scoped_tree, file_content, tree), content_key, file_key)
+
+def close_session(tree_id: str) -> bool:
+    # releases the session returned by one build_ast call, it is freed when all calls that returned it are closed
+    print("close_session")
+    return _SESSION.close(tree_id)
+
+def get_session_stats() -> dict:
+    print("get_session_stats")
+    return _SESSION.get_stats()
 
 def get_model(tree_id: str) -> server_interface.Model:
     print("get_model")
-    ppl_obj, scoped_tree = _SESSION[tree_id]
+    session = _SESSION.get(tree_id)
+    with session.query():
+        return session.cached("model", None, lambda: _get_model(session))
 
-    model = find_model(scoped_tree.root_node, ppl_obj)
+def _get_model(session: Session) -> server_interface.Model:
+    scoped_tree = session.scoped_tree
+    model = find_model(scoped_tree.root_node, session.ppl)
 
     return server_interface.Model(model.name, to_syntax_node(scoped_tree.syntax_tree, model.node))
 
 def get_random_variables(tree_id: str) -> list[server_interface.RandomVariable]:
     print("get_random_variables")
+    session = _SESSION.get(tree_id)
+    with session.query():
+        return session.cached("random_variables", None, lambda: _get_random_variables(session))
 
-    ppl_obj, scoped_tree = _SESSION[tree_id]
+def _get_random_variables(session: Session) -> list[server_interface.RandomVariable]:
+    ppl_obj, scoped_tree = session.ppl, session.scoped_tree
 
     variables = get_variables(scoped_tree.syntax_tree, ppl_obj)
 
@@ -120,20 +165,28 @@ def get_random_variables(tree_id: str) -> list[server_interface.RandomVariable]:
 
 def get_data_dependencies(tree_id: str, node: dict) -> list[server_interface.SyntaxNode]:
     print("get_data_dependencies")
+    session = _SESSION.get(tree_id)
+    with session.query():
+        return session.cached("data_dependencies", node["node_id"], lambda: _get_data_dependencies(session, node["node_id"]))
 
-    _, scoped_tree = _SESSION[tree_id]
+def _get_data_dependencies(session: Session, node_id: str) -> list[server_interface.SyntaxNode]:
+    scoped_tree = session.scoped_tree
 
-    node = scoped_tree.get_node_for_id(node["node_id"])
+    node = scoped_tree.get_node_for_id(node_id)
     data_deps = data_deps_for_node(scoped_tree, node)
     response = [to_syntax_node(scoped_tree.syntax_tree, dep) for dep in data_deps]
     return response
 
 def get_control_dependencies(tree_id: str, node: dict) -> list[server_interface.ControlDependency]:
     print("get_control_dependencies")
+    session = _SESSION.get(tree_id)
+    with session.query():
+        return session.cached("control_dependencies", node["node_id"], lambda: _get_control_dependencies(session, node["node_id"]))
 
-    _, scoped_tree = _SESSION[tree_id]
+def _get_control_dependencies(session: Session, node_id: str) -> list[server_interface.ControlDependency]:
+    scoped_tree = session.scoped_tree
 
-    node = scoped_tree.get_node_for_id(node["node_id"])
+    node = scoped_tree.get_node_for_id(node_id)
     control_deps = control_parents_for_node(scoped_tree, node)
     response = []
     for dep in control_deps:
@@ -165,23 +218,19 @@ def get_control_dependencies(tree_id: str, node: dict) -> list[server_interface.
 def estimate_value_range(tree_id: str, expr: dict, mask: list[tuple[dict, dict]]) -> server_interface.Interval:
     print("estimate_value_range")
 
-    _, scoped_tree = _SESSION[tree_id]
+    session = _SESSION.get(tree_id)
+    with session.query():
+        return _estimate_value_range(session.scoped_tree, expr, mask)
 
+def _estimate_value_range(scoped_tree: ScopedTree, expr: dict, mask: list[tuple[dict, dict]]) -> server_interface.Interval:
     # mask is a list[tuple[SyntaxNode, Interval]]
     valuation = {}
     for _node, interval in mask:
         _node = server_interface.SyntaxNode.from_dict(_node)
         interval = server_interface.Interval.from_dict(interval)
-        parsed_interval = interval_arithmetic.Interval(float(interval.low), float(interval.high))
-        node = scoped_tree.get_node_for_id(_node.node_id)
-        if isinstance(node, ast.Assign):
-            program_variable_symbol = get_assignment_name(node).id
-            valuation[program_variable_symbol] = parsed_interval
-        elif isinstance(node, ast.FunctionDef):
-            program_variable_symbol = node.name
-            valuation[program_variable_symbol] = parsed_interval
-        else:
-            print(f"Cannot mask node of type {type(node)} {source_text(node)}.")
+        program_variable_symbol = get_mask_symbol(scoped_tree, _node.node_id)
+        if program_variable_symbol is not None:
+            valuation[program_variable_symbol] = interval_arithmetic.Interval(float(interval.low), float(interval.high))
 
     expr = server_interface.SyntaxNode.from_dict(expr)
     node_to_evaluate = scoped_tree.get_node_for_id(expr.node_id)
@@ -190,14 +239,139 @@ def estimate_value_range(tree_id: str, expr: dict, mask: list[tuple[dict, dict]]
 
     return server_interface.Interval(str(res.low), str(res.high))
 
+# program variable that is masked by the interval of node, None if node cannot be masked
+def get_mask_symbol(scoped_tree: ScopedTree, node_id: str) -> Optional[str]:
+    node = scoped_tree.get_node_for_id(node_id)
+    if isinstance(node, ast.Assign):
+        return get_assignment_name(node).id
+    elif isinstance(node, ast.FunctionDef):
+        return node.name
+    else:
+        print(f"Cannot mask node of type {type(node)} {source_text(node)}.")
+        return None
+
+def estimate_value_ranges(tree_id: str, model: dict) -> list[server_interface.RandomVariableRanges]:
+    # support masks and parameter ranges of all random variables of the model in one request,
+    # replaces one estimate_value_range call per parameter (see param_range.py)
+    print("estimate_value_ranges")
+    session = _SESSION.get(tree_id)
+    with session.query() as generation:
+        return _estimate_value_ranges(tree_id, session, generation, model["node"])
+
+def _estimate_value_ranges(tree_id: str, session: Session, generation: int, model_node: dict) -> list[server_interface.RandomVariableRanges]:
+    scoped_tree = session.scoped_tree
+    # random variables reachable from model
+    callers = [c.caller for c in get_call_graph(tree_id, model_node)]
+    random_variables = {rv.node.node_id: rv for rv in get_random_variables(tree_id) if any(is_descendant(c, rv.node) for c in callers)}
+    edges = _get_random_variable_dependencies(tree_id, session, generation, random_variables)
+    order = get_topological_order(random_variables, edges)
+
+    # We abstract the value of a random variable by its support.
+    # The parameters of a random variable only depend on the random variables before it in topological order,
+    # so their masks are known and the intervals of the program variables in valuation can be reused.
+    mask_valuation = {}
+    valuation = {}
+    supports = {}
+    for rv in order:
+        session.check_cancelled(generation)
+        support = _get_support_interval(scoped_tree, rv, valuation)
+        if support is None:
+            continue
+        supports[rv.node.node_id] = support
+        program_variable_symbol = get_mask_symbol(scoped_tree, rv.node.node_id)
+        if program_variable_symbol is None:
+            continue
+        mask_valuation[program_variable_symbol] = interval_arithmetic.Interval(float(support.low), float(support.high))
+        if program_variable_symbol in valuation:
+            # the variable was read before it was masked (e.g. z[k] depends on z[k-1]), intervals derived from it are outdated
+            valuation = dict(mask_valuation)
+        else:
+            valuation[program_variable_symbol] = mask_valuation[program_variable_symbol]
+
+    # parameter ranges under the masks of all random variables
+    valuation = dict(mask_valuation)
+    response = []
+    for rv in order:
+        session.check_cancelled(generation)
+        params = []
+        for param in rv.distribution.params:
+            res = _static_interval_eval(scoped_tree, param.node.node_id, valuation)
+            params.append(server_interface.ParamRange(param.name, param.node, server_interface.Interval(str(res.low), str(res.high))))
+        response.append(server_interface.RandomVariableRanges(rv.node, supports.get(rv.node.node_id), params))
+    return response
+
+def _static_interval_eval(scoped_tree: ScopedTree, node_id: str, valuation: dict) -> interval_arithmetic.Interval:
+    return interval_arithmetic.static_interval_eval(scoped_tree, scoped_tree.get_node_for_id(node_id), valuation)
+
+# support of random variable as interval, bounds that depend on a parameter are estimated with valuation
+def _get_support_interval(scoped_tree: ScopedTree, rv: server_interface.RandomVariable, valuation: dict) -> Optional[server_interface.Interval]:
+    properties = infer_distribution_properties(rv)
+    if properties is None:
+        print(f"Could not find properties for {rv.node.source_text}")
+        return None
+    support = to_interval(properties.support)
+    if support is None:
+        print(f"Could not mask support as interval for {rv.node.source_text}")
+        return None
+    params = {param.name: param for param in rv.distribution.params}
+    if isinstance(support.low, ParamDependentBound):
+        if support.low.param not in params:
+            print(f"Could not mask support as interval for {rv.node.source_text}")
+            return None
+        support.low = _static_interval_eval(scoped_tree, params[support.low.param].node.node_id, valuation).low
+    if isinstance(support.high, ParamDependentBound):
+        if support.high.param not in params:
+            print(f"Could not mask support as interval for {rv.node.source_text}")
+            return None
+        support.high = _static_interval_eval(scoped_tree, params[support.high.param].node.node_id, valuation).high
+    return server_interface.Interval(str(support.low), str(support.high))
+
+# random variables such that every random variable comes after the random variables it depends on,
+# ties and cycles are resolved by source order
+def get_topological_order(random_variables: dict[str, server_interface.RandomVariable], edges) -> list[server_interface.RandomVariable]:
+    position = {node_id: i for i, node_id in enumerate(random_variables)}
+    n_parents = {node_id: 0 for node_id in random_variables}
+    children = {node_id: set() for node_id in random_variables}
+    for dep_rv, rv in edges:
+        x, y = dep_rv.node.node_id, rv.node.node_id
+        if x != y and y not in children[x]:
+            children[x].add(y)
+            n_parents[y] += 1
+
+    heap = [(position[node_id], node_id) for node_id, n in n_parents.items() if n == 0]
+    heapq.heapify(heap)
+    order = []
+    done = set()
+    while len(order) < len(random_variables):
+        if len(heap) == 0:
+            # cycle, continue with the first remaining random variable
+            node_id = min((node_id for node_id in random_variables if node_id not in done), key=position.get)
+            heapq.heappush(heap, (position[node_id], node_id))
+        _, node_id = heapq.heappop(heap)
+        if node_id in done:
+            continue
+        done.add(node_id)
+        order.append(random_variables[node_id])
+        for child in children[node_id]:
+            n_parents[child] -= 1
+            if n_parents[child] == 0:
+                heapq.heappush(heap, (position[child], child))
+    return order
+
 def get_call_graph(tree_id: str, node: dict) -> list[server_interface.CallGraphNode]:
     print("get_call_graph")
+    session = _SESSION.get(tree_id)
+    with session.query():
+        return session.cached("call_graph", node["node_id"], lambda: _get_call_graph(session, node["node_id"]))
 
-    _, scoped_tree = _SESSION[tree_id]
+def _get_call_graph(session: Session, node_id: str) -> list[server_interface.CallGraphNode]:
+    scoped_tree = session.scoped_tree
 
-    node = scoped_tree.get_node_for_id(node["node_id"])
+    node = scoped_tree.get_node_for_id(node_id)
 
-    call_graph = compute_call_graph(scoped_tree.root_node, scoped_tree.scope_info, node)
+    # the call graph of the whole file is computed once per session
+    full_call_graph = session.cached("full_call_graph", None, lambda: compute_full_call_graph(scoped_tree.root_node, scoped_tree.scope_info))
+    call_graph = compute_call_graph(scoped_tree.root_node, scoped_tree.scope_info, node, full_call_graph)
 
     call_nodes = []
     for caller, called in call_graph.items():
@@ -209,58 +383,83 @@ def get_call_graph(tree_id: str, node: dict) -> list[server_interface.CallGraphN
     return call_nodes
 
 def plot_model_graph(model_graph, label_method="name"):
+    return render_graph_svg(model_graph_to_json(model_graph, label_method))
+
+# rendered svgs by hash of the graph json, refreshes of an unchanged model do not start dot again
+_SVG_CACHE: OrderedDict[str, str] = OrderedDict()
+_SVG_CACHE_SIZE = 64
+_SVG_CACHE_LOCK = threading.Lock()
+
+def get_graph_hash(graph_json: dict) -> str:
+    return hashlib.sha256(json.dumps(graph_json, sort_keys=True).encode("utf-8")).hexdigest()
+
+def render_graph_svg(graph_json: dict) -> str:
+    graph_hash = get_graph_hash(graph_json)
+    with _SVG_CACHE_LOCK:
+        if graph_hash in _SVG_CACHE:
+            _SVG_CACHE.move_to_end(graph_hash)
+            return _SVG_CACHE[graph_hash]
+
+    nodes = {node["id"]: node for node in graph_json["nodes"]}
 
     def get_graph(plate, graph=None):
         if graph is None:
             graph = graphviz.Digraph(
-                name='cluster_'+plate.control_dep.node.node_id,
-                # graph_attr={'label': plate.control_dep["controlsub_node"]["source_text"]}
+                name='cluster_'+plate["id"],
+                # graph_attr={'label': plate["label"]}
                 )
-        
-        for m in plate.members:
-            if isinstance(m, Plate):
-                subgraph = get_graph(m)
-                graph.subgraph(subgraph)
+
+        for m in plate["members"]:
+            node = nodes[m]
+            if node["is_observed"]:
+                graph.node(m, node["label"], style="filled", fillcolor="gray")
             else:
-                rv = model_graph.random_variables[m]
-                if label_method == "name":
-                    label = f"{rv.name}\n~ {rv.distribution.name}"
-                elif label_method == "source":
-                    label = f"{rv.address_node.source_text}\n~ {rv.distribution.name}"
-                else:
-                    raise Exception(f"Unknown label method {label_method}")
-                # for p in rv.distribution.params:
-                #     label += f"\n{p.name} = {p.node.source_text}"
-                if rv.is_observed:
-                    graph.node(m, label, style="filled", fillcolor="gray")
-                else:
-                    graph.node(m, label)
+                graph.node(m, node["label"])
+        for subplate in plate["plates"]:
+            graph.subgraph(get_graph(subplate))
         return graph
 
     dot = graphviz.Digraph('model', engine="dot")
-    dot = get_graph(model_graph.plates["global"],graph=dot)
+    dot = get_graph(graph_json["plate"], graph=dot)
 
-    for x,y in model_graph.edges:
-        dot.edge(x.node.node_id, y.node.node_id)
+    for x, y in graph_json["edges"]:
+        dot.edge(x, y)
 
-    return dot.pipe(format='svg', encoding='utf-8')
+    svg = dot.pipe(format='svg', encoding='utf-8')
+    with _SVG_CACHE_LOCK:
+        _SVG_CACHE[graph_hash] = svg
+        while len(_SVG_CACHE) > _SVG_CACHE_SIZE:
+            _SVG_CACHE.popitem(last=False)
+    return svg
 
 
 def get_graph(tree_id: str, model: any):
-    _, scoped_tree = _SESSION[tree_id]
-
-    temp_rv = get_random_variables(tree_id)
-    random_variables = { rv.node.node_id: rv for rv in temp_rv }
-
+    session = _SESSION.get(tree_id)
+    with session.query() as generation:
+        graph_json = _get_graph_json(tree_id, session, generation)
+    # rendering only uses the graph json and runs without holding the session
+    return render_graph_svg(graph_json)
+
+def get_graph_json(tree_id: str, model: any) -> dict:
+    # model graph as nodes, edges and plates (see model_graph_to_json) for layout in the webview
+    print("get_graph_json")
+    session = _SESSION.get(tree_id)
+    with session.query() as generation:
+        return _get_graph_json(tree_id, session, generation)
+
+def _get_graph_json(tree_id: str, session: Session, generation: int) -> dict:
+    return session.cached("graph_json", None, lambda: model_graph_to_json(_get_model_graph(tree_id, session, generation)))
+
+# edges (dep_rv, rv) if rv depends on dep_rv by data or control dependencies, the traversal stops at random variables
+def _get_random_variable_dependencies(tree_id: str, session: Session, generation: int, random_variables: dict[str, server_interface.RandomVariable]):
     edges = []
-    plates = {"global": Plate(None)}
-
     for _, rv in random_variables.items():
         marked = set()
         # we recursively get all data and control dependencies of random variable node
         queue = deque([rv.address_node, rv.distribution.node])
 
         while len(queue) > 0:
+            session.check_cancelled(generation)
             # get next node, FIFO
             node = queue.popleft()
 
@@ -287,12 +486,21 @@ def get_graph(tree_id: str, model: any):
                 if dep.control_node.node_id not in marked:
                     queue.append(dep.control_node)
                     marked.add(dep.control_node.node_id)
-                    
+
+    return edges
+
+def _get_model_graph(tree_id: str, session: Session, generation: int) -> ModelGraph:
+    temp_rv = get_random_variables(tree_id)
+    random_variables = { rv.node.node_id: rv for rv in temp_rv }
+
+    edges = _get_random_variable_dependencies(tree_id, session, generation, random_variables)
+    plates = {"global": Plate(None)}
 
     # compute plates from control_parents
     for _, rv in random_variables.items():
         control_deps = get_control_dependencies(tree_id, rv.node.__dict__)
-        control_deps = sorted(control_deps, key=cmp_to_key(lambda c1, c2: is_descendant(c1.node, c2.node)))
+        # outer loops first
+        control_deps = sorted(control_deps, key=lambda c: (c.node.first_byte, -c.node.last_byte))
         current_plate = plates["global"]
         for dep in control_deps:
             if dep.kind == "for":
@@ -308,12 +516,17 @@ def get_graph(tree_id: str, model: any):
     model_graph = ModelGraph(random_variables, plates, edges)
     merge_nodes_by_name(model_graph, "source")
     
-    return plot_model_graph(model_graph)
+    return model_graph
 
 
 from collections import deque
 def get_funnel_relationships(tree_id: str, model: any):
     print("get_funnel_relationships")
+    session = _SESSION.get(tree_id)
+    with session.query() as generation:
+        return _get_funnel_relationships(tree_id, session, generation)
+
+def _get_funnel_relationships(tree_id: str, session: Session, generation: int):
     random_variables = {rv.node.node_id: rv for rv in get_random_variables(tree_id)}
 
     funnel_deps = []    
@@ -325,6 +538,7 @@ def get_funnel_relationships(tree_id: str, model: any):
                 marked = set()
                 queue = deque([param.node])
                 while len(queue) > 0:
+                    session.check_cancelled(generation)
                     node = queue.popleft()
                     data_deps = get_data_dependencies(tree_id, node.__dict__)
                     for dep in data_deps:
@@ -341,6 +555,21 @@ def get_funnel_relationships(tree_id: str, model: any):
     print(funnel_deps)
     return funnel_deps
 
+def analyze_model(file_name: str, ppl: str, n_unroll_loops: int) -> server_interface.ModelAnalysis:
+    # build_ast, get_model, get_random_variables, get_call_graph (of the model), get_graph and get_funnel_relationships
+    # in one request, the queries share the memoized data and control dependencies of the session
+    print("analyze_model")
+    tree_id = build_ast(file_name, ppl, n_unroll_loops)
+    session = _SESSION.get(tree_id)
+    with session.query() as generation:
+        model = get_model(tree_id)
+        random_variables = get_random_variables(tree_id)
+        call_graph = get_call_graph(tree_id, model.node.__dict__)
+        graph_json = _get_graph_json(tree_id, session, generation)
+        funnel_relationships = _get_funnel_relationships(tree_id, session, generation)
+    graph = render_graph_svg(graph_json)
+    return server_interface.ModelAnalysis(tree_id, model, random_variables, call_graph, graph, funnel_relationships)
+
 import sys
 from jsonrpc import JSONRPCResponseManager, dispatcher
 import os
@@ -348,24 +577,36 @@ from pathlib import Path
 from werkzeug.wrappers import Request, Response
 from werkzeug.serving import run_simple
 
+# Dispatcher is dictionary {<method_name>: callable}
+dispatcher["build_ast"] = with_compact_mode(build_ast)
+dispatcher["get_random_variables"] = with_compact_mode(get_random_variables)
+dispatcher["get_model"] = with_compact_mode(get_model)
+dispatcher["get_data_dependencies"] = with_compact_mode(get_data_dependencies)
+dispatcher["get_control_dependencies"] = with_compact_mode(get_control_dependencies)
+dispatcher["estimate_value_range"] = with_compact_mode(estimate_value_range)
+dispatcher["estimate_value_ranges"] = with_compact_mode(estimate_value_ranges)
+dispatcher["get_call_graph"] = with_compact_mode(get_call_graph)
+dispatcher["get_graph"] = with_compact_mode(get_graph)
+dispatcher["get_graph_json"] = with_compact_mode(get_graph_json)
+dispatcher["get_funnel_relationships"] = with_compact_mode(get_funnel_relationships)
+dispatcher["analyze_model"] = with_compact_mode(analyze_model)
+dispatcher["close_session"] = with_compact_mode(close_session)
+dispatcher["get_session_stats"] = with_compact_mode(get_session_stats)
+
 @Request.application
 def application(request):
-    # Dispatcher is dictionary {<method_name>: callable}
-    dispatcher["build_ast"] = build_ast
-    dispatcher["get_random_variables"] = get_random_variables
-    dispatcher["get_model"] = get_model
-    dispatcher["get_data_dependencies"] = get_data_dependencies
-    dispatcher["get_control_dependencies"] = get_control_dependencies
-    dispatcher["estimate_value_range"] = estimate_value_range
-    dispatcher["get_call_graph"] = get_call_graph
-    dispatcher["get_graph"] = get_graph
-    dispatcher["get_funnel_relationships"] = get_funnel_relationships
-
     response = JSONRPCResponseManager.handle(
         request.data, dispatcher)
     return Response(response.json, mimetype='application/json')
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-sessions", type=int, default=32, help="maximum number of analysed files kept in memory")
+    parser.add_argument("--max-session-mb", type=int, default=1024, help="estimated memory budget of the sessions in MB")
+    args = parser.parse_args()
+    _SESSION.configure(args.max_sessions, args.max_session_mb * 1024 * 1024)
+
     # socket_name = sys.argv[1]
     Path("./.pipe").mkdir(exist_ok=True)
     socket_name = "./.pipe/python_rpc_socket"
@@ -374,7 +615,8 @@ if __name__ == '__main__':
         os.remove(socket_name)
 
     print("Started Python Language Server", socket_name)
-    run_simple('localhost', 4000, application)
+    # requests are handled in threads, so a slow get_graph does not block other queries
+    run_simple('localhost', 4000, application, threaded=True)
 
     #dispatcher["build_ast"] = build_ast
     #dispatcher["get_random_variables"] = get_random_variables
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 from dataclasses_json import dataclass_json
 
 @dataclass_json
@@ -63,7 +64,31 @@ class Interval:
     low: str
     high: str
 
+@dataclass_json
+@dataclass
+class ParamRange:
+    name: str
+    node: SyntaxNode
+    range: Interval
+
+@dataclass_json
+@dataclass
+class RandomVariableRanges:
+    node: SyntaxNode # of random variable
+    support: Optional[Interval] # None if the support could not be masked as interval
+    params: list[ParamRange]
+
 @dataclass_json
 @dataclass
 class SymbolicExpression:
-    expr: str
\ No newline at end of file
+    expr: str
+
+@dataclass_json
+@dataclass
+class ModelAnalysis:
+    tree_id: str
+    model: Model
+    random_variables: list[RandomVariable]
+    call_graph: list[CallGraphNode]
+    graph: str
+    funnel_relationships: list[tuple[RandomVariable, RandomVariable]]
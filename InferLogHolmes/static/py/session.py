@@ -0,0 +1,288 @@
+import ast
+import hashlib
+import itertools
+import sys
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Optional
+from ast_utils.scoped_tree import ScopedTree
+from ast_utils.preprocess import update_positions
+
+def get_content_hash(file_content: str) -> str:
+    return hashlib.sha256(file_content.encode("utf-8")).hexdigest()
+
+def get_syntax_hash(tree: ast.Module) -> str:
+    # hash of the syntax of the module, positions are not included
+    return hashlib.sha256(ast.dump(tree).encode("utf-8")).hexdigest()
+
+class QueryCancelled(Exception):
+    pass
+
+class RWLock:
+    # Many readers or one writer, waiting writers block new readers.
+    # Read locks are reentrant per thread, because queries call other queries (e.g. get_graph calls get_data_dependencies).
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = False
+        self.waiting_writers = 0
+        self.local = threading.local()
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0:
+            with self.cond:
+                while self.writer or self.waiting_writers > 0:
+                    self.cond.wait()
+                self.readers += 1
+        self.local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self.local.depth = depth
+            if depth == 0:
+                with self.cond:
+                    self.readers -= 1
+                    self.cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.cond:
+            self.waiting_writers += 1
+            while self.writer or self.readers > 0:
+                self.cond.wait()
+            self.waiting_writers -= 1
+            self.writer = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writer = False
+                self.cond.notify_all()
+
+class Session:
+    # state of one build_ast call
+    # the scoped tree is only modified by update_source, so query results are memoized until the source changes
+    # Queries run concurrently under the read lock. The analyses only add fully computed results to their caches
+    # (reaching definitions, control dependence, cfgnode index), so concurrent readers at most compute a result twice.
+    # update_source takes the write lock and cancels the running queries first, see cancel.
+    def __init__(self, ppl: Any, scoped_tree: ScopedTree, file_content: str, tree: ast.Module):
+        self.ppl = ppl
+        self.scoped_tree = scoped_tree
+        self.memo: dict[str, dict[Hashable, Any]] = dict() # query kind -> key -> result
+        self.content_hash = get_content_hash(file_content)
+        self.tree = tree # ast.parse(file_content) before preprocessing
+        self.syntax_hash = get_syntax_hash(tree)
+        self.n_bytes = estimate_session_size(scoped_tree, file_content, tree) # estimated once, memoized results are not counted
+        self.lock = RWLock()
+        self.generation = 0 # incremented when running queries are superseded
+
+    @contextmanager
+    def query(self):
+        # yields the generation of the query for check_cancelled
+        with self.lock.read():
+            yield self.generation
+
+    def cancel(self):
+        # long running queries of this session stop at their next check_cancelled
+        with self.lock.cond:
+            self.generation += 1
+
+    def check_cancelled(self, generation: int):
+        if generation != self.generation:
+            raise QueryCancelled("Query was superseded by a newer build_ast of the file.")
+
+    def cached(self, kind: str, key: Hashable, compute: Callable[[], Any]):
+        # returned results are shared between queries and must not be mutated
+        table = self.memo.setdefault(kind, dict())
+        if key not in table:
+            table[key] = compute()
+        return table[key]
+
+    def update_source(self, file_content: str, line_offsets: list[int], tree: ast.Module) -> bool:
+        # Layout-only fast path: if the syntax did not change (e.g. only whitespace or comments were edited),
+        # the analyses of the scoped tree stay valid and we only move the positions of the syntax nodes.
+        # Any other edit returns False and the whole file has to be rebuilt.
+        # TODO: reuse the analyses of unchanged top-level statements, needs node ids that are stable across builds
+        if get_syntax_hash(tree) != self.syntax_hash:
+            return False
+        self.cancel()
+        with self.lock.write():
+            if not update_positions(self.scoped_tree.syntax_tree, self.tree, tree, file_content, line_offsets):
+                return False
+            # cached responses contain positions
+            self.memo = dict()
+            self.content_hash = get_content_hash(file_content)
+            self.tree = tree
+        return True
+
+def estimate_session_size(scoped_tree: ScopedTree, file_content: str, tree: ast.Module) -> int:
+    # rough number of bytes held by a session, the syntax nodes and CFG nodes dominate
+    size = sys.getsizeof(file_content)
+    for node in itertools.chain(ast.walk(scoped_tree.root_node), ast.walk(tree)):
+        size += sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+    for cfg in scoped_tree.cfgs.values():
+        for cfgnode in cfg.nodes:
+            size += sys.getsizeof(cfgnode) + sys.getsizeof(cfgnode.__dict__)
+    for index in (scoped_tree.syntax_tree.node_to_id, scoped_tree.syntax_tree.id_to_node, scoped_tree.cfgnode_index, scoped_tree.is_container_variable):
+        size += sys.getsizeof(index)
+    return size
+
+class SessionStore:
+    # Sessions by tree id in least recently used order.
+    # Files with the same content share one session, so the store is indexed by
+    #   content key (content_hash, ppl, n_unroll_loops) and file key (file_name, ppl, n_unroll_loops).
+    # Every build_ast that returns a tree id holds a reference to its session for its file key, close releases
+    # one reference and the session is only removed when the last holder closed it. When a file is rebuilt
+    # after a syntax change, all references of that file to its previous session are released.
+    # If there are more than max_sessions sessions or they take more than max_bytes,
+    # the least recently used sessions are evicted and have to be rebuilt with build_ast.
+    def __init__(self, max_sessions: int = 32, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions: OrderedDict[str, Session] = OrderedDict()
+        self.content_keys: dict[str, tuple] = dict() # tree id -> content key
+        self.content_index: dict[tuple, str] = dict() # content key -> tree id
+        self.file_index: dict[tuple, str] = dict() # file key -> tree id of last build_ast
+        self.holders: dict[str, Counter] = dict() # tree id -> file key -> number of build_ast calls that returned it and were not closed
+        self.n_bytes = 0
+        self.stats = Counter() # builds, content_hits, layout_updates, replaced, evictions, evicted_bytes, closed
+        self.lock = threading.RLock() # the store is shared by the request threads, sessions have their own locks
+
+    def __contains__(self, tree_id: str) -> bool:
+        with self.lock:
+            return tree_id in self.sessions
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.sessions)
+
+    def get(self, tree_id: str) -> Session:
+        with self.lock:
+            if tree_id not in self.sessions:
+                raise Exception(f"Unknown tree id {tree_id}, the session was closed or evicted. Call build_ast again.")
+            self.sessions.move_to_end(tree_id)
+            return self.sessions[tree_id]
+
+    def find_content(self, content_key: tuple, file_key: tuple) -> Optional[str]:
+        # returns the tree id of a session with the same content and links file_key to it
+        with self.lock:
+            tree_id = self.content_index.get(content_key)
+            if tree_id is None:
+                return None
+            self.sessions.move_to_end(tree_id)
+            self.file_index[file_key] = tree_id
+            self.holders[tree_id][file_key] += 1
+            self.stats["content_hits"] += 1
+            return tree_id
+
+    def detach_file(self, file_key: tuple) -> Optional[tuple[str, Session]]:
+        # returns the last session of the file and its tree id if no other file shares it
+        # no other file can link to the session until update_content, as the session may be updated in place
+        with self.lock:
+            tree_id = self.file_index.get(file_key)
+            if tree_id is None or tree_id not in self.sessions:
+                return None
+            if sum(1 for t in self.file_index.values() if t == tree_id) > 1:
+                # the file is rebuilt, the other files keep the shared session
+                del self.file_index[file_key]
+                self._release_file(tree_id, file_key)
+                return None
+            if self.content_index.get(self.content_keys[tree_id]) == tree_id:
+                del self.content_index[self.content_keys[tree_id]]
+            return tree_id, self.sessions[tree_id]
+
+    def add(self, session: Session, content_key: tuple, file_key: tuple) -> str:
+        with self.lock:
+            tree_id = str(uuid.uuid4())
+            self.sessions[tree_id] = session
+            self.content_keys[tree_id] = content_key
+            self.content_index[content_key] = tree_id
+            self.file_index[file_key] = tree_id
+            self.holders[tree_id] = Counter({file_key: 1})
+            self.n_bytes += session.n_bytes
+            self.stats["builds"] += 1
+            self._evict(keep=tree_id)
+            return tree_id
+
+    def update_content(self, tree_id: str, content_key: tuple, file_key: tuple, updated: bool):
+        # called after detach_file, updated is True if the source of the session was updated to content_key
+        # otherwise the file is rebuilt and releases the previous session
+        with self.lock:
+            if tree_id not in self.sessions:
+                return
+            if updated:
+                self.content_keys[tree_id] = content_key
+                self.sessions.move_to_end(tree_id)
+                self.holders[tree_id][file_key] += 1
+                self.stats["layout_updates"] += 1
+            elif self._release_file(tree_id, file_key):
+                return
+            self.content_index.setdefault(self.content_keys[tree_id], tree_id)
+
+    def close(self, tree_id: str) -> bool:
+        # releases one reference, returns False if the session is unknown (already closed or evicted)
+        with self.lock:
+            if tree_id not in self.sessions:
+                return False
+            holders = self.holders[tree_id]
+            holders[next(iter(+holders))] -= 1
+            if holders.total() > 0:
+                return True
+            self._remove(tree_id).cancel()
+            self.stats["closed"] += 1
+            return True
+
+    def clear(self):
+        with self.lock:
+            for tree_id in list(self.sessions):
+                self._remove(tree_id)
+
+    def configure(self, max_sessions: int, max_bytes: int):
+        with self.lock:
+            self.max_sessions = max_sessions
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def get_stats(self) -> dict[str, int]:
+        with self.lock:
+            stats = {key: self.stats[key] for key in ("builds", "content_hits", "layout_updates", "replaced", "evictions", "evicted_bytes", "closed")}
+            stats["sessions"] = len(self.sessions)
+            stats["bytes"] = self.n_bytes
+            stats["max_sessions"] = self.max_sessions
+            stats["max_bytes"] = self.max_bytes
+            return stats
+
+    def _remove(self, tree_id: str) -> Session:
+        session = self.sessions.pop(tree_id)
+        content_key = self.content_keys.pop(tree_id)
+        self.holders.pop(tree_id, None)
+        if self.content_index.get(content_key) == tree_id:
+            del self.content_index[content_key]
+        for file_key in [key for key, t in self.file_index.items() if t == tree_id]:
+            del self.file_index[file_key]
+        self.n_bytes -= session.n_bytes
+        return session
+
+    def _release_file(self, tree_id: str, file_key: tuple) -> bool:
+        # releases the references of file_key, returns True if the session was removed
+        del self.holders[tree_id][file_key]
+        if self.holders[tree_id].total() > 0:
+            return False
+        self._remove(tree_id).cancel()
+        self.stats["replaced"] += 1
+        return True
+
+    def _evict(self, keep: Optional[str] = None):
+        while len(self.sessions) > self.max_sessions or self.n_bytes > self.max_bytes:
+            tree_id = next(iter(self.sessions))
+            if tree_id == keep:
+                # the new session is never evicted, even if it exceeds the byte budget alone
+                break
+            session = self._remove(tree_id)
+            self.stats["evictions"] += 1
+            self.stats["evicted_bytes"] += session.n_bytes
+            print(f"Evicted session {tree_id} ({session.n_bytes} bytes).")